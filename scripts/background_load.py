@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Background Load
+Start the dashboard first, then load its data on a worker thread
+
+The visualizer used to connect, fetch every document, aggregate and build all
+figures before the Dash server started, so nothing answered until the slowest
+step was done, and any failure ended the process. With BackgroundLoader the
+server comes up at once with placeholder figures. The load runs on a daemon
+thread and reports into a LoadProgress:
+
+    stage(message)        status line shown above the tabs
+    track(batches, fn)    passes cursor/backup batches through unchanged,
+                          counting records; when a publish is due it calls
+                          fn() for figures of the records read so far
+    publish(figures)      partial figures by component id (e.g. a history
+                          heatmap as soon as its collection is aggregated)
+
+The page polls snapshot(since=<version it has>) with a dcc.Interval and only
+receives the figures published after that version. Partial figures are rebuilt at most every
+PUBLISH_SECONDS. The wait is stretched to at least the previous rebuild's
+duration, so rebuilding never takes more than half of the load's wall time.
+If an attempt raises, the status turns into the error message. retry() then
+starts a fresh attempt on a new thread, without restarting the process.
+
+Flask's debug reloader runs main() twice: once in a watcher process that
+never serves, and once in the serving child. reloader_parent() lets the
+caller start the load only in the child.
+
+Usage:
+    loader = BackgroundLoader(load)       # load(progress) -> (figures, state)
+    loader.start()
+    loader.progress.snapshot()            # {'status': 'loading', 'records': ..., 'figures': {...}}
+    loader.retry()                        # after status == 'failed'
+
+Requirements:
+    (standard library only)
+"""
+
+import os
+import threading
+import time
+import traceback
+
+PUBLISH_SECONDS = 2.0
+DEFAULT_POLL_MS = 1000
+
+
+class LoadError(RuntimeError):
+    """Raised by a dashboard load that cannot produce figures (no connection, no data)"""
+
+
+class LoadProgress:
+    """Thread-safe status, record count and published figures of one load attempt"""
+
+    def __init__(self, interval=PUBLISH_SECONDS, version=0, attempt=1):
+        self.lock = threading.Lock()
+        self.interval = interval
+        self.version = version
+        self.attempt = attempt
+        self.status = 'loading'
+        self.message = 'Starting'
+        self.records = 0
+        self.error = None
+        self.figures = {}
+        self.figure_versions = {}
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.partials = 0
+        self.next_publish = self.started + interval
+
+    def stage(self, message):
+        """Set the status line"""
+        with self.lock:
+            self.message = message
+
+    def add_records(self, count):
+        with self.lock:
+            self.records += count
+
+    def due(self):
+        """True when enough time has passed to rebuild the partial figures"""
+        return time.perf_counter() >= self.next_publish
+
+    def _replace(self, figures):
+        self.version += 1
+        self.figures.update(figures)
+        self.figure_versions.update(dict.fromkeys(figures, self.version))
+
+    def publish(self, figures):
+        """Replace the figures under these component ids and bump the version"""
+        with self.lock:
+            self._replace(figures)
+            self.partials += 1
+
+    def publish_partial(self, build):
+        """publish(build()), then wait at least as long as the build took before the next one"""
+        started = time.perf_counter()
+        figures = build()
+        built = time.perf_counter()
+        self.publish(figures)
+        self.next_publish = built + max(self.interval, built - started)
+
+    def track(self, batches, build=None):
+        """Yield `batches` unchanged; after each is consumed, count it and publish build() when due"""
+        for batch in batches:
+            yield batch
+            self.add_records(len(batch))
+            if build is not None and self.due():
+                self.publish_partial(build)
+
+    def finish(self, figures):
+        """Publish the final figures and mark the load ready"""
+        with self.lock:
+            self._replace(figures)
+            self.status = 'ready'
+            self.seconds = time.perf_counter() - self.started
+
+    def fail(self, error):
+        with self.lock:
+            self.status = 'failed'
+            self.error = f"{type(error).__name__}: {error}" if not isinstance(error, LoadError) else str(error)
+            self.seconds = time.perf_counter() - self.started
+
+    def snapshot(self, since=None):
+        """Copy of the state for one poll; with `since`, only figures published after that version"""
+        with self.lock:
+            return {
+                'status': self.status,
+                'message': self.message,
+                'records': self.records,
+                'error': self.error,
+                'version': self.version,
+                'attempt': self.attempt,
+                'partials': self.partials,
+                'figures': {figure_id: fig for figure_id, fig in self.figures.items()
+                            if since is None or self.figure_versions[figure_id] > since},
+                'seconds': self.seconds if self.seconds is not None else time.perf_counter() - self.started,
+            }
+
+    def describe(self):
+        """One status line, e.g. '⏳ Streaming visitor data · 120,000 records · 4.2s'"""
+        state = self.snapshot()
+        if state['status'] == 'failed':
+            return f"❌ Load failed after {state['seconds']:.1f}s: {state['error']}"
+        if state['status'] == 'ready':
+            return f"✅ Loaded {state['records']:,} records in {state['seconds']:.1f}s"
+        records = f" · {state['records']:,} records" if state['records'] else ""
+        retry = f" (attempt {state['attempt']})" if state['attempt'] > 1 else ""
+        partial = " · showing partial results" if state['partials'] else ""
+        return f"⏳ {state['message']}{records} · {state['seconds']:.1f}s{partial}{retry}"
+
+
+class BackgroundLoader:
+    """Runs load(progress) -> (figures, state) on a daemon thread; retry() after a failure"""
+
+    def __init__(self, load, interval=PUBLISH_SECONDS):
+        self.load = load
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.progress = LoadProgress(interval, attempt=0)
+        self.state = None
+        self.thread = None
+
+    @property
+    def ready(self):
+        return self.progress.status == 'ready'
+
+    def _next_progress(self):
+        previous = self.progress
+        self.progress = LoadProgress(self.interval, version=previous.version + 1, attempt=previous.attempt + 1)
+        return self.progress
+
+    def run(self):
+        """One attempt on the calling thread; returns the state and re-raises the load's exception"""
+        with self.lock:
+            progress = self._next_progress()
+        return self._attempt(progress)
+
+    def _attempt(self, progress):
+        try:
+            figures, state = self.load(progress)
+        except Exception as e:
+            progress.fail(e)
+            raise
+        # The state is in place before the status says ready
+        self.state = state
+        progress.finish(figures)
+        return state
+
+    def _attempt_logged(self, progress):
+        try:
+            self._attempt(progress)
+        except LoadError as e:
+            print(f"❌ {e} (retry from the dashboard)")
+        except Exception:
+            traceback.print_exc()
+            print("❌ Dashboard load failed (retry from the dashboard)")
+
+    def _start_thread(self):
+        # The new progress is visible before the thread runs, so the next poll already sees 'loading'
+        progress = self._next_progress()
+        self.thread = threading.Thread(target=self._attempt_logged, args=(progress,), name='dashboard-load',
+                                       daemon=True)
+        self.thread.start()
+
+    def start(self):
+        """Start the first attempt in the background; False if one was already started"""
+        with self.lock:
+            if self.thread is not None or self.progress.attempt:
+                return False
+            self._start_thread()
+        return True
+
+    def retry(self):
+        """Start a new attempt if the last one failed; False while loading or once ready"""
+        with self.lock:
+            if self.progress.status != 'failed' or (self.thread is not None and self.thread.is_alive()):
+                return False
+            self._start_thread()
+        return True
+
+
+def reloader_parent(debug=True):
+    """True in the watcher process of Flask's debug reloader, which never serves requests"""
+    return debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+
+def add_background_arguments(parser):
+    """Register --preload and --poll-ms on an argparse parser"""
+    parser.add_argument('--preload', action='store_true',
+                        help='Load everything and build the figures before starting the server '
+                             '(exits on failure) instead of loading in the background')
+    parser.add_argument('--poll-ms', type=int, default=DEFAULT_POLL_MS,
+                        help=f'How often the page polls the background load for progress and partial '
+                             f'figures (default: {DEFAULT_POLL_MS})')
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Backup Source
+Stream collections out of Backup_MongoDB .json.gz files for offline analytics
+
+src/utils/backupUtils.js writes `YYYY-MM-DDTHH-MM-SS_<Db>.json.gz`, a gzip of
+
+    {"_metadata": {...}, "collections": {"<name>": [doc, doc, ...], ...}}
+
+This module decompresses the file incrementally and decodes one array element
+at a time, so only the current document (plus a read buffer) is held in
+memory, never the whole multi-hundred-MB JSON. Documents come back the way
+JSON.stringify wrote them: `_id` as a hex string and dates as ISO strings.
+
+iter_backup_blocks() instead cuts a collection's array into raw byte blocks of
+whole documents without decoding them: a NumPy pass over each chunk finds the
+quotes, brackets and commas outside strings (escapes included), so element
+boundaries come from exact nesting depth, not from the pretty-printing. Each
+block decodes with one json.loads(), e.g. in a worker process
+(sharded_aggregation.py).
+
+Note: Backup_MongoDB only exports the collections in COLLECTIONS_TO_BACKUP.
+VisitorTrackingAnalytics/History must be in that list for a backup to carry
+visitor data; missing collections yield no documents and a warning.
+
+Usage:
+    for doc in iter_backup_documents(path, 'VisitorTrackingAnalytics'):
+        ...
+    for name, block in iter_backup_blocks(path, ['VisitorTrackingHistory']):
+        documents = decode_block(block)
+"""
+
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import itemgetter
+import gzip
+import json
+import re
+
+import numpy as np
+
+from history_pipeline import HISTORY_COLLECTIONS, aggregate_history_events
+
+READ_CHUNK_CHARS = 1 << 16
+SCAN_CHUNK_CHARS = 1 << 20
+DEFAULT_BLOCK_BYTES = 4 << 20
+
+BACKUP_FILENAME_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2})_([^.]+)\.json\.gz$')
+
+_WHITESPACE = ' \t\n\r'
+_QUOTE, _BACKSLASH, _COMMA = ord('"'), ord('\\'), ord(',')
+_OPENERS, _CLOSERS = (ord('{'), ord('[')), (ord('}'), ord(']'))
+_PREFIX_SHIFTS = [np.uint64(shift) for shift in (1, 2, 4, 8, 16, 32)]
+_ALL_BITS = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+class BackupFormatError(ValueError):
+    """Raised when a backup file does not have the expected layout"""
+
+
+class _JsonReader:
+    """Minimal pull reader over a text stream for the backup layout"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Append the next chunk; return False at end of input"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(READ_CHUNK_CHARS)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop consumed text so the buffer stays bounded
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character (not consumed), or '' at end"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise BackupFormatError(f"Expected '{char}' but found '{found or 'EOF'}'")
+        self.pos += 1
+
+    def value(self):
+        """Decode one complete JSON value, reading more input as needed"""
+        self.peek()
+        while True:
+            try:
+                result, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number may be cut off at the chunk boundary; make sure it ended
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return result
+
+    def iter_object_keys(self):
+        """Yield the keys of an object; the caller must consume each value"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            separator = self.peek()
+            self.pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise BackupFormatError(f"Expected ',' or '}}' but found '{separator or 'EOF'}'")
+
+    def iter_array(self):
+        """Yield the elements of an array one at a time"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise BackupFormatError(f"Expected ',' or ']' but found '{separator or 'EOF'}'")
+
+    def skip(self):
+        """Consume one value without keeping it (arrays element by element)"""
+        if self.peek() == '[':
+            for _ in self.iter_array():
+                pass
+        else:
+            self.value()
+
+
+class _ArrayScanner:
+    """
+    Element boundaries of one JSON array, found chunk by chunk with NumPy
+    (nothing is decoded): quotes not escaped by an odd backslash run toggle
+    the in-string state (a prefix XOR over bit-packed 64-byte words), and
+    the brackets and commas outside strings give the nesting depth
+    """
+
+    def __init__(self):
+        self.depth = 1            # just inside the array's '['
+        self.in_string = 0
+        self.backslashes = 0      # backslash run at the end of the previous chunk
+
+    def _clear_escaped(self, data, quotes):
+        """Unset quotes preceded by an odd run of backslashes (escapes are rare: positions only)"""
+        carried, self.backslashes = self.backslashes, 0
+        backslashes = np.flatnonzero(data == _BACKSLASH)
+        if not len(backslashes):
+            if carried % 2:
+                quotes[0] = False
+            return
+        breaks = np.flatnonzero(np.diff(backslashes) != 1)
+        starts = np.insert(backslashes[breaks + 1], 0, backslashes[0])
+        ends = np.append(backslashes[breaks], backslashes[-1])
+        runs = ends - starts + 1
+        if starts[0] == 0:
+            runs[0] += carried
+        elif carried % 2:
+            quotes[0] = False
+        if ends[-1] == len(data) - 1:
+            self.backslashes = int(runs[-1])
+            ends, runs = ends[:-1], runs[:-1]
+        quotes[ends[runs % 2 == 1] + 1] = False
+
+    def _string_mask(self, quotes):
+        """True inside strings (between an opening quote and its closing quote)"""
+        bits = np.packbits(quotes, bitorder='little')
+        words = np.concatenate((bits, np.zeros(-len(bits) % 8, dtype=np.uint8))).view('<u8')
+        for shift in _PREFIX_SHIFTS:
+            words ^= words << shift
+        # Quote parity before each word: earlier chunks, then earlier words
+        parity = (words >> np.uint64(63)).astype(np.uint8)
+        before = np.bitwise_xor.accumulate(np.insert(parity[:-1], 0, self.in_string))
+        words ^= np.where(before == 1, _ALL_BITS, np.uint64(0))
+        self.in_string = int(before[-1] ^ parity[-1])
+        return np.unpackbits(words.view(np.uint8), bitorder='little', count=len(quotes)).view(bool)
+
+    def scan(self, chunk):
+        """(offsets of the commas between elements, offset of the closing ']' or None)"""
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        if not len(data):
+            return np.empty(0, dtype=np.int64), None
+        quotes = data == _QUOTE
+        self._clear_escaped(data, quotes)
+        opens = (data == _OPENERS[0]) | (data == _OPENERS[1])
+        closes = (data == _CLOSERS[0]) | (data == _CLOSERS[1])
+        structural = opens | closes | (data == _COMMA)
+        structural &= ~self._string_mask(quotes)
+
+        candidates = np.flatnonzero(structural)
+        delta = opens[candidates].astype(np.int64) - closes[candidates]
+        depth = self.depth + np.cumsum(delta)
+        commas = candidates[(data[candidates] == _COMMA) & (depth == 1)]
+
+        closed = np.flatnonzero(depth == 0)
+        if len(closed):
+            close = int(candidates[closed[0]])
+            return commas[commas < close], close
+        if len(depth):
+            self.depth = int(depth[-1])
+        return commas, None
+
+
+def _iter_array_blocks(reader, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Raw bytes of runs of whole elements of the array at the reader position,
+    about block_bytes each; the reader continues after the array
+    """
+    reader.expect('[')
+    scanner = _ArrayScanner()
+    pending = bytearray()
+    last_comma = None
+    chunk = reader.buffer[reader.pos:]
+    reader.buffer, reader.pos = '', 0
+
+    while True:
+        data = chunk.encode('utf-8')
+        commas, close = scanner.scan(data)
+        offset = len(pending)
+        pending += data
+        if close is not None:
+            block = bytes(pending[:offset + close]).strip()
+            if block:
+                yield block
+            # Hand the rest back to the reader (the cut is at an ASCII ']', so it decodes cleanly)
+            reader.buffer = bytes(pending[offset + close + 1:]).decode('utf-8')
+            return
+        if len(commas):
+            last_comma = offset + int(commas[-1])
+        if last_comma is not None and len(pending) >= block_bytes:
+            yield bytes(pending[:last_comma])
+            del pending[:last_comma + 1]
+            last_comma = None
+        chunk = reader.stream.read(SCAN_CHUNK_CHARS)
+        if not chunk:
+            raise BackupFormatError("Expected ']' but found 'EOF'")
+
+
+def decode_block(block):
+    """Documents of one iter_backup_blocks() block"""
+    return json.loads(b'[' + block + b']')
+
+
+def open_backup(path):
+    """Open a .json.gz (or plain .json) backup as a text stream"""
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def parse_backup_filename(path):
+    """Return (backup datetime UTC, database label) from a backup file name"""
+    match = BACKUP_FILENAME_PATTERN.search(str(path))
+    if not match:
+        return None, None
+    stamp = datetime.strptime(match.group(1), '%Y-%m-%dT%H-%M-%S').replace(tzinfo=timezone.utc)
+    return stamp, match.group(2)
+
+
+def iter_backup_collections(path, names):
+    """
+    Yield (collection_name, document) for the requested collections, in file
+    order, in a single pass over the backup. Other collections are skipped.
+    """
+    wanted = set(names)
+    found = set()
+
+    with open_backup(path) as stream:
+        reader = _JsonReader(stream)
+        for key in reader.iter_object_keys():
+            if key != 'collections':
+                reader.skip()
+                continue
+            for name in reader.iter_object_keys():
+                if name not in wanted:
+                    reader.skip()
+                    continue
+                found.add(name)
+                for document in reader.iter_array():
+                    yield name, document
+
+    for name in sorted(wanted - found):
+        print(f"⚠️  {name} not present in backup {path}")
+
+
+def iter_backup_documents(path, name):
+    """Yield the documents of one collection from a backup file"""
+    for _, document in iter_backup_collections(path, [name]):
+        yield document
+
+
+def iter_backup_blocks(path, names, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Yield (collection_name, raw block) for the requested collections in one
+    pass; decode_block() turns a block into its documents. Other collections'
+    arrays are stepped over without decoding them.
+    """
+    wanted = set(names)
+    found = set()
+
+    with open_backup(path) as stream:
+        reader = _JsonReader(stream)
+        for key in reader.iter_object_keys():
+            if key != 'collections':
+                reader.skip()
+                continue
+            for name in reader.iter_object_keys():
+                if reader.peek() != '[':
+                    reader.skip()
+                    continue
+                if name in wanted:
+                    found.add(name)
+                for block in _iter_array_blocks(reader, block_bytes):
+                    if name in wanted:
+                        yield name, block
+
+    for name in sorted(wanted - found):
+        print(f"⚠️  {name} not present in backup {path}")
+
+
+def fetch_backup_history_heatmaps(path, time_type='local', since=None, until=None,
+                                  include_visitors=True, include_logins=False):
+    """
+    Offline counterpart of history_pipeline.fetch_history_heatmaps(): streams
+    the selected collections out of the backup in one pass, same return shape.
+    """
+    selected = []
+    if include_visitors:
+        selected.append(HISTORY_COLLECTIONS['visitors'])
+    if include_logins:
+        selected.append(HISTORY_COLLECTIONS['logins'])
+
+    dow = np.zeros((7, 24), dtype=np.int64)
+    dom = np.zeros((31, 24), dtype=np.int64)
+    sources = {name: 0 for name in selected}
+
+    # Each collection is one contiguous array, so the single pass groups into one run per collection
+    for name, run in groupby(iter_backup_collections(path, selected), key=itemgetter(0)):
+        part_dow, part_dom, events = aggregate_history_events(
+            (document for _, document in run), time_type, since, until
+        )
+        dow += part_dow
+        dom += part_dom
+        sources[name] += events
+
+    return {'dow': dow, 'dom': dom, 'sources': sources}
+
+
+def read_backup_metadata(path):
+    """Return the `_metadata` block (stops reading once it has been decoded)"""
+    with open_backup(path) as stream:
+        reader = _JsonReader(stream)
+        for key in reader.iter_object_keys():
+            if key == '_metadata':
+                return reader.value()
+            reader.skip()
+    return {}
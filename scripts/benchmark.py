@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Benchmark
+Wall time and peak memory of the visualizer pipeline stages on synthetic data
+
+Each stage runs on inputs generated by synthetic_data.py at every requested
+scale, fully offline (no MongoDB, no endpoint):
+
+    prepare_map_data        VisitorTrackingAnalytics docs -> map points frame
+    prepare_heatmap_data    VisitorTrackingAnalytics docs -> 7x24 heatmap frame
+    build_columns           VisitorTrackingAnalytics docs -> compact VisitorCache columns, batch by batch
+    prepare_map_columns     VisitorCache columns -> map points frame (the default fetch path)
+    prepare_heatmap_columns VisitorCache columns -> 7x24 heatmap frame
+    create_map_figure       map points frame -> deduped/binned Scattermapbox figure
+    create_heatmap_figure   heatmap frame -> plotly Heatmap figure
+    create_heatmap_matrix   endpoint payload -> 7x24 matrix (visualize_heatmap.py)
+    history_backup          history backup file -> 7x24 / 31x24 heatmaps, one process (--engine=pipeline --backup)
+    sharded_backup_<N>w     the same on N worker processes (sharded_aggregation.py), one stage per
+                            --shard-workers count
+
+Wall time is the best of --repeat runs. Peak memory is measured in a separate
+run under tracemalloc (it slows allocation-heavy code, so it never overlaps
+the timed runs) and covers what the stage allocates on top of its input.
+Inputs are built once per scale outside the measurement; the endpoint payload
+is built from min(scale, 1M) synthetic events since its shape does not grow.
+
+Results are compared with a stored baseline (benchmark_baseline.json, local
+state: a baseline only means something on the machine that recorded it). A
+stage regresses when it is more than --tolerance slower or larger than the
+baseline and the difference is above the noise floor (5 ms / 1 MB).
+
+Each scale also reports memory per visitor: the documents as Python dicts
+(deep size of a sample) against the compact columns the visualizers now
+fetch into (VisitorCache.nbytes()); --json records both.
+
+The history stages read a synthetic backup of `scale` history events,
+written once per scale to a temporary directory. Each scale reports the
+sharded speedup over history_backup and the CPU count; tracemalloc only sees
+the main process, so their peak memory excludes the workers.
+
+Scales up to 10M work, but the document stages need the plain list of
+documents in memory: budget roughly 3 GB of RAM per million visitor
+documents, and about a minute per million to generate them.
+
+Usage:
+    python benchmark.py                                  # 10k and 100k, compare with the baseline
+    python benchmark.py --scales 10k,100k,1M --save-baseline
+    python benchmark.py --stages prepare_map_data,create_map_figure --repeat 5
+    python benchmark.py --json results.json              # also write the raw results
+    python benchmark.py --stages history_backup,sharded_backup_4w --shard-workers 4 --scales 1M
+
+Requirements:
+    pip install numpy pandas plotly
+"""
+
+from contextlib import redirect_stdout
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from synthetic_data import DEFAULT_SEED, parse_count, synthetic_heatmap_payload, synthetic_visitor_analytics
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPTS_DIR)
+
+DEFAULT_SCALES = '10k,100k'
+DEFAULT_REPEAT = 3
+DEFAULT_SHARD_WORKERS = '1,2,4'
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_BASELINE_PATH = os.path.join(SCRIPTS_DIR, 'benchmark_baseline.json')
+PAYLOAD_EVENTS_CAP = 1000000
+SIZE_SAMPLE = 1000
+NOISE_SECONDS = 0.005
+NOISE_MB = 1.0
+MB = 1024 * 1024
+
+
+def build_inputs(scale, seed=DEFAULT_SEED, history=False):
+    """Synthetic stage inputs for one scale (built once, outside the measurements)"""
+    import visitor_analytics_visualizer as visualizer
+
+    records = list(synthetic_visitor_analytics(scale, seed))
+    store = build_columns(records)
+    with redirect_stdout(io.StringIO()):
+        map_df = visualizer.prepare_map_data(store)
+        heatmap_df = visualizer.prepare_heatmap_data(store)
+    payload = synthetic_heatmap_payload(min(scale, PAYLOAD_EVENTS_CAP), seed)
+    inputs = {'records': records, 'store': store, 'map_df': map_df, 'heatmap_df': heatmap_df, 'payload': payload}
+    if history:
+        inputs['backup'] = build_history_backup(scale, seed)
+    return inputs
+
+
+def build_history_backup(scale, seed=DEFAULT_SEED):
+    """Synthetic backup of `scale` history events in a temporary directory (remove_inputs() deletes it)"""
+    from synthetic_data import synthetic_visitor_history, write_synthetic_backup
+
+    path = os.path.join(tempfile.mkdtemp(prefix='benchmark-'), 'history.json.gz')
+    write_synthetic_backup(path, {'VisitorTrackingHistory': synthetic_visitor_history(scale, seed)})
+    return path
+
+
+def remove_inputs(inputs):
+    if 'backup' in inputs:
+        shutil.rmtree(os.path.dirname(inputs['backup']), ignore_errors=True)
+
+
+def build_columns(records):
+    """VisitorCache columns built one cursor-sized batch at a time, as fetch_visitor_columns() does"""
+    from visitor_cache import load_visitor_columns
+    from visitor_ingest import DEFAULT_BATCH_SIZE, iter_batches
+
+    return load_visitor_columns(iter_batches(records, DEFAULT_BATCH_SIZE))
+
+
+def deep_sizeof(value):
+    """Bytes held by a document: the containers plus every key and value in them"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_sizeof(item) for item in value)
+    return size
+
+
+def bytes_per_visitor(inputs):
+    """{'documents': dict bytes per visitor (sampled), 'columns': VisitorCache bytes per visitor}"""
+    records, store = inputs['records'], inputs['store']
+    if not records:
+        return {'documents': None, 'columns': None}
+    step = max(1, len(records) // SIZE_SAMPLE)
+    sample = records[::step]
+    # The list itself holds one pointer per document
+    documents = sum(deep_sizeof(record) for record in sample) / len(sample) + 8
+    return {'documents': round(documents, 1), 'columns': round(store.nbytes() / len(store), 1)}
+
+
+def sharded_stage(workers):
+    return f'sharded_backup_{workers}w'
+
+
+def stage_functions(shard_workers=(1,)):
+    """{stage name: fn(inputs)}, in pipeline order"""
+    import visitor_analytics_visualizer as visualizer
+    from backup_source import fetch_backup_history_heatmaps
+    from sharded_aggregation import fetch_sharded_heatmaps
+    from visitor_figures import create_heatmap_figure, create_map_figure
+
+    sys.path.insert(0, ROOT_DIR)
+    from visualize_heatmap import create_heatmap_matrix
+
+    return {
+        'prepare_map_data': lambda inputs: visualizer.prepare_map_data(inputs['records']),
+        'prepare_heatmap_data': lambda inputs: visualizer.prepare_heatmap_data(inputs['records']),
+        'build_columns': lambda inputs: build_columns(inputs['records']),
+        'prepare_map_columns': lambda inputs: visualizer.prepare_map_data(inputs['store']),
+        'prepare_heatmap_columns': lambda inputs: visualizer.prepare_heatmap_data(inputs['store']),
+        'create_map_figure': lambda inputs: create_map_figure(inputs['map_df']),
+        'create_heatmap_figure': lambda inputs: create_heatmap_figure(inputs['heatmap_df']),
+        'create_heatmap_matrix': lambda inputs: create_heatmap_matrix(inputs['payload']['heatmap']),
+        'history_backup': lambda inputs: fetch_backup_history_heatmaps(inputs['backup']),
+        **{sharded_stage(workers): lambda inputs, workers=workers: fetch_sharded_heatmaps(
+            backup_path=inputs['backup'], workers=workers) for workers in shard_workers},
+    }
+
+
+def measure(fn, inputs, repeat=DEFAULT_REPEAT):
+    """(best wall seconds over `repeat` runs, tracemalloc peak MB of one more run)"""
+    best = None
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            gc.collect()
+            started = time.perf_counter()
+            fn(inputs)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn(inputs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return best, peak / MB
+
+
+def result_key(stage, scale):
+    return f'{stage}@{scale}'
+
+
+def load_baseline(path):
+    """Stored results keyed by stage@scale, or {} when there is no baseline yet"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('results', {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    """Write results plus enough context to tell which machine recorded them"""
+    document = {
+        'createdAt': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def compare(value, baseline, tolerance, noise):
+    """(change text, regressed?) of one metric against its baseline value"""
+    if baseline is None:
+        return 'new', False
+    change = (value - baseline) / baseline if baseline else 0.0
+    regressed = value > baseline * (1 + tolerance) and value - baseline > noise
+    return f'{change:+.0%}', regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the visualizer pipeline stages on synthetic data')
+    parser.add_argument('--scales', type=str, default=DEFAULT_SCALES,
+                        help=f'Comma-separated record counts, e.g. 10k,100k,1M,10M (default: {DEFAULT_SCALES})')
+    parser.add_argument('--stages', type=str, help='Comma-separated stages to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f'Timed runs per stage; the fastest counts (default: {DEFAULT_REPEAT})')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help=f'Random seed (default: {DEFAULT_SEED})')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE_PATH,
+                        help='Baseline file (default: scripts/benchmark_baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store these results as the baseline (merged into the existing one)')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Allowed slowdown / growth before a stage counts as regressed '
+                             f'(default: {DEFAULT_TOLERANCE:.0%}%)')
+    parser.add_argument('--shard-workers', type=str, default=DEFAULT_SHARD_WORKERS,
+                        help=f'Worker counts for the sharded_backup_<N>w stages (default: {DEFAULT_SHARD_WORKERS})')
+    parser.add_argument('--json', type=str, help='Also write the raw results to this file')
+    args = parser.parse_args()
+
+    try:
+        scales = [parse_count(scale) for scale in args.scales.split(',')]
+        shard_workers = [int(workers) for workers in args.shard_workers.split(',')]
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+    stages = stage_functions(shard_workers)
+    selected = args.stages.split(',') if args.stages else list(stages)
+    unknown = sorted(set(selected) - set(stages))
+    if unknown:
+        parser.error(f"Unknown stage(s) {', '.join(unknown)}; choose from: {', '.join(stages)}")
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    regressions = 0
+
+    print(f"{'stage':<24} {'scale':>10} {'seconds':>9} {'vs base':>8} {'peak MB':>9} {'vs base':>8}  result")
+    for scale in scales:
+        started = time.perf_counter()
+        history = any(stage == 'history_backup' or stage.startswith('sharded_backup_') for stage in selected)
+        inputs = build_inputs(scale, args.seed, history=history)
+        print(f"{'(generate inputs)':<24} {scale:>10,} {time.perf_counter() - started:>9.3f}")
+        sizes = bytes_per_visitor(inputs)
+        results[result_key('bytes_per_visitor', scale)] = sizes
+        if sizes['columns'] is not None:
+            print(f"{'(bytes per visitor)':<24} {scale:>10,}   documents {sizes['documents']:,.0f}, "
+                  f"columns {sizes['columns']:,.0f} ({sizes['documents'] / sizes['columns']:.1f}x smaller)")
+
+        for stage in selected:
+            seconds, peak_mb = measure(stages[stage], inputs, args.repeat)
+            key = result_key(stage, scale)
+            results[key] = {'seconds': round(seconds, 6), 'peak_mb': round(peak_mb, 3)}
+
+            previous = baseline.get(key, {})
+            time_change, slower = compare(seconds, previous.get('seconds'), args.tolerance, NOISE_SECONDS)
+            memory_change, larger = compare(peak_mb, previous.get('peak_mb'), args.tolerance, NOISE_MB)
+            regressions += slower or larger
+            if slower or larger:
+                note = '❌ ' + ' and '.join(text for text, hit in (('slower', slower), ('larger', larger)) if hit)
+            else:
+                note = '✅' if previous else '·'
+            print(f"{stage:<24} {scale:>10,} {seconds:>9.3f} {time_change:>8} {peak_mb:>9.1f} {memory_change:>8}  {note}")
+
+        speedups = {f'{workers}w': results[result_key('history_backup', scale)]['seconds']
+                    / results[result_key(sharded_stage(workers), scale)]['seconds']
+                    for workers in shard_workers
+                    if {'history_backup', sharded_stage(workers)} <= set(selected)}
+        if speedups:
+            results[result_key('sharded_speedup', scale)] = {key: round(value, 2) for key, value in speedups.items()}
+            print(f"{'(sharded speedup)':<24} {scale:>10,}   "
+                  + ', '.join(f"{key} {value:.1f}x" for key, value in speedups.items())
+                  + f" vs history_backup on {os.cpu_count()} CPU(s)")
+
+        remove_inputs(inputs)
+        del inputs
+        gc.collect()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        save_baseline(args.baseline, {**baseline, **results})
+        print(f"\n💾 Baseline saved to {args.baseline}")
+    elif not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+
+    if regressions:
+        print(f"\n❌ {regressions} stage(s) regressed beyond {args.tolerance:.0%}")
+    return 1 if regressions and not args.save_baseline else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Collection Loader
+Concurrent loading of the visitor and login analytics / history collections
+over one MongoClient
+
+The endpoint (Analytics_VisitorHeatmap.js) merges visitors and logins; the
+visualizers need up to four collections for the same picture:
+
+    VisitorTrackingAnalytics   map points + visitsBy* heatmap counters
+    UserLoginAnalytics         loginsBy* heatmap counters
+    VisitorTrackingHistory     exact 7x24 / 31x24 heatmaps (server-side $group)
+    UserLoginHistory           exact 7x24 / 31x24 heatmaps (server-side $group)
+
+Each load mostly waits on MongoDB (cursor round trips, server-side
+aggregation), so ParallelLoader runs them on a thread pool and the total
+approaches the slowest collection instead of the sum. PyMongo's MongoClient
+is thread-safe: every worker checks sockets out of the one client's
+connection pool instead of connecting per collection. Each collection is read
+with its own projection (VISITOR_PROJECTION, LOGIN_PROJECTION; the history
+aggregations only return grouped rows).
+
+Per-source matrices are merged like the endpoint's mergeMatrices(): cell-wise
+sum, rounded half up (heatmap_builder.merge_matrices).
+
+Usage:
+    python collection_loader.py                      # all four, concurrently
+    python collection_loader.py --range 3M --time-type zulu
+    python collection_loader.py --workers 1          # one after another, for comparison
+
+Requirements:
+    pip install pymongo numpy pandas
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import argparse
+import os
+import sys
+import time
+
+from heatmap_builder import DAYS_ORDER, merge_matrices
+from history_pipeline import HISTORY_COLLECTIONS, parse_range, parse_timestamp, run_heatmap_pipeline
+from visitor_ingest import (
+    DEFAULT_BATCH_SIZE,
+    HeatmapAccumulator,
+    iter_batches,
+    iter_visitor_batches,
+    stream_visitor_data,
+)
+
+DATABASE_NAME = 'TangoTiempoProd'
+ANALYTICS_COLLECTIONS = {
+    'visitors': 'VisitorTrackingAnalytics',
+    'logins': 'UserLoginAnalytics',
+}
+DEFAULT_LOAD_WORKERS = 4
+
+# Only the counters the login heatmap reads
+LOGIN_PROJECTION = {
+    'totalLogins': 1,
+    'loginsByDayOfWeekLocal': 1,
+    'loginsByDayOfWeekZulu': 1,
+    'loginsByHourLocal': 1,
+    'loginsByHourZulu': 1,
+}
+
+
+class ParallelLoader:
+    """Named loads on a thread pool, each timed; workers=1 runs them inline at submit()"""
+
+    def __init__(self, workers=DEFAULT_LOAD_WORKERS):
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='load') \
+            if self.workers > 1 else None
+        self.futures = {}
+        self.seconds = {}
+        self.started = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.futures
+
+    def _timed(self, name, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.seconds[name] = time.perf_counter() - started
+
+    def submit(self, name, fn, *args, **kwargs):
+        """Start fn(*args, **kwargs) as load `name`; returns its Future"""
+        if self.executor is not None:
+            future = self.executor.submit(self._timed, name, fn, *args, **kwargs)
+        else:
+            future = Future()
+            try:
+                future.set_result(self._timed(name, fn, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        self.futures[name] = future
+        return future
+
+    def result(self, name):
+        """Wait for load `name` and return its value (re-raises its exception)"""
+        return self.futures[name].result()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def print_summary(self):
+        """Per-load seconds, and the wall time against their sum"""
+        wall = time.perf_counter() - self.started
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            print(f"   - {name:<26} {seconds:>7.2f}s")
+        print(f"   {len(self.seconds)} loads in {wall:.2f}s wall vs {sum(self.seconds.values()):.2f}s summed "
+              f"({self.workers} worker{'s' if self.workers > 1 else ''})")
+
+
+def add_loader_arguments(parser):
+    """Register --load-workers on an argparse parser"""
+    parser.add_argument('--load-workers', type=int, default=DEFAULT_LOAD_WORKERS,
+                        help='Collections loaded concurrently with the visitor analytics '
+                             f'(default: {DEFAULT_LOAD_WORKERS}; 1 = one after another)')
+
+
+def load_login_heatmap(db=None, batch_size=DEFAULT_BATCH_SIZE, backup_path=None):
+    """24x7 login heatmap matrix and record count from UserLoginAnalytics counters"""
+    name = ANALYTICS_COLLECTIONS['logins']
+    if backup_path:
+        from backup_source import iter_backup_documents
+
+        batches = iter_batches(iter_backup_documents(backup_path, name), batch_size)
+    else:
+        batches = iter_visitor_batches(db[name], batch_size, projection=LOGIN_PROJECTION)
+
+    accumulator = HeatmapAccumulator()
+    for batch in batches:
+        accumulator.add_batch(batch)
+    return accumulator.matrix, accumulator.records
+
+
+def submit_collection_loads(loader, db, time_type='local', since=None, until=None,
+                            batch_size=DEFAULT_BATCH_SIZE):
+    """Queue all four collections on `loader`, keyed by collection name"""
+    loader.submit(ANALYTICS_COLLECTIONS['visitors'], stream_visitor_data,
+                  db[ANALYTICS_COLLECTIONS['visitors']], batch_size)
+    loader.submit(ANALYTICS_COLLECTIONS['logins'], load_login_heatmap, db, batch_size)
+    for name in HISTORY_COLLECTIONS.values():
+        loader.submit(name, run_heatmap_pipeline, db[name], time_type, since, until)
+
+
+def merged_collection_heatmaps(loader):
+    """
+    Endpoint-style merges of the loads queued by submit_collection_loads():
+    {'analytics': 24x7 visitors + logins, 'dow': 7x24, 'dom': 31x24, 'counts': {collection: n}}
+    """
+    map_acc, visitor_acc, visitor_count = loader.result(ANALYTICS_COLLECTIONS['visitors'])
+    login_matrix, login_count = loader.result(ANALYTICS_COLLECTIONS['logins'])
+    history = {name: loader.result(name) for name in HISTORY_COLLECTIONS.values()}
+
+    return {
+        'analytics': merge_matrices(visitor_acc.matrix, login_matrix),
+        'dow': merge_matrices(*(dow for dow, _, _ in history.values())),
+        'dom': merge_matrices(*(dom for _, dom, _ in history.values())),
+        'counts': {
+            ANALYTICS_COLLECTIONS['visitors']: visitor_count,
+            ANALYTICS_COLLECTIONS['logins']: login_count,
+            **{name: events for name, (_, _, events) in history.items()},
+        },
+        'map_points': len(map_acc),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load the analytics and history collections concurrently')
+    parser.add_argument('--workers', type=int, default=DEFAULT_LOAD_WORKERS,
+                        help=f'Concurrent collection loads (default: {DEFAULT_LOAD_WORKERS}; 1 = sequential)')
+    parser.add_argument('--time-type', choices=['local', 'zulu'], default='local',
+                        help='Time type for the history heatmaps (default: local)')
+    parser.add_argument('--range', default='All', help='History range, e.g. 7D, 3M, 1Yr, All (default: All)')
+    parser.add_argument('--since', type=parse_timestamp, help='ISO start (inclusive); overrides --range')
+    parser.add_argument('--until', type=parse_timestamp, help='ISO end (exclusive)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Cursor batch size for the analytics collections (default: {DEFAULT_BATCH_SIZE})')
+    args = parser.parse_args()
+
+    mongodb_uri = os.getenv('MONGODB_URI_PROD')
+    if not mongodb_uri:
+        print("ERROR: MONGODB_URI_PROD environment variable not set")
+        return 1
+
+    from pymongo import MongoClient
+
+    since = args.since if args.since is not None else parse_range(args.range)
+    # One client, one connection pool, shared by every worker thread
+    client = MongoClient(mongodb_uri, maxPoolSize=max(args.workers, 1) * 2)
+    try:
+        db = client[DATABASE_NAME]
+        print(f"📊 Loading {len(ANALYTICS_COLLECTIONS) + len(HISTORY_COLLECTIONS)} collections "
+              f"({args.workers} worker{'s' if args.workers > 1 else ''})...")
+        with ParallelLoader(args.workers) as loader:
+            submit_collection_loads(loader, db, args.time_type, since, args.until, args.batch_size)
+            merged = merged_collection_heatmaps(loader)
+            loader.print_summary()
+    finally:
+        client.close()
+
+    print("\n✅ Merged heatmaps (visitors + logins)")
+    for name, count in merged['counts'].items():
+        print(f"   - {name}: {count:,}")
+    analytics, dow = merged['analytics'], merged['dow']
+    hour, day = divmod(int(analytics.argmax()), 7)
+    print(f"   Analytics counters: {analytics.sum():,.0f} visits, peak {DAYS_ORDER[day]} {hour:02d}:00")
+    day, hour = divmod(int(dow.argmax()), 24)
+    print(f"   History events ({args.time_type}): {dow.sum():,.0f} in 7x24, "
+          f"{merged['dom'].sum():,.0f} in 31x24, peak {DAYS_ORDER[day]} {hour:02d}:00")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Dashboard Filters
+Filtered views of the visitor columns for the Dash dashboard, memoized in an LRU
+
+Filters:
+    time range   visitors whose lastVisitAt falls inside the range (24H ... 1YR, All);
+                 their counters are still lifetime totals
+    time type    heatmap counters: auto (Local, else Zulu), local or zulu
+    geo source   map points from the selected APIs; the heatmap counts the
+                 visitors that have a point from one of them
+    country      ipinfo_country (empty selection = all)
+
+Every intermediate result (row selection, heatmap matrix, map frame, spatial
+index, geo rollup) and every finished figure is stored in a FigureCache keyed on the
+normalized filter values. The cache evicts least-recently-used entries once
+their approximate size passes a byte budget, and counts hits and misses, so
+going back to an earlier filter combination is a dictionary lookup. Dash runs
+callbacks on concurrent threads: the cache is locked, and threads that miss
+the same key wait for one computation instead of each running it.
+
+Requirements:
+    pip install numpy pandas
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timezone
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from geo_rollup import GeoRollup
+from heatmap_builder import heatmap_from_vectors, heatmap_to_frame
+from history_pipeline import parse_range
+from visitor_cache import SOURCE_COORDINATES
+
+TIME_RANGES = ['All', '24H', '7D', '1M', '3M', '6M', '1YR']
+TIME_TYPES = ['auto', 'local', 'zulu']
+DEFAULT_FIGURE_CACHE_MB = 256
+MB = 1024 * 1024
+
+
+def estimate_nbytes(value):
+    """Approximate memory of a cached value (arrays, frames, indexes, figures)"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if callable(getattr(value, 'nbytes', None)):
+        return value.nbytes()
+    if hasattr(value, 'to_json'):
+        # Plotly figure: its serialized size is what Dash ships and keeps around
+        return len(value.to_json())
+    return sys.getsizeof(value)
+
+
+class FigureCache:
+    """Thread-safe least-recently-used cache bounded by the approximate size of its entries"""
+
+    def __init__(self, max_bytes=DEFAULT_FIGURE_CACHE_MB * MB):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (value, nbytes)
+        self.pending = {}             # key -> Future of a computation in progress
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, compute, sizeof=estimate_nbytes):
+        """
+        Return the cached value for `key`, computing and storing it on a miss.
+        compute() runs outside the lock (it may look up other keys); a thread
+        that misses a key another thread is computing waits for that result.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            pending = self.pending.get(key)
+            if pending is None:
+                self.misses += 1
+                future = self.pending[key] = Future()
+            else:
+                # Served by the other thread's computation
+                self.hits += 1
+        if pending is not None:
+            return pending.result()
+
+        try:
+            value = compute()
+            size = sizeof(value)
+        except BaseException as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.pending[key]
+            # Larger than the whole budget: hand it back without caching
+            if size <= self.max_bytes:
+                self._store(key, value, size)
+        future.set_result(value)
+        return value
+
+    def _store(self, key, value, size):
+        """Insert under the lock, replacing an older entry, then evict down to the budget"""
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self.entries:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def describe(self):
+        stats = self.stats()
+        return (f"Figure cache: {stats['hits']} hits · {stats['misses']} misses · {stats['evictions']} evicted · "
+                f"{stats['entries']} entries · {stats['bytes'] / MB:.1f}/{stats['max_bytes'] / MB:.0f} MB")
+
+
+def filter_key(time_range='All', time_type='auto', sources=None, countries=None):
+    """Normalized, hashable filter values (selection order does not matter)"""
+    return (
+        (time_range or 'All').upper(),
+        time_type or 'auto',
+        tuple(sorted(sources or [])),
+        tuple(sorted(countries or [])),
+    )
+
+
+class DashboardFilters:
+    """Filtered views over a VisitorCache column store, memoized in a FigureCache"""
+
+    def __init__(self, store, figure_cache=None, now=None):
+        self.store = store
+        self.cache = figure_cache or FigureCache()
+        self.now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        self._geo = None
+
+    def source_options(self):
+        return list(SOURCE_COORDINATES)
+
+    def country_options(self):
+        """Countries ordered by visitor count"""
+        counts = pd.Series(np.asarray(self.store.columns['country'])).replace('', 'Unknown').value_counts()
+        return counts.index.tolist()
+
+    def _has_source(self, sources):
+        has_point = np.zeros(len(self.store), dtype=bool)
+        for source in sources:
+            lat_column, long_column = SOURCE_COORDINATES[source]
+            lat = np.asarray(self.store.columns[lat_column])
+            long = np.asarray(self.store.columns[long_column])
+            has_point |= ~np.isnan(lat) & ~np.isnan(long) & (lat != 0) & (long != 0)
+        return has_point
+
+    def _compute_rows(self, time_range, sources, countries):
+        keep = np.ones(len(self.store), dtype=bool)
+
+        cutoff = parse_range(time_range, self.now)
+        if cutoff is not None:
+            last_visit = np.asarray(self.store.columns['last_visit'])
+            keep &= ~np.isnat(last_visit) & (last_visit >= np.datetime64(cutoff, 's'))
+        if sources:
+            keep &= self._has_source(sources)
+        if countries:
+            country = np.asarray(self.store.columns['country'])
+            keep &= np.isin(np.where(country == '', 'Unknown', country), list(countries))
+
+        return np.flatnonzero(keep)
+
+    def rows(self, key):
+        """Indices of the visitors matching a filter_key() (time type ignored)"""
+        time_range, _, sources, countries = key
+        return self.cache.get(('rows', time_range, sources, countries),
+                              lambda: self._compute_rows(time_range, sources, countries))
+
+    def subset(self, key):
+        """VisitorCache restricted to the filtered visitors (not cached; cheap to rebuild)"""
+        return self.store.subset(self.rows(key))
+
+    def heatmap_frame(self, key):
+        """24x7 heatmap DataFrame for the filtered visitors"""
+        def compute():
+            time_type = None if key[1] == 'auto' else key[1]
+            return heatmap_to_frame(heatmap_from_vectors(*self.subset(key).visit_vectors(time_type)))
+        return self.cache.get(('heatmap', key), compute)
+
+    def map_frame(self, key):
+        """prepare_map_data()-shaped frame limited to the selected sources"""
+        def compute():
+            df = self.subset(key).map_frame()
+            sources = key[2]
+            return df[df['source'].isin(sources)].reset_index(drop=True) if sources else df
+        # Map points do not depend on the time type
+        return self.cache.get(('map', key[0], key[2], key[3]), compute)
+
+    def geo_codes(self):
+        """Dictionary-encoded country/region/city columns, built on first use"""
+        if self._geo is None:
+            self._geo = GeoRollup.from_store(self.store)
+        return self._geo
+
+    def geo_rollup(self, key, level='country'):
+        """Visitor / visit totals per country, region or city for the filtered visitors"""
+        # Like the map, totals do not depend on the time type
+        return self.cache.get(('geo', level, key[0], key[2], key[3]),
+                              lambda: self.geo_codes().rollup(level, self.rows(key)))
+
+    def prime(self, map_df=None, heatmap_df=None):
+        """Seed the unfiltered entries with frames the caller already built"""
+        key = filter_key()
+        if map_df is not None:
+            self.cache.get(('map', key[0], key[2], key[3]), lambda: map_df)
+        if heatmap_df is not None:
+            self.cache.get(('heatmap', key), lambda: heatmap_df)
+
+    def memoize(self, kind, key, compute):
+        """Cache any derived value (figures, indexes) under (kind, filter key)"""
+        return self.cache.get((kind, key), compute)
+
+
+def add_filter_arguments(parser):
+    """Register dashboard filter options on an argparse parser"""
+    parser.add_argument('--figure-cache-mb', type=int, default=DEFAULT_FIGURE_CACHE_MB,
+                        help=f'Memory budget for memoized filtered figures (default: {DEFAULT_FIGURE_CACHE_MB} MB)')
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Figure Payload
+Smaller Dash figure payloads: typed-array encoding, compressed responses and
+per-figure byte reports
+
+Dash ships every figure to the browser as JSON. Plain plotly JSON writes
+numeric arrays as decimal lists (lat/long with 15+ digits each), so a few
+thousand map markers cost hundreds of KB before any hover text. In compact
+mode:
+
+    typed arrays    1-D numeric trace arrays are sent as plotly.js typed-array
+                    specs ({"dtype": "f4", "bdata": <base64>}, plotly.js >= 2.28):
+                    lat/lon and marker sizes as float32 (about 1 m at the
+                    equator), integers in the smallest type that holds them
+    compression     JSON / HTML / JS responses are gzip-compressed (brotli when
+                    the `brotli` package is installed and the browser accepts it)
+    JSON encoder    plotly's encoder, which uses orjson when it is installed
+
+dcc.Graph can only decode typed arrays from plotly.js 2.28 on. requirements.txt
+asks for releases that load a newer one (Dash 3+ serves plotly.py's copy,
+Dash 2 bundled its own); figure_encoder() still checks the version it finds
+and falls back to --plain-payload when it is older or cannot be read.
+
+Hover text is already built in the browser from `customdata` and a
+`hovertemplate` (see map_aggregation.map_hover_customdata), and the heatmaps
+label cells with texttemplate='%{z}' instead of a duplicate text matrix.
+
+report_payloads() prints, per figure, the plain JSON size, the compact size
+and the compressed size the browser actually downloads.
+
+Usage:
+    encode = figure_encoder(args)                 # compact_figure, or identity with --plain-payload
+    dcc.Graph(figure=encode(fig))
+    enable_compression(app.server)
+    report_payloads({'map': map_fig, 'heatmap': heatmap_fig})
+
+Requirements:
+    pip install numpy plotly flask
+    pip install brotli orjson   # optional
+"""
+
+import base64
+import glob
+import gzip
+import json
+import os
+import re
+
+import numpy as np
+
+# Numeric trace attributes sent as float32: screen-precision geometry
+FLOAT32_PATHS = {'lat', 'lon', 'marker.size'}
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'application/javascript', 'text/javascript', 'text/css')
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+KB = 1024
+# First plotly.js release that decodes {"dtype", "bdata"} typed-array specs
+MIN_TYPED_ARRAY_PLOTLYJS = (2, 28)
+PLOTLYJS_VERSION_PATTERN = re.compile(r'plotly\.js v(\d+)\.(\d+)')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def add_payload_arguments(parser):
+    """Register --plain-payload on an argparse parser"""
+    parser.add_argument('--plain-payload', action='store_true',
+                        help='Send figures as plain JSON lists without response compression '
+                             '(default: typed arrays + gzip/brotli)')
+
+
+def _int_dtype(values):
+    """Smallest plotly.js integer dtype holding every value"""
+    low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+    for code, dtype in (('u1', np.uint8), ('i1', np.int8), ('u2', np.uint16), ('i2', np.int16),
+                        ('u4', np.uint32), ('i4', np.int32)):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return code, dtype
+    return None, None
+
+
+def typed_array(values, path=''):
+    """plotly.js typed-array spec for a 1-D numeric array, or None when it should stay a list"""
+    array = np.asarray(values)
+    if array.ndim != 1 or array.dtype.kind not in 'iufb':
+        return None
+    if array.dtype.kind == 'f':
+        if path in FLOAT32_PATHS:
+            code, array = 'f4', array.astype('<f4')
+        else:
+            code, array = 'f8', array.astype('<f8')
+    else:
+        code, dtype = _int_dtype(array)
+        if code is None:
+            # Beyond int32: plotly.js has no int64 typed array
+            code, array = 'f8', array.astype('<f8')
+        else:
+            array = array.astype(np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': code, 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def _encode_arrays(node, path=''):
+    """Copy of a plotly JSON tree with 1-D numeric arrays replaced by typed-array specs"""
+    if isinstance(node, dict):
+        return {key: _encode_arrays(value, f'{path}.{key}' if path else key) for key, value in node.items()}
+    if isinstance(node, (np.ndarray, list, tuple)) and len(node) and not isinstance(node, str):
+        if isinstance(node, np.ndarray) or all(isinstance(item, (int, float)) and not isinstance(item, bool)
+                                               for item in node):
+            spec = typed_array(node, path)
+            if spec is not None:
+                return spec
+        if isinstance(node, np.ndarray):
+            return node.tolist()
+        return [_encode_arrays(item, path) for item in node]
+    return node
+
+
+def compact_figure(fig):
+    """Figure dict for dcc.Graph with numeric trace arrays as typed arrays (layout untouched)"""
+    if fig is None:
+        return None
+    figure = fig.to_plotly_json() if hasattr(fig, 'to_plotly_json') else dict(fig)
+    return {
+        **figure,
+        'data': [_encode_arrays(trace) for trace in figure.get('data', [])],
+    }
+
+
+def dash_plotlyjs_version():
+    """(major, minor) of the plotly.js that dcc.Graph loads, or None when it cannot be read"""
+    import dash
+
+    # Dash 2 ships its own plotly.js next to the dcc components; Dash 3+ serves plotly.py's copy
+    bundled = sorted(glob.glob(os.path.join(os.path.dirname(dash.__file__), 'dcc', '*plotly*.js*')))
+    if not bundled:
+        from plotly.offline import get_plotlyjs_version
+
+        match = re.match(r'(\d+)\.(\d+)', get_plotlyjs_version())
+        return (int(match[1]), int(match[2])) if match else None
+    for path in bundled:
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            match = PLOTLYJS_VERSION_PATTERN.search(f.read())
+        if match:
+            return int(match[1]), int(match[2])
+    return None
+
+
+def figure_encoder(args=None):
+    """
+    compact_figure, or the identity with --plain-payload; also the identity (and
+    args.plain_payload set) when dcc.Graph's plotly.js cannot decode typed arrays
+    """
+    if args is not None and getattr(args, 'plain_payload', False):
+        return lambda fig: fig
+    version = dash_plotlyjs_version()
+    if version is None or version < MIN_TYPED_ARRAY_PLOTLYJS:
+        found = f"plotly.js {version[0]}.{version[1]}" if version else "an unknown plotly.js version"
+        print(f"⚠️  dcc.Graph loads {found}; typed arrays need "
+              f"{'.'.join(map(str, MIN_TYPED_ARRAY_PLOTLYJS))}+, falling back to --plain-payload")
+        if args is not None:
+            args.plain_payload = True
+        return lambda fig: fig
+    return compact_figure
+
+
+def figure_json(fig):
+    """JSON text Dash sends for a figure (plotly's encoder: orjson when installed)"""
+    import plotly.io as pio
+
+    return pio.json.to_json_plotly(fig.to_plotly_json() if hasattr(fig, 'to_plotly_json') else fig)
+
+
+def payload_sizes(fig):
+    """{'plain', 'compact', 'compressed'} byte counts of one figure"""
+    compact = figure_json(compact_figure(fig)).encode('utf-8')
+    return {
+        'plain': len(figure_json(fig).encode('utf-8')),
+        'compact': len(compact),
+        'compressed': len(compress_bytes(compact, 'br' if brotli is not None else 'gzip')),
+    }
+
+
+def report_payloads(figures):
+    """Print payload bytes per figure; returns {name: payload_sizes()} for the stage metrics"""
+    sizes = {name: payload_sizes(fig) for name, fig in figures.items() if fig is not None}
+    encoding = 'brotli' if brotli is not None else 'gzip'
+    print(f"✅ Figure payloads (plain JSON → typed arrays → {encoding}):")
+    for name, size in sizes.items():
+        print(f"   - {name:<12} {size['plain'] / KB:>9.1f} KB → {size['compact'] / KB:>8.1f} KB "
+              f"→ {size['compressed'] / KB:>7.1f} KB")
+    if len(sizes) > 1:
+        totals = {key: sum(size[key] for size in sizes.values()) for key in ('plain', 'compact', 'compressed')}
+        print(f"   {'total':<14} {totals['plain'] / KB:>9.1f} KB → {totals['compact'] / KB:>8.1f} KB "
+              f"→ {totals['compressed'] / KB:>7.1f} KB")
+    return sizes
+
+
+def compress_bytes(data, encoding):
+    """Body bytes for Content-Encoding `encoding` ('br' or 'gzip')"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _accepted_encoding(accept_encoding):
+    """'br', 'gzip' or None for a request's Accept-Encoding header"""
+    accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def enable_compression(server, min_size=MIN_COMPRESS_BYTES):
+    """
+    Compress JSON / HTML / JS / CSS responses of a Flask server (Dash's
+    app.server). Streamed and already-encoded responses are passed through.
+    """
+    from flask import request
+
+    @server.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.status_code != 200
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        encoding = _accepted_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        response.set_data(compress_bytes(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Content-Length'] = str(len(response.get_data()))
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return server
+
+
+def decode_typed_array(spec):
+    """NumPy array back from a typed-array spec (for checks and tests)"""
+    return np.frombuffer(base64.b64decode(spec['bdata']), dtype=np.dtype(spec['dtype']).newbyteorder('<'))
+
+
+if __name__ == '__main__':
+    # Tiny self-check: a figure round-trips through the typed-array encoding
+    import plotly.graph_objects as go
+
+    lat = np.random.default_rng(0).uniform(-60, 60, 1000)
+    fig = go.Figure(go.Scattermapbox(lat=lat, lon=lat, marker=dict(size=np.full(1000, 10.0))))
+    encoded = compact_figure(fig)
+    assert np.allclose(decode_typed_array(encoded['data'][0]['lat']), lat, atol=1e-5)
+    print(json.dumps(payload_sizes(fig)))
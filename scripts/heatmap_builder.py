@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Heatmap Builder
+Vectorized Time of Day vs Day of Week matrix from VisitorTrackingAnalytics records
+
+Each record stores per-visitor counters (`visitsByDayOfWeek*`, `visitsByHour*`).
+Those dicts are flattened into fixed-size vectors (7 days, 24 hours) and the
+proportional day x hour contribution of every record is computed in one
+matrix product instead of one pandas cell update at a time:
+
+    heatmap[hour, day] = sum over records of day[d] * hour[h] / totalVisits
+
+Requirements:
+    pip install numpy pandas
+"""
+
+import numpy as np
+import pandas as pd
+
+DAYS_ORDER = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+HOURS = list(range(24))
+
+DAY_INDEX = {day: idx for idx, day in enumerate(DAYS_ORDER)}
+
+
+def _as_count(value):
+    """Return a numeric counter value, treating missing/invalid values as 0"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return 0
+
+
+def record_time_counters(record):
+    """
+    Return (visits_by_day, visits_by_hour) for a record, Local first then
+    Zulu; UserLoginAnalytics records use the loginsBy* names
+    """
+    visits_by_day = (record.get('visitsByDayOfWeekLocal') or record.get('visitsByDayOfWeekZulu')
+                     or record.get('loginsByDayOfWeekLocal') or record.get('loginsByDayOfWeekZulu') or {})
+    visits_by_hour = (record.get('visitsByHourLocal') or record.get('visitsByHourZulu')
+                      or record.get('loginsByHourLocal') or record.get('loginsByHourZulu') or {})
+    return visits_by_day, visits_by_hour
+
+
+def record_total(record):
+    """totalVisits, or totalLogins for UserLoginAnalytics records"""
+    return _as_count(record.get('totalVisits', record.get('totalLogins', 0)))
+
+
+HOUR_INDEX = {**{hour: hour for hour in HOURS}, **{str(hour): hour for hour in HOURS}}
+
+
+def _counter_matrix(dicts, width, index, parse_key, dtype):
+    """
+    Stack counter dicts into an [N, width] array: the (cell, count) pairs are
+    collected in Python and summed with one bincount, instead of one NumPy
+    scalar update per dict entry
+    """
+    cells, counts = [], []
+    for row, counter in enumerate(dicts):
+        base = row * width
+        for key, count in counter.items():
+            idx = index.get(key)
+            if idx is None and parse_key is not None:
+                idx = parse_key(key)
+            if idx is not None:
+                cells.append(base + idx)
+                counts.append(count if type(count) in (int, float) else _as_count(count))
+    flat = np.bincount(np.asarray(cells, dtype=np.int64), weights=np.asarray(counts, dtype=np.float64),
+                       minlength=len(dicts) * width)
+    return flat.reshape(len(dicts), width).astype(dtype, copy=False)
+
+
+def _hour_key(hour):
+    """Hours stored under other spellings ('07', 7.0); None when not 0-23"""
+    try:
+        hour_int = int(hour)
+    except (TypeError, ValueError):
+        return None
+    return hour_int if 0 <= hour_int < 24 else None
+
+
+def day_matrix(dicts, dtype=np.float64):
+    """[N, 7] array (Sunday first) from {day_name: count} dicts"""
+    return _counter_matrix(dicts, 7, DAY_INDEX, None, dtype)
+
+
+def hour_matrix(dicts, dtype=np.float64):
+    """[N, 24] array from {"0".."23": count} dicts"""
+    return _counter_matrix(dicts, 24, HOUR_INDEX, _hour_key, dtype)
+
+
+def build_visit_vectors(records):
+    """
+    Flatten records into (days[N, 7], hours[N, 24], totals[N]) float arrays.
+
+    `records` may be any iterable of VisitorTrackingAnalytics dicts; it is
+    consumed once.
+    """
+    records = records if isinstance(records, list) else list(records)
+    counters = [record_time_counters(record) for record in records]
+
+    days = day_matrix([visits_by_day for visits_by_day, _ in counters])
+    hours = hour_matrix([visits_by_hour for _, visits_by_hour in counters])
+    totals = np.array([record_total(record) for record in records], dtype=np.float64)
+
+    return days, hours, totals
+
+
+def heatmap_from_vectors(days, hours, totals):
+    """
+    Sum the per-record outer products hour[h] * day[d] / total as one matmul.
+
+    Records with totalVisits <= 0 contribute nothing. Returns a 24x7 ndarray.
+    """
+    if len(totals) == 0:
+        return np.zeros((24, 7), dtype=np.float64)
+
+    scale = np.zeros_like(totals)
+    positive = totals > 0
+    scale[positive] = 1.0 / totals[positive]
+
+    # (24, N) @ (N, 7): batched outer product summed over all records
+    return (hours * scale[:, None]).T @ days
+
+
+def merge_matrices(*matrices):
+    """
+    Cell-wise sum rounded half up, like the endpoint's mergeMatrices() /
+    mergeDomMatrices() (Math.round)
+    """
+    return np.floor(np.sum(matrices, axis=0) + 0.5)
+
+
+def heatmap_to_frame(matrix):
+    """Wrap a 24x7 ndarray in the DataFrame shape the figures expect"""
+    return pd.DataFrame(matrix, index=HOURS, columns=DAYS_ORDER)
+
+
+def build_heatmap_matrix(records):
+    """Build the 24 (hours) x 7 (days) heatmap DataFrame from analytics records"""
+    days, hours, totals = build_visit_vectors(records)
+    return heatmap_to_frame(heatmap_from_vectors(days, hours, totals))
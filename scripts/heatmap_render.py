@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Heatmap Render
+Batch headless rendering of day x hour heatmap PNGs with a process pool and reused figures
+
+visualize_heatmap() builds a new three-axes figure through pyplot and seaborn,
+draws 168 annotations, saves at 300 dpi and tears it all down for every image.
+For many images (per range, per time type, one per day of history) this module
+instead:
+
+- draws on the Agg canvas directly (matplotlib.figure.Figure, no pyplot, no GUI)
+- builds one figure per worker process; each frame only swaps the mesh colors,
+  the 168 annotation strings/colors, the bar lengths and the title/info text
+- spreads the frames over a process pool in chunks, one renderer per worker
+- reports per-image render time (a worker's first image includes building its figure)
+
+The layout follows visualize_heatmap(): annotated YlOrRd heatmap, totals by
+day and by hour, and an info box. Saved at --render-dpi (default 100) without
+bbox_inches='tight', which would draw every frame twice.
+
+Daily frames come from one aggregation per history collection grouped by UTC
+date (history_pipeline.build_daily_pipeline); a frame is the trailing --window
+days ending on its date, taken from prefix sums over the dates.
+
+Usage:
+    python heatmap_render.py --days 365                 # one PNG per day from MongoDB history
+    python heatmap_render.py --days 365 --synthetic     # offline, synthetic history (heatmap_stub_server)
+    python heatmap_render.py --days 90 --window 30 --time-type zulu --include-logins --render-workers 4
+    python ../visualize_heatmap.py --batch --batch-images frames/   # one PNG per endpoint variant
+
+    frames = [frame_from_heatmap_data(data, 'heatmap_7d.png', label='7D'), ...]
+    timings, wall_seconds = render_frames(frames, workers=4)
+
+Environment Variables:
+    MONGODB_URI_PROD - MongoDB connection string (not needed with --synthetic)
+
+Requirements:
+    pip install numpy matplotlib
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from heatmap_builder import DAYS_ORDER
+
+DATABASE_NAME = 'TangoTiempoProd'
+DEFAULT_RENDER_DPI = 100
+DEFAULT_RENDER_WORKERS = os.cpu_count() or 1
+DEFAULT_WINDOW_DAYS = 7
+DEFAULT_DAYS = 365
+DEFAULT_OUTPUT_DIR = 'heatmap_frames'
+CHUNK_SIZE = 16          # frames per pool task: amortizes pickling, still balances across workers
+
+FIGSIZE = (20, 8)
+CMAP = 'YlOrRd'
+HOUR_LABELS = [f'{h}:00' if h % 3 == 0 else '' for h in range(24)]
+
+_renderer = None         # HeatmapRenderer of the current worker process
+
+
+def peak_label(matrix):
+    """'Monday at 2:00 PM (57 events)' for the busiest cell of a 7x24 matrix"""
+    day_idx, hour = np.unravel_index(int(matrix.argmax()), matrix.shape)
+    count = matrix[day_idx, hour]
+    if count <= 0:
+        return 'None (0 events)'
+    return f"{DAYS_ORDER[day_idx]} at {hour % 12 or 12}:00 {'AM' if hour < 12 else 'PM'} ({count:.0f} events)"
+
+
+def make_frame(path, matrix, title, info):
+    """One image to render: output path, 7x24 matrix (Sunday first) and its text"""
+    return {'path': path, 'matrix': np.asarray(matrix, dtype=np.float64), 'title': title, 'info': info}
+
+
+def frame_from_heatmap_data(data, path, label=None):
+    """Frame from an endpoint-shaped `data` payload, titled like visualize_heatmap()"""
+    matrix = np.array([data['heatmap'].get(day, [0] * 24) for day in DAYS_ORDER], dtype=np.float64)
+    sources = data['sources']
+    peak = data['peak']
+    suffix = f' · {label}' if label else ''
+
+    title = (
+        f'Visitor/Login Traffic Heatmap - {data["metadata"]["timeType"].upper()} Time{suffix}\n'
+        f'Total: {data["totals"]["overall"]:,} events | '
+        f'Peak: {peak["timestamp"]} ({peak["count"]} events)'
+    )
+    info = (
+        f'Data Sources:\n'
+        f'  User Logins: {sources["userLogins"]:,}\n'
+        f'  Anonymous Visitors: {sources["anonymousVisitors"]:,}\n'
+        f'  Total Events: {sources["total"]:,}\n'
+        f'\n'
+        f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'
+    )
+    return make_frame(path, matrix, title, info)
+
+
+def daily_frames(counts, first_day, window_days, output_dir, time_type='local', source_label='History events'):
+    """
+    One frame per date from the window_days-th day of `counts` ([days, 7, 24]
+    starting at first_day) on: the trailing window_days ending on that date
+    """
+    cumulative = np.concatenate([np.zeros((1, 7, 24), dtype=counts.dtype), counts.cumsum(axis=0)])
+    generated = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    frames = []
+
+    for end in range(window_days, len(counts) + 1):
+        matrix = cumulative[end] - cumulative[end - window_days]
+        last_day = first_day + timedelta(days=end - 1)
+        start_day = last_day - timedelta(days=window_days - 1)
+        title = (
+            f'Visitor/Login Traffic Heatmap - {time_type.upper()} Time · {start_day} – {last_day}\n'
+            f'Total: {int(matrix.sum()):,} events | Peak: {peak_label(matrix)}'
+        )
+        info = (
+            f'Data Sources:\n'
+            f'  {source_label}: {int(matrix.sum()):,}\n'
+            f'  Window: {window_days} days (UTC dates)\n'
+            f'\n'
+            f'Generated: {generated}'
+        )
+        frames.append(make_frame(os.path.join(output_dir, f'heatmap_{last_day.isoformat()}.png'), matrix, title, info))
+
+    return frames
+
+
+class HeatmapRenderer:
+    """One Agg figure laid out like visualize_heatmap(), redrawn per frame with new data"""
+
+    def __init__(self, dpi=DEFAULT_RENDER_DPI):
+        import matplotlib
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from matplotlib.layout_engine import TightLayoutEngine
+
+        started = time.perf_counter()
+        self.dpi = dpi
+        self.cmap = matplotlib.colormaps[CMAP]
+        self.figure = Figure(figsize=FIGSIZE)
+        FigureCanvasAgg(self.figure)
+        ax_main, self.ax_day, self.ax_hour = self.figure.subplots(
+            1, 3, gridspec_kw={'width_ratios': [3, 0.3, 0.3]}
+        )
+
+        # Main heatmap: a 7x24 mesh with white cell borders, Sunday on top (as seaborn draws it)
+        self.mesh = ax_main.pcolormesh(np.zeros((7, 24)), cmap=self.cmap, edgecolors='white', linewidth=0.5)
+        self.figure.colorbar(self.mesh, ax=ax_main, label='Traffic Count')
+        ax_main.set_xlim(0, 24)
+        ax_main.set_ylim(7, 0)
+        ax_main.set_xticks(np.arange(24) + 0.5, HOUR_LABELS)
+        ax_main.set_yticks(np.arange(7) + 0.5, DAYS_ORDER)
+        for spine in ax_main.spines.values():
+            spine.set_visible(False)
+        self.title = ax_main.set_title('Title\nSubtitle', fontsize=14, fontweight='bold')
+        ax_main.set_xlabel('Hour of Day', fontsize=12)
+        ax_main.set_ylabel('Day of Week', fontsize=12)
+
+        rows, columns = np.divmod(np.arange(7 * 24), 24)
+        self.annotations = [
+            ax_main.text(column + 0.5, row + 0.5, '', ha='center', va='center')
+            for row, column in zip(rows, columns)
+        ]
+
+        # Day totals bar
+        self.day_bars = self.ax_day.barh(range(7), np.zeros(7), color='steelblue')
+        self.day_labels = [
+            self.ax_day.text(0, i, '', ha='center', va='center', fontweight='bold') for i in range(7)
+        ]
+        self.ax_day.set_ylim(6.5, -0.5)   # rows line up with the heatmap (Sunday on top)
+        self.ax_day.set_yticks(range(7))
+        self.ax_day.set_yticklabels([])
+        self.ax_day.set_xlabel('Total\nby Day', fontsize=10)
+
+        # Hour totals bar
+        self.hour_bars = self.ax_hour.bar(range(24), np.zeros(24), color='coral')
+        self.ax_hour.set_xticks([])
+        self.ax_hour.set_ylabel('Total by Hour', fontsize=10)
+        self.ax_hour.set_xlim(-0.5, 23.5)
+
+        self.info = self.figure.text(
+            0.98, 0.02, '', ha='right', va='bottom', fontsize=9,
+            bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5)
+        )
+
+        # Laid out once, without attaching a layout engine: with one attached,
+        # savefig() draws every frame twice. Only text and data change afterwards.
+        TightLayoutEngine().execute(self.figure)
+        self.setup_seconds = time.perf_counter() - started
+
+    def _annotation_colors(self, values):
+        """seaborn's annotation contrast rule: dark text on light cells, white on dark ones"""
+        rgb = self.cmap(self.mesh.norm(values))[:, :3]
+        linear = np.where(rgb <= 0.03928, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+        return np.where(linear @ [0.2126, 0.7152, 0.0722] > 0.408, '.15', 'w')
+
+    def render(self, frame):
+        """Swap the frame's data into the figure and save it; returns seconds taken"""
+        started = time.perf_counter()
+        matrix = frame['matrix']
+        values = matrix.ravel()
+
+        low, high = values.min(), values.max()
+        self.mesh.set_array(values)
+        self.mesh.set_clim(low, high if high > low else low + 1)
+        for text, value, color in zip(self.annotations, values, self._annotation_colors(values)):
+            text.set_text(f'{value:.0f}')
+            text.set_color(color)
+
+        day_totals = matrix.sum(axis=1)
+        for bar, label, value in zip(self.day_bars, self.day_labels, day_totals):
+            bar.set_width(value)
+            label.set_x(value / 2)
+            label.set_text(str(int(value)))
+        self.ax_day.set_xlim(max(day_totals.max(), 1) * 1.05, 0)
+
+        hour_totals = matrix.sum(axis=0)
+        for bar, value in zip(self.hour_bars, hour_totals):
+            bar.set_height(value)
+        self.ax_hour.set_ylim(0, max(hour_totals.max(), 1) * 1.05)
+
+        self.title.set_text(frame['title'])
+        self.info.set_text(frame['info'])
+        self.figure.savefig(frame['path'], dpi=self.dpi)
+
+        # The first frame carries the cost of building the figure
+        elapsed = time.perf_counter() - started + self.setup_seconds
+        self.setup_seconds = 0.0
+        return elapsed
+
+
+def _init_worker(dpi):
+    global _renderer
+    _renderer = HeatmapRenderer(dpi)
+
+
+def _render_chunk(frames):
+    """Pool task: render frames with this worker's renderer; returns [(path, seconds)]"""
+    return [(frame['path'], _renderer.render(frame)) for frame in frames]
+
+
+def render_frames(frames, workers=DEFAULT_RENDER_WORKERS, dpi=DEFAULT_RENDER_DPI):
+    """
+    Render all frames, in-process for one worker or over a process pool.
+
+    Returns ([(path, seconds), ...] in frame order, wall seconds).
+    """
+    for directory in {os.path.dirname(frame['path']) for frame in frames}:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    started = time.perf_counter()
+    workers = max(1, min(workers, len(frames)))
+    if workers == 1:
+        renderer = HeatmapRenderer(dpi)
+        timings = [(frame['path'], renderer.render(frame)) for frame in frames]
+    else:
+        chunk_size = max(1, min(CHUNK_SIZE, -(-len(frames) // workers)))
+        chunks = [frames[i:i + chunk_size] for i in range(0, len(frames), chunk_size)]
+        # spawn: workers start clean instead of forking the caller's threads/sessions
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(dpi,)) as pool:
+            timings = [timing for chunk in pool.map(_render_chunk, chunks) for timing in chunk]
+
+    return timings, time.perf_counter() - started
+
+
+def print_render_summary(timings, wall_seconds, workers):
+    """Images/s plus the per-image render time distribution"""
+    if not timings:
+        print("⚠️  No images rendered")
+        return
+    ms = np.array([seconds for _, seconds in timings]) * 1000
+    print(f"\n📊 Rendered {len(ms)} images in {wall_seconds:.1f}s wall "
+          f"({len(ms) / max(wall_seconds, 1e-9):.1f} images/s, {workers} worker(s))")
+    print(f"   Per image: median {np.median(ms):.0f} ms · p95 {np.percentile(ms, 95):.0f} ms · "
+          f"max {ms.max():.0f} ms · total {ms.sum() / 1000:.1f}s of render time")
+
+
+def add_render_arguments(parser):
+    """Register batch render options on an argparse parser"""
+    parser.add_argument('--render-workers', type=int, default=DEFAULT_RENDER_WORKERS,
+                        help=f'Render processes (default: {DEFAULT_RENDER_WORKERS}, the CPU count)')
+    parser.add_argument('--render-dpi', type=int, default=DEFAULT_RENDER_DPI,
+                        help=f'Resolution of the rendered PNGs (default: {DEFAULT_RENDER_DPI})')
+
+
+def load_daily_counts(args, first_day, days):
+    """[days, 7, 24] cell counts from MongoDB history, or from synthetic events"""
+    from history_pipeline import aggregate_daily_history_events, fetch_daily_heatmaps
+
+    if args.synthetic:
+        from heatmap_stub_server import history_documents, synthetic_events
+
+        events = [event for event in history_documents(synthetic_events(args.synthetic_events))
+                  if args.include_logins or not event['isLogin']]
+        return aggregate_daily_history_events(events, first_day, days, args.time_type)
+
+    mongodb_uri = os.getenv('MONGODB_URI_PROD')
+    if not mongodb_uri:
+        print("ERROR: MONGODB_URI_PROD environment variable not set (or use --synthetic)")
+        sys.exit(1)
+
+    from pymongo import MongoClient
+
+    client = MongoClient(mongodb_uri)
+    try:
+        return fetch_daily_heatmaps(client[DATABASE_NAME], first_day, days, args.time_type,
+                                    include_visitors=True, include_logins=args.include_logins)
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render one heatmap PNG per day of visitor history')
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS,
+                        help=f'Daily images to render, ending today (UTC) (default: {DEFAULT_DAYS})')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW_DAYS,
+                        help=f'Trailing days aggregated into each image (default: {DEFAULT_WINDOW_DAYS})')
+    parser.add_argument('--time-type', choices=['local', 'zulu'], default='local', help='Time type')
+    parser.add_argument('--include-logins', action='store_true', help='Also count UserLoginHistory')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR,
+                        help=f'Directory for heatmap_YYYY-MM-DD.png (default: {DEFAULT_OUTPUT_DIR})')
+    parser.add_argument('--synthetic', action='store_true',
+                        help='Use synthetic history events (heatmap_stub_server) instead of MongoDB')
+    parser.add_argument('--synthetic-events', type=int, default=100000,
+                        help='Synthetic events over two years with --synthetic (default: 100000)')
+    add_render_arguments(parser)
+    args = parser.parse_args()
+    if args.days < 1 or args.window < 1:
+        parser.error('--days and --window must be at least 1')
+
+    span = args.days + args.window - 1
+    first_day = datetime.now(timezone.utc).date() - timedelta(days=span - 1)
+
+    started = time.perf_counter()
+    counts = load_daily_counts(args, first_day, span)
+    frames = daily_frames(counts, first_day, args.window, args.output_dir, args.time_type,
+                          source_label='Synthetic events' if args.synthetic else 'History events')
+    print(f"✅ Loaded {int(counts.sum()):,} events over {span} days in {time.perf_counter() - started:.1f}s")
+
+    print(f"🚀 Rendering {len(frames)} images to {args.output_dir}/ "
+          f"({args.render_workers} worker(s), {args.render_dpi} dpi)")
+    timings, wall_seconds = render_frames(frames, args.render_workers, args.render_dpi)
+    print_render_summary(timings, wall_seconds, min(args.render_workers, len(frames)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
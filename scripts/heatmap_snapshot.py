@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Heatmap Snapshot
+Incremental, persisted 7x24 / 31x24 heatmaps over the history collections
+
+The snapshot file holds, per history collection (VisitorTrackingHistory,
+UserLoginHistory) and per time type (local, zulu), the all-time DOW and DOM
+matrices plus a high-water mark. Each refresh aggregates only the events
+inserted since the mark (server-side, via history_pipeline) and folds them in,
+so the cost of a daily report tracks new traffic rather than all-time volume.
+
+High-water mark:
+    Events are windowed by `_id`. The mark is an ObjectId built from a wall
+    clock boundary (`now - settle_seconds`), and each refresh folds
+    `mark <= _id < new_mark`. ObjectIds start with their creation second, so
+    events written by any function instance before the boundary are included
+    exactly once, provided clocks are within `settle_seconds` of each other.
+
+Usage:
+    snapshot = load_snapshot()
+    refresh_snapshot(db, snapshot)      # fold new events
+    save_snapshot(snapshot)
+    verify_snapshot(db, snapshot)       # compare with a full recompute
+
+Requirements:
+    pip install pymongo numpy
+"""
+
+from datetime import datetime, timedelta, timezone
+import json
+import os
+
+from bson import ObjectId
+import numpy as np
+
+from heatmap_builder import DAYS_ORDER
+from history_pipeline import HISTORY_COLLECTIONS, run_heatmap_pipeline
+
+SNAPSHOT_VERSION = 1
+DEFAULT_SNAPSHOT_PATH = os.getenv('HEATMAP_SNAPSHOT_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'heatmap_snapshot.json'
+)
+SETTLE_SECONDS = 120
+TIME_TYPES = ('local', 'zulu')
+
+
+def _empty_matrices():
+    return {
+        time_type: {
+            'dow': np.zeros((7, 24), dtype=np.int64),
+            'dom': np.zeros((31, 24), dtype=np.int64),
+        }
+        for time_type in TIME_TYPES
+    }
+
+
+def empty_collection_state():
+    """State for one collection before any event has been folded in"""
+    return {
+        'highWaterId': None,
+        'highWaterTimestamp': None,
+        'events': 0,
+        'matrices': _empty_matrices(),
+    }
+
+
+def empty_snapshot():
+    """A snapshot with no events folded in"""
+    return {
+        'version': SNAPSHOT_VERSION,
+        'updatedAt': None,
+        'collections': {name: empty_collection_state() for name in HISTORY_COLLECTIONS.values()},
+    }
+
+
+def load_snapshot(path=DEFAULT_SNAPSHOT_PATH):
+    """Load a snapshot file, or return an empty snapshot if none exists yet"""
+    if not os.path.exists(path):
+        return empty_snapshot()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+
+    if raw.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {raw.get('version')} in {path}; rebuild it")
+
+    snapshot = empty_snapshot()
+    snapshot['updatedAt'] = raw.get('updatedAt')
+
+    for name, state in raw.get('collections', {}).items():
+        loaded = empty_collection_state()
+        loaded['highWaterId'] = state.get('highWaterId')
+        loaded['highWaterTimestamp'] = state.get('highWaterTimestamp')
+        loaded['events'] = state.get('events', 0)
+        for time_type in TIME_TYPES:
+            for key in ('dow', 'dom'):
+                loaded['matrices'][time_type][key] = np.array(
+                    state['matrices'][time_type][key], dtype=np.int64
+                )
+        snapshot['collections'][name] = loaded
+
+    return snapshot
+
+
+def save_snapshot(snapshot, path=DEFAULT_SNAPSHOT_PATH):
+    """Write the snapshot atomically (temp file + rename)"""
+    raw = {
+        'version': SNAPSHOT_VERSION,
+        'updatedAt': snapshot['updatedAt'],
+        'collections': {
+            name: {
+                'highWaterId': state['highWaterId'],
+                'highWaterTimestamp': state['highWaterTimestamp'],
+                'events': state['events'],
+                'matrices': {
+                    time_type: {key: matrix.tolist() for key, matrix in matrices.items()}
+                    for time_type, matrices in state['matrices'].items()
+                },
+            }
+            for name, state in snapshot['collections'].items()
+        },
+    }
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(raw, f)
+    os.replace(tmp_path, path)
+
+
+def id_window(start_id=None, end_id=None):
+    """`_id` filter for [start_id, end_id)"""
+    window = {}
+    if start_id is not None:
+        window['$gte'] = start_id
+    if end_id is not None:
+        window['$lt'] = end_id
+    return {'_id': window} if window else {}
+
+
+def aggregate_window(collection, start_id=None, end_id=None):
+    """Aggregate DOW/DOM matrices for both time types over an `_id` window"""
+    match = id_window(start_id, end_id)
+    matrices = {}
+    events = 0
+
+    for time_type in TIME_TYPES:
+        dow, dom, events = run_heatmap_pipeline(collection, time_type=time_type, match=match)
+        matrices[time_type] = {'dow': dow, 'dom': dom}
+
+    return matrices, events
+
+
+def high_water_boundary(now=None, settle_seconds=SETTLE_SECONDS):
+    """ObjectId boundary for events that are old enough to be folded in"""
+    now = now or datetime.now(timezone.utc)
+    boundary_time = now - timedelta(seconds=settle_seconds)
+    return ObjectId.from_datetime(boundary_time), boundary_time
+
+
+def refresh_snapshot(db, snapshot, now=None, settle_seconds=SETTLE_SECONDS):
+    """
+    Fold events newer than each collection's high-water mark into the snapshot.
+
+    Returns {collection: events folded in}.
+    """
+    boundary_id, boundary_time = high_water_boundary(now, settle_seconds)
+    folded = {}
+
+    for name, state in snapshot['collections'].items():
+        start_id = ObjectId(state['highWaterId']) if state['highWaterId'] else None
+        if start_id is not None and start_id >= boundary_id:
+            folded[name] = 0
+            continue
+
+        matrices, events = aggregate_window(db[name], start_id, boundary_id)
+        for time_type in TIME_TYPES:
+            for key in ('dow', 'dom'):
+                state['matrices'][time_type][key] += matrices[time_type][key]
+
+        state['events'] += events
+        state['highWaterId'] = str(boundary_id)
+        state['highWaterTimestamp'] = boundary_time.isoformat()
+        folded[name] = events
+
+    snapshot['updatedAt'] = datetime.now(timezone.utc).isoformat()
+    return folded
+
+
+def rebuild_snapshot(db, now=None, settle_seconds=SETTLE_SECONDS):
+    """Discard state and fold every event up to the boundary from scratch"""
+    snapshot = empty_snapshot()
+    refresh_snapshot(db, snapshot, now=now, settle_seconds=settle_seconds)
+    return snapshot
+
+
+def verify_snapshot(db, snapshot):
+    """
+    Recompute each collection up to its high-water mark and compare.
+
+    Returns {collection: {'events': (snapshot, recomputed), 'mismatchedCells': n}}.
+    """
+    report = {}
+
+    for name, state in snapshot['collections'].items():
+        end_id = ObjectId(state['highWaterId']) if state['highWaterId'] else None
+        if end_id is None:
+            report[name] = {'events': (0, 0), 'mismatchedCells': 0}
+            continue
+
+        matrices, events = aggregate_window(db[name], None, end_id)
+        mismatched = 0
+        for time_type in TIME_TYPES:
+            for key in ('dow', 'dom'):
+                mismatched += int(np.count_nonzero(
+                    matrices[time_type][key] != state['matrices'][time_type][key]
+                ))
+
+        report[name] = {'events': (state['events'], events), 'mismatchedCells': mismatched}
+
+    return report
+
+
+def snapshot_matrices(snapshot, time_type='local', include_visitors=True, include_logins=True):
+    """Merged (dow, dom, sources) for the selected collections"""
+    dow = np.zeros((7, 24), dtype=np.int64)
+    dom = np.zeros((31, 24), dtype=np.int64)
+    sources = {}
+
+    selected = []
+    if include_visitors:
+        selected.append(HISTORY_COLLECTIONS['visitors'])
+    if include_logins:
+        selected.append(HISTORY_COLLECTIONS['logins'])
+
+    for name in selected:
+        state = snapshot['collections'][name]
+        dow += state['matrices'][time_type]['dow']
+        dom += state['matrices'][time_type]['dom']
+        sources[name] = state['events']
+
+    return dow, dom, sources
+
+
+def _format_hour(hour):
+    """Same 12-hour labels as formatHour() in Analytics_VisitorHeatmap.js"""
+    if hour == 0:
+        return '12:00 AM'
+    if hour < 12:
+        return f'{hour}:00 AM'
+    if hour == 12:
+        return '12:00 PM'
+    return f'{hour - 12}:00 PM'
+
+
+def snapshot_to_heatmap_data(snapshot, time_type='local', include_visitors=True, include_logins=True):
+    """
+    Shape snapshot matrices like the `data` payload of /api/analytics/visitor-heatmap
+    so visualize_heatmap.py can render it unchanged.
+    """
+    dow, dom, sources = snapshot_matrices(snapshot, time_type, include_visitors, include_logins)
+
+    overall = int(dow.sum())
+    peak_day_idx, peak_hour = np.unravel_index(int(dow.argmax()), dow.shape)
+    peak_count = int(dow[peak_day_idx, peak_hour])
+    peak_day = DAYS_ORDER[peak_day_idx] if peak_count > 0 else None
+
+    dom_peak_idx, dom_peak_hour = np.unravel_index(int(dom.argmax()), dom.shape)
+    dom_peak_count = int(dom[dom_peak_idx, dom_peak_hour])
+
+    logins = sources.get(HISTORY_COLLECTIONS['logins'], 0)
+    visitors = sources.get(HISTORY_COLLECTIONS['visitors'], 0)
+
+    return {
+        'heatmap': {day: dow[idx].tolist() for idx, day in enumerate(DAYS_ORDER)},
+        'domHeatmap': {str(d + 1): dom[d].tolist() for d in range(31)},
+        'totals': {
+            'byDay': {day: int(dow[idx].sum()) for idx, day in enumerate(DAYS_ORDER)},
+            'byHour': dow.sum(axis=0).tolist(),
+            'overall': overall,
+        },
+        'domTotals': {
+            'byDom': {str(d + 1): int(dom[d].sum()) for d in range(31)},
+            'overall': int(dom.sum()),
+        },
+        'peak': {
+            'day': peak_day,
+            'hour': int(peak_hour) if peak_day else None,
+            'count': peak_count,
+            'timestamp': f'{peak_day} at {_format_hour(int(peak_hour))}' if peak_day else None,
+        },
+        'domPeak': {
+            'day': int(dom_peak_idx) + 1 if dom_peak_count > 0 else None,
+            'hour': int(dom_peak_hour) if dom_peak_count > 0 else None,
+            'count': dom_peak_count,
+        },
+        'sources': {
+            'userLogins': logins,
+            'anonymousVisitors': visitors,
+            'total': logins + visitors,
+        },
+        'metadata': {
+            'timeType': time_type,
+            'range': 'ALL',
+            'timeFilter': 'All Time (snapshot)',
+            'cutoffDate': None,
+            'includeLogins': include_logins,
+            'includeVisitors': include_visitors,
+            'generatedAt': snapshot['updatedAt'],
+            'dataPoints': overall,
+        },
+    }
+
+
+def add_snapshot_arguments(parser):
+    """Register snapshot maintenance options on an argparse parser"""
+    parser.add_argument('--snapshot-path', default=DEFAULT_SNAPSHOT_PATH,
+                        help=f'Heatmap snapshot file (default: {DEFAULT_SNAPSHOT_PATH})')
+    parser.add_argument('--rebuild-snapshot', action='store_true',
+                        help='Discard the snapshot and recompute it from all history events')
+    parser.add_argument('--verify-snapshot', action='store_true',
+                        help='Compare the snapshot with a full recompute after refreshing')
+
+
+def update_snapshot(db, args):
+    """Load/refresh (or rebuild), save and optionally verify the snapshot; prints progress"""
+    if args.rebuild_snapshot:
+        snapshot = rebuild_snapshot(db)
+        print(f"✅ Rebuilt heatmap snapshot")
+        for name, state in snapshot['collections'].items():
+            print(f"   - {name}: {state['events']} events")
+    else:
+        snapshot = load_snapshot(args.snapshot_path)
+        folded = refresh_snapshot(db, snapshot)
+        print(f"✅ Refreshed heatmap snapshot")
+        for name, events in folded.items():
+            print(f"   - {name}: +{events} new events "
+                  f"({snapshot['collections'][name]['events']} total)")
+
+    save_snapshot(snapshot, args.snapshot_path)
+    print(f"   Saved to: {args.snapshot_path}")
+
+    if args.verify_snapshot:
+        report = verify_snapshot(db, snapshot)
+        for name, result in report.items():
+            stored, recomputed = result['events']
+            status = '✅' if result['mismatchedCells'] == 0 and stored == recomputed else '❌'
+            print(f"{status} Verify {name}: {stored} vs {recomputed} events, "
+                  f"{result['mismatchedCells']} mismatched cells")
+
+    return snapshot
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Heatmap Stub Server
+Local stand-in for GET /api/analytics/visitor-heatmap (Analytics_VisitorHeatmap)
+
+Serves responses with the same shape as the Azure function, computed from a
+seeded synthetic event history, so visualize_heatmap.py can be exercised
+offline. Honors timeType, range, includeLogins and includeVisitors the way the
+endpoint does; --latency adds a per-request delay to imitate the function
+app (cold starts, the history scan) when measuring concurrent fetches, and
+--etag adds ETag / If-None-Match handling (the real function sends neither) to
+exercise conditional revalidation in response_cache.py.
+
+Usage:
+    python heatmap_stub_server.py                        # http://127.0.0.1:7071 (same as --local)
+    python heatmap_stub_server.py --port 8071 --latency 0.5
+    python ../visualize_heatmap.py --url http://127.0.0.1:8071/api/analytics/visitor-heatmap
+
+    # In-process (tests, benchmarks):
+    server, url = start_stub_server(latency=0.2)
+    ...
+    server.shutdown()
+"""
+
+import argparse
+import hashlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from history_pipeline import parse_range
+
+ENDPOINT_PATH = '/api/analytics/visitor-heatmap'
+DEFAULT_EVENTS = 20000
+DEFAULT_SEED = 42
+
+DAYS_OF_WEEK = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+# Browser UTC offsets (hours) the synthetic visitors are spread over
+TIMEZONE_OFFSETS = [-8, -7, -6, -5, -3, 0, 1, 2]
+
+
+def synthetic_events(count=DEFAULT_EVENTS, seed=DEFAULT_SEED, now=None):
+    """
+    (timestamp, utc_offset_hours, is_login) tuples over the last two years,
+    denser toward the present and thin in the local small hours
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    events = []
+    for _ in range(count):
+        moment = now - timedelta(seconds=rng.random() ** 1.5 * 730 * 86400)
+        offset = rng.choice(TIMEZONE_OFFSETS)
+        local_hour = (moment.hour + offset) % 24
+        # Thin out the small hours so the heatmap has a recognisable shape
+        if local_hour < 7 and rng.random() < 0.7:
+            moment -= timedelta(hours=rng.randint(8, 14))
+        events.append((moment, offset, rng.random() < 0.15))
+    return events
+
+
+def history_documents(events):
+    """Shape synthetic events like VisitorTrackingHistory / UserLoginHistory documents"""
+    documents = []
+    for moment, offset, is_login in events:
+        local = moment + timedelta(hours=offset)
+        documents.append({
+            'timestamp': moment,
+            'isLogin': is_login,
+            'dayOfWeekLocal': DAYS_OF_WEEK[(local.weekday() + 1) % 7],
+            'hourOfDayLocal': local.hour,
+            'dayOfMonthLocal': local.day,
+            'dayOfWeekZulu': DAYS_OF_WEEK[(moment.weekday() + 1) % 7],
+            'hourOfDayZulu': moment.hour,
+            'dayOfMonthZulu': moment.day,
+        })
+    return documents
+
+
+def range_cutoff(range_param, now):
+    """Endpoint range semantics; unparseable ranges fall back to 3M like the function"""
+    try:
+        return parse_range(range_param, now)
+    except ValueError:
+        return parse_range('3M', now)
+
+
+def _format_hour(hour):
+    suffix = 'AM' if hour < 12 else 'PM'
+    return f"{hour % 12 or 12}:00 {suffix}"
+
+
+def build_response(events, params, now=None):
+    """Endpoint-shaped JSON body for one set of query parameters"""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    time_type = params.get('timeType', 'local')
+    include_logins = params.get('includeLogins') != 'false'
+    include_visitors = params.get('includeVisitors') != 'false'
+    range_param = (params.get('range') or '3M').upper()
+
+    if time_type not in ('local', 'zulu'):
+        return 400, {'success': False, 'error': 'Invalid timeType. Must be "local" or "zulu"'}
+    cutoff = range_cutoff(range_param, now)
+
+    heatmap = {day: [0] * 24 for day in DAYS_OF_WEEK}
+    dom_heatmap = {str(dom): [0] * 24 for dom in range(1, 32)}
+    logins = visitors = 0
+
+    for moment, offset, is_login in events:
+        if (cutoff is not None and moment < cutoff) or (is_login and not include_logins) \
+                or (not is_login and not include_visitors):
+            continue
+        if is_login:
+            logins += 1
+        else:
+            visitors += 1
+        shown = moment + timedelta(hours=offset) if time_type == 'local' else moment
+        heatmap[DAYS_OF_WEEK[(shown.weekday() + 1) % 7]][shown.hour] += 1
+        dom_heatmap[str(shown.day)][shown.hour] += 1
+
+    by_day = {day: sum(heatmap[day]) for day in DAYS_OF_WEEK}
+    by_hour = [sum(heatmap[day][hour] for day in DAYS_OF_WEEK) for hour in range(24)]
+    overall = sum(by_day.values())
+
+    peak = {'day': None, 'hour': None, 'count': 0, 'timestamp': None}
+    for day in DAYS_OF_WEEK:
+        for hour, count in enumerate(heatmap[day]):
+            if count > peak['count']:
+                peak = {'day': day, 'hour': hour, 'count': count, 'timestamp': f"{day} at {_format_hour(hour)}"}
+
+    return 200, {
+        'success': True,
+        'data': {
+            'heatmap': heatmap,
+            'domHeatmap': dom_heatmap,
+            'totals': {'byDay': by_day, 'byHour': by_hour, 'overall': overall},
+            'peak': peak,
+            'sources': {'userLogins': logins, 'anonymousVisitors': visitors, 'total': logins + visitors},
+            'metadata': {
+                'timeType': time_type,
+                'range': range_param,
+                'cutoffDate': cutoff.isoformat() + 'Z' if cutoff else None,
+                'includeLogins': include_logins,
+                'includeVisitors': include_visitors,
+                'generatedAt': now.isoformat() + 'Z',
+                'dataPoints': overall,
+            },
+        },
+        'timestamp': now.isoformat() + 'Z',
+    }
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def content_etag(body):
+    """Validator over the data only (generatedAt/timestamp change every call)"""
+    data = body.get('data') or {}
+    content = json.dumps([data.get('heatmap'), data.get('sources'), data.get('metadata', {}).get('range')],
+                         sort_keys=True)
+    return '"' + hashlib.sha1(content.encode('utf-8')).hexdigest() + '"'
+
+
+def make_handler(events, latency=0.0, etag=False):
+    """Request handler class bound to an event list, simulated latency and ETag mode"""
+
+    class StubHandler(BaseHTTPRequestHandler):
+        requests_served = 0
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path != ENDPOINT_PATH:
+                self.send_error(404)
+                return
+            if latency:
+                time.sleep(latency)
+            params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+            status, body = build_response(events, params)
+            payload = json.dumps(body).encode('utf-8')
+
+            StubHandler.requests_served += 1
+            tag = content_etag(body) if etag and status == 200 else None
+            if tag and self.headers.get('If-None-Match') == tag:
+                self.send_response(304)
+                self.send_header('ETag', tag)
+                self.end_headers()
+                return
+
+            self.send_response(status)
+            if tag:
+                self.send_header('ETag', tag)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.send_header('Cache-Control', 'public, max-age=3600')
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(port=0, latency=0.0, events=None, etag=False):
+    """Serve on 127.0.0.1 in a background thread; returns (server, endpoint url)"""
+    handler = make_handler(synthetic_events() if events is None else events, latency, etag)
+    server = _ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.handler = handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}{ENDPOINT_PATH}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the visitor-heatmap endpoint')
+    parser.add_argument('--port', type=int, default=7071, help='Port (default: 7071, the func host port)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of delay per request')
+    parser.add_argument('--events', type=int, default=DEFAULT_EVENTS, help='Synthetic history events')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Random seed')
+    parser.add_argument('--etag', action='store_true', help='Send ETags and answer If-None-Match with 304')
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.port, args.latency, synthetic_events(args.events, args.seed), args.etag)
+    print(f"🚀 Stub heatmap endpoint: {url} ({args.events} events, {args.latency}s latency)")
+    print("   Press Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+History Cube
+Hourly time-bucket cube over the history collections, with prefix sums for
+arbitrary-window heatmaps and totals
+
+The cube counts VisitorTrackingHistory / UserLoginHistory events per UTC hour
+bucket x source (visitors, logins) x geoSource x local-time key, where the
+local-time key is (local - UTC hour-of-week offset, local day-of-month shift).
+Events without local fields (no timezoneOffset, or VisitorTrack.js's null
+local hour 0) get their own key: they count in zulu heatmaps and totals only,
+as in the pipeline. Three structures are derived from the dense counts:
+
+- an hourly cumulative sum along time: window totals in O(1)
+- week-periodic prefix sums (the axis starts on a Sunday 00:00 UTC, so an hour
+  index mod 168 is its hour-of-week): a 7x24 heatmap for any window is one
+  difference of whole weeks plus at most two partial weeks of hourly rows;
+  local time is the same vector rolled by each key's offset
+- month-periodic prefix sums, the same trick for 31x24 day-of-month heatmaps
+
+So a query costs O(168 + 744 cells x keys) regardless of window length, and
+comparisons (this week vs the same week last year) need no rescan. Windows
+resolve to whole UTC hours. Day-of-month follows the pipeline: the
+dayOfMonth* field when present, else the UTC date of `timestamp`.
+
+The cube is built server-side from one `$group` per collection (rows per hour
+x geoSource x local fields, not per event) or from a backup file / synthetic
+events, saved to history_cube.npz (gitignored) and refreshed by folding in
+events newer than its `until` boundary.
+
+Usage:
+    python history_cube.py --since 2026-10-05 --until 2026-10-12 --compare-weeks 52
+    python history_cube.py --synthetic 1000000 --since 2026-09-01 --time-type zulu
+    python visitor_analytics_visualizer.py --engine=cube --since 2026-01-01 --until 2026-02-01
+
+    cube = load_cube() or build_cube_from_db(db)
+    result = cube.heatmaps(since, until, 'local', sources=['visitors'])   # {'dow', 'dom', 'events'}
+
+Requirements:
+    pip install pymongo numpy
+"""
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from heatmap_builder import DAY_INDEX, DAYS_ORDER
+from history_pipeline import (
+    HISTORY_COLLECTIONS,
+    _hour_index,
+    build_time_match,
+    event_timestamp,
+    parse_timestamp,
+    time_fields,
+)
+
+CUBE_VERSION = 1
+DEFAULT_CUBE_PATH = os.getenv('HISTORY_CUBE_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'history_cube.npz'
+)
+SETTLE_SECONDS = 120
+
+SOURCES = ('visitors', 'logins')
+GEO_SOURCES = ('GoogleBrowser', 'GoogleGeolocation', 'IPInfoIO', 'Unknown')
+NO_LOCAL = 127                # key offset for events without local day/hour fields
+HOURS_PER_WEEK = 168
+PAD_HOURS = 48                # room for day-of-month shifts at both ends of the axis
+EPOCH_SUNDAY = datetime(1970, 1, 4)
+
+DATABASE_NAME = 'TangoTiempoProd'
+
+
+def _hour_number(moment):
+    """Whole hours since 1970-01-04 00:00 UTC (a Sunday)"""
+    return int((moment - EPOCH_SUNDAY).total_seconds() // 3600)
+
+
+def _geo_index(value):
+    try:
+        return GEO_SOURCES.index(value)
+    except ValueError:
+        return GEO_SOURCES.index('Unknown')
+
+
+def local_key(timestamp, day_local, hour_local, dom_local):
+    """
+    (offset hours, day-of-month shift) of one event's local fields relative to
+    its UTC timestamp, or (NO_LOCAL, 0) when the local day/hour is missing
+    """
+    day_idx = DAY_INDEX.get(day_local)
+    hour = _hour_index(hour_local)
+    if day_idx is None or hour is None:
+        return NO_LOCAL, 0
+
+    zulu_slot = ((timestamp.weekday() + 1) % 7) * 24 + timestamp.hour
+    offset = (day_idx * 24 + hour - zulu_slot + 84) % HOURS_PER_WEEK - 84
+
+    shift = 0
+    try:
+        dom = int(dom_local) if dom_local is not None else None
+    except (TypeError, ValueError):
+        dom = None
+    if dom is not None:
+        for days in (0, 1, -1):
+            if (timestamp + timedelta(days=days)).day == dom:
+                shift = days
+                break
+    return offset, shift
+
+
+class _PeriodicPrefix:
+    """Prefix sums of an hourly series folded into (period, slot) - weeks x 168 or months x 744"""
+
+    def __init__(self, series, period_of, slot_of, slots):
+        self.series = series
+        self.slot_of = slot_of
+        self.slots = slots
+        periods = int(period_of[-1]) + 1
+        grid = np.zeros((periods, slots) + series.shape[1:], dtype=np.int64)
+        grid[period_of, slot_of] = series
+        self.prefix = np.concatenate([np.zeros((1,) + grid.shape[1:], dtype=np.int64), grid.cumsum(axis=0)])
+        self.period_start = np.append(np.flatnonzero(np.diff(period_of, prepend=-1)), len(series))
+
+    def _add_rows(self, out, start, stop):
+        if start < stop:
+            np.add.at(out, self.slot_of[start:stop], self.series[start:stop])
+
+    def query(self, start, stop):
+        """Per-slot sums of hours [start, stop) of the series"""
+        total = len(self.series)
+        start, stop = max(0, min(start, total)), max(0, min(stop, total))
+        out = np.zeros((self.slots,) + self.series.shape[1:], dtype=np.int64)
+        if start >= stop:
+            return out
+
+        first_full = int(np.searchsorted(self.period_start, start, side='left'))
+        end_full = int(np.searchsorted(self.period_start, stop, side='right')) - 1
+        if end_full <= first_full:
+            self._add_rows(out, start, stop)
+            return out
+
+        out += self.prefix[end_full] - self.prefix[first_full]
+        self._add_rows(out, start, int(self.period_start[first_full]))
+        self._add_rows(out, int(self.period_start[end_full]), stop)
+        return out
+
+
+class HistoryCube:
+    """Dense hourly counts [hour, source, geoSource, local key] plus their prefix structures"""
+
+    def __init__(self, origin, counts, keys, until=None):
+        self.origin = origin                       # naive UTC datetime, a Sunday 00:00
+        self.counts = counts                       # int32 [hours, sources, geo sources, keys]
+        self.keys = keys                           # int16 [keys, 2]: (offset hours, dom shift)
+        self.until = until                         # events before this are folded in
+        self._build_prefixes()
+
+    @classmethod
+    def from_arrays(cls, hours, sources, geos, offsets, shifts, weights, until=None):
+        """Cube from per-row arrays: absolute hour numbers, indices, local key parts and counts"""
+        hours = np.asarray(hours, dtype=np.int64)
+        if not len(hours):
+            origin_hour = _hour_number(datetime(2000, 1, 2))
+            hours = np.array([origin_hour])
+            sources, geos, offsets, shifts, weights = [0], [0], [NO_LOCAL], [0], [0]
+
+        origin_hour = (hours.min() - PAD_HOURS) // HOURS_PER_WEEK * HOURS_PER_WEEK
+        length = -(-(hours.max() + PAD_HOURS + 1 - origin_hour) // HOURS_PER_WEEK) * HOURS_PER_WEEK
+        pairs = np.stack([np.asarray(offsets, dtype=np.int16), np.asarray(shifts, dtype=np.int16)], axis=1)
+        keys, key_index = np.unique(pairs, axis=0, return_inverse=True)
+
+        counts = np.zeros((length, len(SOURCES), len(GEO_SOURCES), len(keys)), dtype=np.int32)
+        np.add.at(counts, (hours - origin_hour, np.asarray(sources), np.asarray(geos), key_index.ravel()),
+                  np.asarray(weights, dtype=np.int32))
+        origin = EPOCH_SUNDAY + timedelta(hours=int(origin_hour))
+        return cls(origin, counts, keys, until)
+
+    def _build_prefixes(self):
+        length = len(self.counts)
+        hours = np.arange(length)
+        by_source_geo = self.counts.sum(axis=3, dtype=np.int64)
+
+        # Totals: cumulative sum along time
+        self.hourly_prefix = np.concatenate([np.zeros((1,) + by_source_geo.shape[1:], dtype=np.int64),
+                                             by_source_geo.cumsum(axis=0)])
+
+        # Hour-of-week: the axis starts on a Sunday, so slot = hour % 168
+        week_of, week_slot = np.divmod(hours, HOURS_PER_WEEK)
+        self.week_zulu = _PeriodicPrefix(by_source_geo, week_of, week_slot, HOURS_PER_WEEK)
+        self.week_local = _PeriodicPrefix(self.counts, week_of, week_slot, HOURS_PER_WEEK)
+
+        # Day-of-month: slot = (day - 1) * 24 + hour within each calendar month
+        stamps = np.datetime64(self.origin, 'h') + hours
+        month_index = stamps.astype('datetime64[M]').astype(np.int64)
+        month_of = month_index - month_index[0]
+        day = (stamps.astype('datetime64[D]') - stamps.astype('datetime64[M]')).astype(np.int64)
+        month_slot = day * 24 + hours % 24
+        self.month_zulu = _PeriodicPrefix(by_source_geo, month_of, month_slot, 31 * 24)
+
+        # Local day-of-month: keys whose local date differs from the UTC date are
+        # stored `shift` days later, so their month slot is the local date's
+        self.local_dom_counts = self.counts
+        self.dom_shifts = sorted(set(int(shift) for shift in self.keys[:, 1]))
+        if self.dom_shifts != [0]:
+            shifted = np.zeros_like(self.counts)
+            for k, shift in enumerate(self.keys[:, 1]):
+                shifted[:, ..., k] = np.roll(self.counts[:, ..., k], int(shift) * 24, axis=0)
+            self.local_dom_counts = shifted
+        self.month_local = _PeriodicPrefix(self.local_dom_counts, month_of, month_slot, 31 * 24)
+
+    # ----------------------------------------------------------------- queries
+
+    def __len__(self):
+        return int(self.hourly_prefix[-1].sum())
+
+    def nbytes(self):
+        parts = [self.counts, self.hourly_prefix, self.week_zulu.prefix, self.week_local.prefix,
+                 self.month_zulu.prefix, self.month_local.prefix]
+        if self.local_dom_counts is not self.counts:
+            parts.append(self.local_dom_counts)
+        return sum(part.nbytes for part in parts)
+
+    @property
+    def first_hour(self):
+        return self.origin
+
+    @property
+    def last_hour(self):
+        return self.origin + timedelta(hours=len(self.counts))
+
+    def hour_range(self, since=None, until=None):
+        """[start, stop) hour indices of a naive UTC window (whole hours)"""
+        start = 0 if since is None else int((since - self.origin).total_seconds() // 3600)
+        stop = len(self.counts) if until is None else int((until - self.origin).total_seconds() // 3600)
+        return start, stop
+
+    def _selection(self, sources=None, geo_sources=None):
+        source_idx = [SOURCES.index(source) for source in (sources or SOURCES)]
+        geo_idx = [GEO_SOURCES.index(geo) for geo in (geo_sources or GEO_SOURCES)]
+        return source_idx, geo_idx
+
+    @staticmethod
+    def _select(values, source_idx, geo_idx):
+        """Sum a [slots, sources, geo sources, ...] array over the selected sources/geo sources"""
+        return values[:, source_idx][:, :, geo_idx].sum(axis=(1, 2))
+
+    def total(self, since=None, until=None, sources=None, geo_sources=None):
+        """Events in the window, O(1)"""
+        start, stop = self.hour_range(since, until)
+        start, stop = max(0, min(start, len(self.counts))), max(0, min(stop, len(self.counts)))
+        if start >= stop:
+            return 0
+        source_idx, geo_idx = self._selection(sources, geo_sources)
+        window = self.hourly_prefix[stop] - self.hourly_prefix[start]
+        return int(window[source_idx][:, geo_idx].sum())
+
+    def heatmaps(self, since=None, until=None, time_type='local', sources=None, geo_sources=None):
+        """
+        DOW (7x24) and DOM (31x24) cell counts for a window, same semantics as
+        history_pipeline.fetch_history_heatmaps(); returns {'dow', 'dom', 'events'}
+        """
+        start, stop = self.hour_range(since, until)
+        source_idx, geo_idx = self._selection(sources, geo_sources)
+
+        if time_type == 'zulu':
+            dow = self._select(self.week_zulu.query(start, stop)[..., None], source_idx, geo_idx)[:, 0]
+            dom = self._select(self.month_zulu.query(start, stop)[..., None], source_idx, geo_idx)[:, 0]
+        else:
+            dow = np.zeros(HOURS_PER_WEEK, dtype=np.int64)
+            by_key = self._select(self.week_local.query(start, stop), source_idx, geo_idx)
+            for k, (offset, _) in enumerate(self.keys):
+                if offset != NO_LOCAL:
+                    dow += np.roll(by_key[:, k], int(offset))
+
+            dom = np.zeros(31 * 24, dtype=np.int64)
+            for shift in self.dom_shifts:
+                by_key = self._select(self.month_local.query(start + shift * 24, stop + shift * 24),
+                                      source_idx, geo_idx)
+                for k, (offset, key_shift) in enumerate(self.keys):
+                    if offset != NO_LOCAL and key_shift == shift:
+                        dom += np.roll(by_key[:, k].reshape(31, 24), int(offset) % 24, axis=1).ravel()
+
+        return {
+            'dow': dow.reshape(7, 24),
+            'dom': dom.reshape(31, 24),
+            'events': self.total(since, until, sources, geo_sources),
+        }
+
+    def compare(self, since, until, shift=timedelta(weeks=52), time_type='local', sources=None, geo_sources=None):
+        """Heatmaps of a window and of the same window `shift` earlier (52 weeks keeps weekdays aligned)"""
+        current = self.heatmaps(since, until, time_type, sources, geo_sources)
+        previous = self.heatmaps(since - shift, until - shift, time_type, sources, geo_sources)
+        return current, previous
+
+    # ------------------------------------------------------------ maintenance
+
+    def rows(self):
+        """Non-zero cells as from_arrays() inputs (absolute hours), for merging cubes"""
+        hour, source, geo, key = np.nonzero(self.counts)
+        return (hour + _hour_number(self.origin), source, geo, self.keys[key, 0], self.keys[key, 1],
+                self.counts[hour, source, geo, key])
+
+    def merged(self, other):
+        """A new cube with both cubes' counts (other's `until` wins)"""
+        parts = list(zip(self.rows(), other.rows()))
+        return HistoryCube.from_arrays(*(np.concatenate(pair) for pair in parts), until=other.until)
+
+
+# --------------------------------------------------------------------- build
+
+def build_cube_pipeline(since=None, until=None):
+    """Server-side rows: events per UTC hour x geoSource x local fields"""
+    day_field, hour_field, dom_field = time_fields('local')
+    return [
+        {'$match': build_time_match(since, until)},
+        {'$group': {
+            '_id': {
+                'hour': {'$dateToString': {'format': '%Y-%m-%dT%H', 'date': '$timestamp'}},
+                'geo': '$geoSource',
+                'day': f'${day_field}',
+                'localHour': f'${hour_field}',
+                'dom': f'${dom_field}',
+            },
+            'count': {'$sum': 1}
+        }}
+    ]
+
+
+def event_rows(events, since=None, until=None):
+    """Python twin of build_cube_pipeline() for backups and synthetic events (one row per event)"""
+    day_field, hour_field, dom_field = time_fields('local')
+    for event in events:
+        timestamp = event_timestamp(event.get('timestamp'))
+        if timestamp is None or (since is not None and timestamp < since) \
+                or (until is not None and timestamp >= until):
+            continue
+        yield {'_id': {'hour': timestamp.strftime('%Y-%m-%dT%H'), 'geo': event.get('geoSource'),
+                       'day': event.get(day_field), 'localHour': event.get(hour_field),
+                       'dom': event.get(dom_field)},
+               'count': 1}
+
+
+class CubeRows:
+    """Collects grouped rows of any source into from_arrays() columns"""
+
+    def __init__(self):
+        self.columns = ([], [], [], [], [], [])
+
+    def add(self, rows, source):
+        source_idx = SOURCES.index(source)
+        hours, sources, geos, offsets, shifts, weights = self.columns
+        for row in rows:
+            key = row['_id']
+            try:
+                timestamp = datetime.strptime(key['hour'], '%Y-%m-%dT%H')
+            except (TypeError, ValueError):
+                continue
+            offset, shift = local_key(timestamp, key.get('day'), key.get('localHour'), key.get('dom'))
+            hours.append(_hour_number(timestamp))
+            sources.append(source_idx)
+            geos.append(_geo_index(key.get('geo')))
+            offsets.append(offset)
+            shifts.append(shift)
+            weights.append(row['count'])
+        return self
+
+    def to_cube(self, until=None):
+        return HistoryCube.from_arrays(*self.columns, until=until)
+
+
+def cube_boundary(now=None, settle_seconds=SETTLE_SECONDS):
+    """Events are folded up to now - settle (late writers from other instances)"""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    return now - timedelta(seconds=settle_seconds)
+
+
+def build_cube_from_db(db, since=None, until=None):
+    """Cube of both history collections in [since, until) (until defaults to cube_boundary())"""
+    until = until or cube_boundary()
+    rows = CubeRows()
+    for source in SOURCES:
+        collection = db[HISTORY_COLLECTIONS[source]]
+        rows.add(collection.aggregate(build_cube_pipeline(since, until), allowDiskUse=True), source)
+    return rows.to_cube(until)
+
+
+def build_cube_from_events(events_by_source, since=None, until=None):
+    """Cube from {'visitors': events, 'logins': events} iterables (backup files, synthetic data)"""
+    rows = CubeRows()
+    for source, events in events_by_source.items():
+        rows.add(event_rows(events, since, until), source)
+    return rows.to_cube(until)
+
+
+def refresh_cube(db, cube, now=None):
+    """Fold events from cube.until to a new boundary into a new cube"""
+    boundary = cube_boundary(now)
+    if cube.until is not None and boundary <= cube.until:
+        return cube
+    return cube.merged(build_cube_from_db(db, since=cube.until, until=boundary))
+
+
+def save_cube(cube, path=DEFAULT_CUBE_PATH):
+    """Write the counts (prefix structures are rebuilt on load) atomically"""
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(
+        tmp_path,
+        version=CUBE_VERSION,
+        origin=np.datetime64(cube.origin, 's'),
+        until=np.datetime64(cube.until, 's') if cube.until else np.datetime64('NaT', 's'),
+        counts=cube.counts,
+        keys=cube.keys,
+    )
+    os.replace(tmp_path, path)
+
+
+def load_cube(path=DEFAULT_CUBE_PATH):
+    """Saved cube, or None when missing or from another version"""
+    try:
+        with np.load(path) as data:
+            if int(data['version']) != CUBE_VERSION:
+                print(f"⚠️  Ignoring {path}: cube version {int(data['version'])}")
+                return None
+            until = None if np.isnat(data['until']) else data['until'].item()
+            return HistoryCube(data['origin'].item(), data['counts'], data['keys'], until)
+    except FileNotFoundError:
+        return None
+
+
+# ----------------------------------------------------------------------- CLI
+
+def add_cube_arguments(parser):
+    """Register the cube file options on an argparse parser"""
+    parser.add_argument('--cube-path', type=str, default=DEFAULT_CUBE_PATH,
+                        help='History cube file for --engine=cube (default: scripts/history_cube.npz)')
+    parser.add_argument('--rebuild-cube', action='store_true', help='Rebuild the history cube from scratch')
+
+
+def update_cube(db, args, backup_path=None):
+    """Load the saved cube and fold in new events, or build it (from MongoDB or a backup file)"""
+    started = time.perf_counter()
+    if backup_path:
+        from backup_source import iter_backup_documents
+
+        cube = build_cube_from_events({
+            source: iter_backup_documents(backup_path, HISTORY_COLLECTIONS[source]) for source in SOURCES
+        })
+        action = 'Built history cube from backup'
+    else:
+        cube = None if args.rebuild_cube else load_cube(args.cube_path)
+        if cube is None:
+            cube, action = build_cube_from_db(db), 'Built history cube'
+        else:
+            cube, action = refresh_cube(db, cube), 'Refreshed history cube'
+        save_cube(cube, args.cube_path)
+
+    print(f"✅ {action}: {len(cube):,} events, {len(cube.counts):,} hours x "
+          f"{len(cube.keys)} local keys, {cube.nbytes() / 1e6:.1f} MB, {time.perf_counter() - started:.1f}s")
+    return cube
+
+
+def _peak_text(dow):
+    day_idx, hour = np.unravel_index(int(dow.argmax()), dow.shape)
+    return f"{DAYS_ORDER[day_idx]} {hour:02d}:00 ({dow[day_idx, hour]})" if dow.max() else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query any time window of the hourly history cube')
+    parser.add_argument('--since', type=parse_timestamp, help='ISO start (inclusive, default: cube start)')
+    parser.add_argument('--until', type=parse_timestamp, help='ISO end (exclusive, default: cube end)')
+    parser.add_argument('--time-type', choices=['local', 'zulu'], default='local', help='Time type')
+    parser.add_argument('--sources', default=','.join(SOURCES), help='Comma-separated: visitors,logins')
+    parser.add_argument('--geo-sources', help=f"Comma-separated from {', '.join(GEO_SOURCES)} (default: all)")
+    parser.add_argument('--compare-weeks', type=int,
+                        help='Also show the same window this many weeks earlier (52 = same week last year)')
+    parser.add_argument('--backup', type=str, help='Build from a Backup_MongoDB .json.gz file (not saved)')
+    parser.add_argument('--synthetic', type=int, metavar='EVENTS',
+                        help='Build from synthetic visitor history (synthetic_data.py; not saved)')
+    add_cube_arguments(parser)
+    args = parser.parse_args()
+
+    sources = args.sources.split(',')
+    geo_sources = args.geo_sources.split(',') if args.geo_sources else None
+    if not set(sources) <= set(SOURCES) or not set(geo_sources or ()) <= set(GEO_SOURCES):
+        parser.error(f"--sources from {', '.join(SOURCES)}; --geo-sources from {', '.join(GEO_SOURCES)}")
+
+    if args.synthetic:
+        from synthetic_data import synthetic_visitor_history
+
+        started = time.perf_counter()
+        cube = build_cube_from_events({'visitors': synthetic_visitor_history(args.synthetic)})
+        print(f"✅ Built history cube from {len(cube):,} synthetic events in {time.perf_counter() - started:.1f}s")
+    elif args.backup:
+        cube = update_cube(None, args, backup_path=args.backup)
+    else:
+        mongodb_uri = os.getenv('MONGODB_URI_PROD')
+        if not mongodb_uri:
+            print("ERROR: MONGODB_URI_PROD environment variable not set (or use --backup / --synthetic)")
+            return 1
+        from pymongo import MongoClient
+
+        client = MongoClient(mongodb_uri)
+        try:
+            cube = update_cube(client[DATABASE_NAME], args)
+        finally:
+            client.close()
+
+    windows = [('window', args.since, args.until)]
+    if args.compare_weeks:
+        if args.since is None or args.until is None:
+            parser.error('--compare-weeks needs --since and --until')
+        shift = timedelta(weeks=args.compare_weeks)
+        windows.append((f'-{args.compare_weeks}w', args.since - shift, args.until - shift))
+
+    print(f"\n{'':8} {'since':>19} {'until':>19} {'events':>10} {'peak':>22} {'query ms':>9}")
+    for label, since, until in windows:
+        started = time.perf_counter()
+        result = cube.heatmaps(since, until, args.time_type, sources, geo_sources)
+        elapsed = (time.perf_counter() - started) * 1000
+        since_text = (since or cube.first_hour).strftime('%Y-%m-%d %H:%M')
+        until_text = (until or cube.last_hour).strftime('%Y-%m-%d %H:%M')
+        print(f"{label:8} {since_text:>19} {until_text:>19} {result['events']:>10,} "
+              f"{_peak_text(result['dow']):>22} {elapsed:>9.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+History Pipeline
+Exact day x hour heatmaps computed server-side from VisitorTrackingHistory
+
+The analytics-collection heatmap approximates the day/hour joint distribution
+from per-visitor counters. Every VisitorTrackingHistory (and UserLoginHistory)
+event already carries `dayOfWeek*`, `hourOfDay*`, `dayOfMonth*` and
+`timestamp`, so a `$match`/`$group` aggregation can count the cells exactly
+inside MongoDB. Only the grouped rows (<= 168 for 7x24, <= 744 for 31x24)
+cross the wire.
+
+Field handling mirrors aggregateHistoryData() in
+src/functions/Analytics_VisitorHeatmap.js, including the day-of-month
+fallback to the UTC date of `timestamp`.
+
+Requirements:
+    pip install pymongo numpy pandas
+"""
+
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import re
+
+import numpy as np
+import pandas as pd
+
+from heatmap_builder import DAY_INDEX, HOURS, heatmap_to_frame
+
+HISTORY_COLLECTIONS = {
+    'visitors': 'VisitorTrackingHistory',
+    'logins': 'UserLoginHistory',
+}
+
+RANGE_PATTERN = re.compile(r'^(\d+)(H|D|W|M|YR)$', re.IGNORECASE)
+
+
+def time_fields(time_type='local'):
+    """Return (dayOfWeek, hourOfDay, dayOfMonth) field names for a time type"""
+    suffix = 'Local' if time_type == 'local' else 'Zulu'
+    return f'dayOfWeek{suffix}', f'hourOfDay{suffix}', f'dayOfMonth{suffix}'
+
+
+def _subtract_months(moment, months):
+    """Step back whole months, clamping the day to the target month's length"""
+    month_index = moment.year * 12 + (moment.month - 1) - months
+    year, month = divmod(month_index, 12)
+    day = min(moment.day, calendar.monthrange(year, month + 1)[1])
+    return moment.replace(year=year, month=month + 1, day=day)
+
+
+def parse_range(range_param, now=None):
+    """
+    Convert an endpoint-style range ("24H", "7D", "2W", "3M", "1Yr", "All")
+    into a naive UTC cutoff datetime, or None for all time.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    range_param = (range_param or 'All').upper()
+
+    if range_param == 'ALL':
+        return None
+
+    match = RANGE_PATTERN.match(range_param)
+    if not match:
+        raise ValueError(f"Invalid range '{range_param}' (expected e.g. 24H, 7D, 2W, 3M, 1Yr, All)")
+
+    num = int(match.group(1))
+    unit = match.group(2).upper()
+
+    if unit == 'H':
+        return now - timedelta(hours=num)
+    if unit == 'D':
+        return now - timedelta(days=num)
+    if unit == 'W':
+        return now - timedelta(weeks=num)
+    if unit == 'M':
+        return _subtract_months(now, num)
+    return _subtract_months(now, num * 12)
+
+
+def parse_timestamp(value):
+    """Parse an ISO date/datetime string into a naive UTC datetime"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def build_time_match(since=None, until=None):
+    """Build the `$match` filter on `timestamp` for a [since, until) window"""
+    window = {}
+    if since is not None:
+        window['$gte'] = since
+    if until is not None:
+        window['$lt'] = until
+    return {'timestamp': window} if window else {}
+
+
+def build_heatmap_pipeline(time_type='local', since=None, until=None, match=None):
+    """
+    Aggregation that returns both the DOW (7x24) and DOM (31x24) cell counts.
+
+    `match` adds extra filter conditions (e.g. an `_id` window) to the time filter.
+    """
+    day_field, hour_field, dom_field = time_fields(time_type)
+
+    return [
+        {'$match': {**build_time_match(since, until), **(match or {})}},
+        {'$facet': {
+            'dow': [
+                {'$group': {
+                    '_id': {'day': f'${day_field}', 'hour': f'${hour_field}'},
+                    'count': {'$sum': 1}
+                }}
+            ],
+            'dom': [
+                {'$group': {
+                    '_id': {
+                        'dom': {'$ifNull': [f'${dom_field}', {'$dayOfMonth': '$timestamp'}]},
+                        'hour': f'${hour_field}'
+                    },
+                    'count': {'$sum': 1}
+                }}
+            ],
+            'total': [
+                {'$count': 'events'}
+            ]
+        }}
+    ]
+
+
+def _hour_index(value):
+    """Hours may be stored as ints or numeric strings; return 0-23 or None"""
+    try:
+        hour = int(value)
+    except (TypeError, ValueError):
+        return None
+    return hour if 0 <= hour < 24 else None
+
+
+def matrices_from_groups(result):
+    """Fold `$facet` output into (dow[7, 24], dom[31, 24], event_count) arrays"""
+    dow = np.zeros((7, 24), dtype=np.int64)
+    dom = np.zeros((31, 24), dtype=np.int64)
+
+    for row in result.get('dow', []):
+        day_idx = DAY_INDEX.get(row['_id'].get('day'))
+        hour = _hour_index(row['_id'].get('hour'))
+        if day_idx is not None and hour is not None:
+            dow[day_idx, hour] += row['count']
+
+    for row in result.get('dom', []):
+        hour = _hour_index(row['_id'].get('hour'))
+        try:
+            day_of_month = int(row['_id'].get('dom'))
+        except (TypeError, ValueError):
+            continue
+        if hour is not None and 1 <= day_of_month <= 31:
+            dom[day_of_month - 1, hour] += row['count']
+
+    total = result.get('total') or [{}]
+    return dow, dom, total[0].get('events', 0)
+
+
+def event_timestamp(value):
+    """Naive UTC datetime from a BSON date or an ISO string (backup files)"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    if isinstance(value, str):
+        try:
+            return parse_timestamp(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return None
+
+
+def aggregate_history_events(events, time_type='local', since=None, until=None):
+    """
+    Python twin of build_heatmap_pipeline() for sources without a server
+    (e.g. backup files). Returns (dow[7, 24], dom[31, 24], event_count).
+    """
+    day_field, hour_field, dom_field = time_fields(time_type)
+    dow = np.zeros((7, 24), dtype=np.int64)
+    dom = np.zeros((31, 24), dtype=np.int64)
+    event_count = 0
+
+    for event in events:
+        timestamp = event_timestamp(event.get('timestamp'))
+        if since is not None and (timestamp is None or timestamp < since):
+            continue
+        if until is not None and (timestamp is None or timestamp >= until):
+            continue
+        event_count += 1
+
+        hour = _hour_index(event.get(hour_field))
+        if hour is None:
+            continue
+
+        day_idx = DAY_INDEX.get(event.get(day_field))
+        if day_idx is not None:
+            dow[day_idx, hour] += 1
+
+        day_of_month = event.get(dom_field)
+        if day_of_month is None and timestamp is not None:
+            day_of_month = timestamp.day
+        try:
+            day_of_month = int(day_of_month)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= day_of_month <= 31:
+            dom[day_of_month - 1, hour] += 1
+
+    return dow, dom, event_count
+
+
+def dow_to_frame(dow):
+    """7x24 day-of-week matrix -> 24 (hours) x 7 (days) DataFrame"""
+    return heatmap_to_frame(dow.T.astype(np.float64))
+
+
+def dom_to_frame(dom):
+    """31x24 day-of-month matrix -> 24 (hours) x 31 (days 1-31) DataFrame"""
+    return pd.DataFrame(dom.T.astype(np.float64), index=HOURS, columns=list(range(1, 32)))
+
+
+def run_heatmap_pipeline(collection, time_type='local', since=None, until=None, match=None):
+    """Run the aggregation on one history collection"""
+    pipeline = build_heatmap_pipeline(time_type, since, until, match)
+    results = list(collection.aggregate(pipeline, allowDiskUse=True))
+    return matrices_from_groups(results[0] if results else {})
+
+
+def fetch_history_heatmaps(db, time_type='local', since=None, until=None,
+                           include_visitors=True, include_logins=False):
+    """
+    Aggregate the selected history collections and merge them the way the
+    endpoint's mergeMatrices()/mergeDomMatrices() do (cell-wise sum).
+
+    Returns {'dow': 7x24, 'dom': 31x24, 'sources': {collection: events}}.
+    """
+    dow = np.zeros((7, 24), dtype=np.int64)
+    dom = np.zeros((31, 24), dtype=np.int64)
+    sources = {}
+
+    selected = []
+    if include_visitors:
+        selected.append(HISTORY_COLLECTIONS['visitors'])
+    if include_logins:
+        selected.append(HISTORY_COLLECTIONS['logins'])
+
+    # One aggregation per collection, run concurrently on the client's connection pool
+    with ThreadPoolExecutor(max_workers=max(len(selected), 1)) as executor:
+        parts = executor.map(lambda name: run_heatmap_pipeline(db[name], time_type, since, until), selected)
+        for name, (part_dow, part_dom, events) in zip(selected, parts):
+            dow += part_dow
+            dom += part_dom
+            sources[name] = events
+
+    return {'dow': dow, 'dom': dom, 'sources': sources}
+
+
+def build_daily_pipeline(time_type='local', since=None, until=None):
+    """
+    Aggregation of the DOW x hour cells per UTC calendar date of `timestamp`,
+    for per-day heatmap frames (<= 168 rows per date)
+    """
+    day_field, hour_field, _ = time_fields(time_type)
+
+    return [
+        {'$match': build_time_match(since, until)},
+        {'$group': {
+            '_id': {
+                'date': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp'}},
+                'day': f'${day_field}',
+                'hour': f'${hour_field}'
+            },
+            'count': {'$sum': 1}
+        }}
+    ]
+
+
+def daily_matrices_from_groups(rows, first_day, days):
+    """Fold build_daily_pipeline() rows into a dense [days, 7, 24] array starting at first_day (a date)"""
+    counts = np.zeros((days, 7, 24), dtype=np.int64)
+    for row in rows:
+        key = row['_id']
+        day_idx = DAY_INDEX.get(key.get('day'))
+        hour = _hour_index(key.get('hour'))
+        try:
+            offset = (datetime.strptime(key.get('date') or '', '%Y-%m-%d').date() - first_day).days
+        except ValueError:
+            continue
+        if day_idx is not None and hour is not None and 0 <= offset < days:
+            counts[offset, day_idx, hour] += row['count']
+    return counts
+
+
+def aggregate_daily_history_events(events, first_day, days, time_type='local'):
+    """Python twin of build_daily_pipeline() + daily_matrices_from_groups()"""
+    day_field, hour_field, _ = time_fields(time_type)
+    counts = np.zeros((days, 7, 24), dtype=np.int64)
+
+    for event in events:
+        timestamp = event_timestamp(event.get('timestamp'))
+        if timestamp is None:
+            continue
+        offset = (timestamp.date() - first_day).days
+        day_idx = DAY_INDEX.get(event.get(day_field))
+        hour = _hour_index(event.get(hour_field))
+        if day_idx is not None and hour is not None and 0 <= offset < days:
+            counts[offset, day_idx, hour] += 1
+
+    return counts
+
+
+def fetch_daily_heatmaps(db, first_day, days, time_type='local', include_visitors=True, include_logins=False):
+    """Per-day [days, 7, 24] cell counts of the selected history collections, merged"""
+    since = datetime(first_day.year, first_day.month, first_day.day)
+    until = since + timedelta(days=days)
+    counts = np.zeros((days, 7, 24), dtype=np.int64)
+
+    selected = []
+    if include_visitors:
+        selected.append(HISTORY_COLLECTIONS['visitors'])
+    if include_logins:
+        selected.append(HISTORY_COLLECTIONS['logins'])
+
+    for name in selected:
+        rows = db[name].aggregate(build_daily_pipeline(time_type, since, until), allowDiskUse=True)
+        counts += daily_matrices_from_groups(rows, first_day, days)
+
+    return counts
+
+
+def add_pipeline_arguments(parser):
+    """Register the --engine and time-window options on an argparse parser"""
+    parser.add_argument('--engine', choices=['analytics', 'pipeline', 'snapshot', 'cube'], default='analytics',
+                        help='analytics: approximate heatmap from VisitorTrackingAnalytics counters; '
+                             'pipeline: exact counts aggregated in MongoDB from history events; '
+                             'snapshot: all-time exact counts from the incremental heatmap snapshot; '
+                             'cube: exact counts for any window from the hourly history cube')
+    parser.add_argument('--time-type', choices=['local', 'zulu'], default='local',
+                        help='Time type for --engine=pipeline/snapshot/cube (default: local)')
+    parser.add_argument('--range', default='All',
+                        help='Time range for --engine=pipeline/cube, e.g. 24H, 7D, 3M, 1Yr, All (default: All)')
+    parser.add_argument('--since', type=parse_timestamp,
+                        help='ISO start (inclusive) for --engine=pipeline/cube; overrides --range')
+    parser.add_argument('--until', type=parse_timestamp,
+                        help='ISO end (exclusive) for --engine=pipeline/cube')
+    parser.add_argument('--include-logins', action='store_true',
+                        help='Also include logins: UserLoginHistory with --engine=pipeline/snapshot/cube, '
+                             'UserLoginAnalytics counters with --engine=analytics')
+
+
+def pipeline_window(args):
+    """Resolve (since, until) from parsed --range/--since/--until options"""
+    since = args.since if args.since is not None else parse_range(args.range)
+    return since, args.until
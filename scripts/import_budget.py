@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Import Budget
+Measures cold start-up of the analytics CLIs and checks it against a budget
+
+Each check runs in a fresh interpreter with `python -X importtime`. The wall
+time (best of --runs) is compared with the budget, and the import log is
+scanned for libraries that path must not load (the plotting / Dash stack for
+--help and --summary-only). `visualize_heatmap.py --summary-only` is pointed at
+the local stand-in endpoint (heatmap_stub_server.py), so no network access is
+needed.
+
+Timings depend on the machine and interpreter; run `python import_budget.py
+--runs N` for current numbers. Most of the visualizers' remaining cost is
+numpy + pandas, which every data path needs.
+
+Usage:
+    python import_budget.py             # table; exit code 1 if any check fails
+    python import_budget.py --runs 5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from heatmap_stub_server import start_stub_server
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPTS_DIR)
+
+PLOTTING_STACK = ('matplotlib', 'seaborn', 'plotly', 'dash', 'dash_bootstrap_components')
+
+# (label, argv after the interpreter, wall-time budget in ms, modules that must not be imported)
+CHECKS = [
+    ('visualize_heatmap.py --help',
+     [os.path.join(ROOT_DIR, 'visualize_heatmap.py'), '--help'],
+     300, PLOTTING_STACK + ('numpy', 'requests', 'pymongo')),
+    ('visualize_heatmap.py --summary-only',
+     [os.path.join(ROOT_DIR, 'visualize_heatmap.py'), '--summary-only', '--url', '{url}'],
+     500, PLOTTING_STACK + ('numpy', 'pymongo')),
+    ('visitor_analytics_visualizer.py --help',
+     [os.path.join(SCRIPTS_DIR, 'visitor_analytics_visualizer.py'), '--help'],
+     1200, PLOTTING_STACK + ('pymongo',)),
+    ('test_visualization.py --help',
+     [os.path.join(SCRIPTS_DIR, 'test_visualization.py'), '--help'],
+     1200, PLOTTING_STACK + ('pymongo',)),
+]
+
+def imported_modules(importtime_log):
+    """Top-level package names from a -X importtime stderr log"""
+    modules = set()
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        name = line.rsplit('|', 1)[1].strip()
+        if name and name != 'imported package':
+            modules.add(name.split('.')[0])
+    return modules
+
+
+def run_check(argv, runs):
+    """Best wall time (ms) over `runs`, plus the modules imported on the last run"""
+    best = None
+    modules = set()
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime'] + argv,
+                                capture_output=True, text=True, cwd=SCRIPTS_DIR)
+        elapsed = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} exited with {result.returncode}:\n{result.stdout}")
+        best = elapsed if best is None else min(best, elapsed)
+        modules = imported_modules(result.stderr)
+    return best, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check CLI start-up time against a budget')
+    parser.add_argument('--runs', type=int, default=3, help='Runs per check; the fastest counts (default: 3)')
+    args = parser.parse_args()
+
+    server, url = start_stub_server()
+    failures = 0
+    try:
+        print(f"{'check':<42} {'wall ms':>8} {'budget':>8}  result")
+        for label, argv, budget_ms, forbidden in CHECKS:
+            wall_ms, modules = run_check([arg.format(url=url) for arg in argv], args.runs)
+            loaded = sorted(modules.intersection(forbidden))
+            ok = wall_ms <= budget_ms and not loaded
+            failures += not ok
+            note = '✅' if ok else '❌' + (f" loaded {', '.join(loaded)}" if loaded else ' over budget')
+            print(f"{label:<42} {wall_ms:>8.0f} {budget_ms:>8}  {note}")
+    finally:
+        server.shutdown()
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Local Time
+Recompute history events' local day / hour / day-of-month from the UTC
+timestamp and the visitor's IANA timezone
+
+Local heatmaps read dayOfWeekLocal / hourOfDayLocal / dayOfMonthLocal,
+written by VisitorTrack.js at event time. They are missing for older events
+and for browsers that sent no timezoneOffset, local hour 0 is stored as null
+(`hourOfDayLocal || null`), and dayOfMonthLocal is often absent so the day of
+month falls back to the UTC date. This stage rebuilds all three from
+`timestamp` plus the event's timezone (`ipinfo_timezone`, else the browser's
+`timezone`):
+
+1. One pass over the events collects columns: raw timestamps, zone names and
+   the stored local fields (no per-row datetime work).
+2. Timestamps are parsed in one pd.to_datetime call; zone names are
+   factorized and the rows sorted by zone.
+3. Each zone's rows are converted with one vectorized tz_convert, and day /
+   hour / day of month come out of integer arithmetic on the local seconds.
+
+Events without a usable zone keep their stored fields. The report counts
+every zone group's rows and, per event, whether the stored values matched,
+were corrected, were filled in (missing before) or could not be resolved.
+
+Usage:
+    python local_time.py --backup 2026-02-09T03-00-00_TangoTiempoProd.json.gz
+    python local_time.py --range 3M --include-logins         # MONGODB_URI_PROD
+    python local_time.py --synthetic 2M                       # synthetic_data.py events
+    python visitor_analytics_visualizer.py --engine=pipeline --recompute-local
+
+Requirements:
+    pip install numpy pandas (pymongo for MongoDB)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from heatmap_builder import DAY_INDEX, DAYS_ORDER
+from history_pipeline import (
+    HISTORY_COLLECTIONS,
+    build_time_match,
+    parse_range,
+    parse_timestamp,
+)
+
+DATABASE_NAME = 'TangoTiempoProd'
+ZONE_FIELDS = ('ipinfo_timezone', 'timezone')
+LOCAL_TIME_PROJECTION = {
+    'timestamp': 1,
+    'ipinfo_timezone': 1,
+    'timezone': 1,
+    'dayOfWeekLocal': 1,
+    'hourOfDayLocal': 1,
+    'dayOfMonthLocal': 1,
+}
+DEFAULT_EVENT_BATCH_SIZE = 10000
+SECONDS_PER_DAY = 86400
+EPOCH_DAY_OF_WEEK = 4         # 1970-01-01 was a Thursday (Sunday = 0)
+OUTCOMES = ('matched', 'corrected', 'filled', 'unresolved')
+
+
+def add_local_time_arguments(parser):
+    """Register --recompute-local on an argparse parser"""
+    parser.add_argument('--recompute-local', action='store_true',
+                        help='--engine=pipeline local time: recompute day/hour/day-of-month from timestamp and '
+                             'ipinfo_timezone instead of the stored *Local fields (local_time.py)')
+
+
+class EventTimes:
+    """UTC timestamps, zone codes and stored local fields of history events, as columns"""
+
+    def __init__(self, seconds, zone_codes, zones, day, hour, dom):
+        self.seconds = seconds              # int64 UTC epoch seconds
+        self.zone_codes = zone_codes        # int32 into `zones`, -1 = no zone
+        self.zones = zones                  # zone names
+        self.day = day                      # stored dayOfWeekLocal, Sunday = 0, -1 = missing
+        self.hour = hour                    # stored hourOfDayLocal, -1 = missing
+        self.dom = dom                      # stored dayOfMonthLocal, 0 = missing
+
+    def __len__(self):
+        return len(self.seconds)
+
+    @classmethod
+    def from_events(cls, events, since=None, until=None, zone_fields=ZONE_FIELDS):
+        """Collect the columns in one pass; parsing happens afterwards, vectorized"""
+        stamps, zones, days, hours, doms = [], [], [], [], []
+        for event in events:
+            zone = None
+            for field in zone_fields:
+                zone = event.get(field)
+                if zone:
+                    break
+            stamps.append(event.get('timestamp'))
+            zones.append(zone or None)
+            days.append(event.get('dayOfWeekLocal'))
+            hours.append(event.get('hourOfDayLocal'))
+            doms.append(event.get('dayOfMonthLocal'))
+
+        # BSON dates and ISO strings (backups) alike; unparsable ones become NaT
+        utc = pd.to_datetime(pd.Series(stamps, dtype=object), utc=True, errors='coerce', format='ISO8601')
+        keep = utc.notna().to_numpy()
+        if since is not None:
+            keep &= (utc >= pd.Timestamp(since, tz='UTC')).to_numpy()
+        if until is not None:
+            keep &= (utc < pd.Timestamp(until, tz='UTC')).to_numpy()
+
+        seconds = utc[keep].dt.tz_localize(None).to_numpy().astype('datetime64[s]').astype(np.int64)
+        codes, names = pd.factorize(pd.Series(zones, dtype=object)[keep])
+        day = pd.Series(days, dtype=object)[keep].map(DAY_INDEX).fillna(-1).to_numpy(np.int8)
+        hour = pd.to_numeric(pd.Series(hours, dtype=object)[keep], errors='coerce').to_numpy(np.float64)
+        hour = np.where((hour >= 0) & (hour < 24), hour, -1).astype(np.int8)
+        dom = pd.to_numeric(pd.Series(doms, dtype=object)[keep], errors='coerce').to_numpy(np.float64)
+        dom = np.where((dom >= 1) & (dom <= 31), dom, 0).astype(np.int8)
+        return cls(seconds, codes.astype(np.int32), list(names), day, hour, dom)
+
+
+def civil_fields(local_seconds):
+    """(day of week with Sunday = 0, hour, day of month) of local wall-clock epoch seconds"""
+    days = local_seconds // SECONDS_PER_DAY
+    hour = (local_seconds // 3600) % 24
+    day_of_week = (days + EPOCH_DAY_OF_WEEK) % 7
+    dates = days.astype('datetime64[D]')
+    day_of_month = (dates - dates.astype('datetime64[M]').astype('datetime64[D]')).astype(np.int64) + 1
+    return day_of_week.astype(np.int8), hour.astype(np.int8), day_of_month.astype(np.int8)
+
+
+class LocalTimes:
+    """Recomputed local fields per event plus per-zone row counts"""
+
+    def __init__(self, day, hour, dom, zone_rows, invalid_zones, missing_zone):
+        self.day = day
+        self.hour = hour
+        self.dom = dom
+        self.zone_rows = zone_rows          # {zone: rows converted}
+        self.invalid_zones = invalid_zones  # {zone: rows} for names tz data does not know
+        self.missing_zone = missing_zone    # rows without any zone field
+
+
+def recompute_local_times(times):
+    """One vectorized tz conversion per zone group; rows without a valid zone stay -1 / 0"""
+    count = len(times)
+    day = np.full(count, -1, dtype=np.int8)
+    hour = np.full(count, -1, dtype=np.int8)
+    dom = np.zeros(count, dtype=np.int8)
+
+    order = np.argsort(times.zone_codes, kind='stable')
+    bounds = np.searchsorted(times.zone_codes[order], np.arange(-1, len(times.zones) + 1))
+    utc = pd.DatetimeIndex(times.seconds.astype('datetime64[s]')).tz_localize('UTC')
+
+    zone_rows, invalid_zones = {}, {}
+    for code, zone in enumerate(times.zones):
+        rows = order[bounds[code + 1]:bounds[code + 2]]
+        try:
+            local = utc[rows].tz_convert(zone)
+        except (KeyError, ValueError):
+            # zoneinfo raises ZoneInfoNotFoundError (a KeyError) for unknown names
+            invalid_zones[zone] = len(rows)
+            continue
+        local_seconds = local.tz_localize(None).to_numpy().astype('datetime64[s]').astype(np.int64)
+        day[rows], hour[rows], dom[rows] = civil_fields(local_seconds)
+        zone_rows[zone] = len(rows)
+
+    return LocalTimes(day, hour, dom, zone_rows, invalid_zones, int(bounds[1] - bounds[0]))
+
+
+def corrected_fields(times, local):
+    """
+    (day, hour, dom, outcomes) with recomputed values where a zone resolved
+    and the stored fields elsewhere; outcomes counts events per OUTCOMES entry
+    """
+    resolved = local.hour >= 0
+    stored = (times.day >= 0) & (times.hour >= 0)
+    same = stored & (times.day == local.day) & (times.hour == local.hour)
+    outcomes = {
+        'matched': int(np.count_nonzero(resolved & same)),
+        'corrected': int(np.count_nonzero(resolved & stored & ~same)),
+        'filled': int(np.count_nonzero(resolved & ~stored)),
+        'unresolved': int(np.count_nonzero(~resolved)),
+    }
+    day = np.where(resolved, local.day, times.day)
+    hour = np.where(resolved, local.hour, times.hour)
+    dom = np.where(resolved, local.dom, times.dom)
+    return day, hour, dom, outcomes
+
+
+def local_heatmaps(times, day, hour, dom):
+    """
+    (dow[7, 24], dom[31, 24]) like aggregate_history_events(): events without
+    an hour are skipped, a missing day of month falls back to the UTC date
+    """
+    has_hour = hour >= 0
+    in_dow = has_hour & (day >= 0)
+    dow = np.bincount(day[in_dow].astype(np.int64) * 24 + hour[in_dow], minlength=168).reshape(7, 24)
+
+    utc_dates = (times.seconds // SECONDS_PER_DAY).astype('datetime64[D]')
+    utc_dom = (utc_dates - utc_dates.astype('datetime64[M]').astype('datetime64[D]')).astype(np.int64) + 1
+    day_of_month = np.where(dom > 0, dom, utc_dom)
+    dom_matrix = np.bincount((day_of_month[has_hour] - 1) * 24 + hour[has_hour], minlength=744).reshape(31, 24)
+    return dow.astype(np.int64), dom_matrix.astype(np.int64)
+
+
+def recompute_history_heatmaps(events_by_name, since=None, until=None):
+    """
+    Local heatmaps from recomputed fields for {collection name: events}; same
+    shape as fetch_history_heatmaps() plus a 'recompute' report per collection
+    """
+    dow = np.zeros((7, 24), dtype=np.int64)
+    dom = np.zeros((31, 24), dtype=np.int64)
+    sources, reports = {}, {}
+
+    for name, events in events_by_name.items():
+        started = time.perf_counter()
+        times = EventTimes.from_events(events, since, until)
+        read_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        local = recompute_local_times(times)
+        day, hour, day_of_month, outcomes = corrected_fields(times, local)
+        part_dow, part_dom = local_heatmaps(times, day, hour, day_of_month)
+        recompute_seconds = time.perf_counter() - started
+
+        dow += part_dow
+        dom += part_dom
+        sources[name] = len(times)
+        reports[name] = {
+            'events': len(times),
+            'zones': local.zone_rows,
+            'invalidZones': local.invalid_zones,
+            'missingZone': local.missing_zone,
+            'outcomes': outcomes,
+            'readSeconds': read_seconds,
+            'recomputeSeconds': recompute_seconds,
+        }
+
+    return {'dow': dow, 'dom': dom, 'sources': sources, 'recompute': reports}
+
+
+def iter_history_events(collection, since=None, until=None, batch_size=DEFAULT_EVENT_BATCH_SIZE):
+    """Only the fields the recompute reads, in large cursor batches"""
+    cursor = collection.find(build_time_match(since, until), LOCAL_TIME_PROJECTION, batch_size=batch_size)
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def fetch_recomputed_heatmaps(db=None, since=None, until=None, include_visitors=True, include_logins=False,
+                              backup_path=None):
+    """recompute_history_heatmaps() over the selected history collections (MongoDB or a backup file)"""
+    selected = [HISTORY_COLLECTIONS[source] for source, wanted in
+                (('visitors', include_visitors), ('logins', include_logins)) if wanted]
+    if backup_path:
+        from backup_source import iter_backup_documents
+
+        events = {name: iter_backup_documents(backup_path, name) for name in selected}
+    else:
+        events = {name: iter_history_events(db[name], since, until) for name in selected}
+    return recompute_history_heatmaps(events, since, until)
+
+
+def print_recompute_report(reports, top=10):
+    """Zone groups (largest first) and outcome counts per collection"""
+    for name, report in reports.items():
+        events = report['events']
+        rate = events / report['recomputeSeconds'] if report['recomputeSeconds'] > 0 else 0
+        print(f"✅ Recomputed local time for {events:,} {name} events in {len(report['zones'])} timezone groups "
+              f"(read {report['readSeconds']:.2f}s, recompute {report['recomputeSeconds']:.2f}s, {rate:,.0f} events/s)")
+        for zone, rows in sorted(report['zones'].items(), key=lambda item: -item[1])[:top]:
+            print(f"   - {zone:<32} {rows:>11,}")
+        if len(report['zones']) > top:
+            others = sorted(report['zones'].values(), reverse=True)[top:]
+            print(f"   - {f'({len(others)} more zones)':<32} {sum(others):>11,}")
+        if report['invalidZones']:
+            print(f"   ⚠️  Unknown zones: " + ', '.join(f"{zone} ({rows:,})" for zone, rows in
+                                                     sorted(report['invalidZones'].items(), key=lambda item: -item[1])))
+        if report['missingZone']:
+            print(f"   ⚠️  No timezone: {report['missingZone']:,} events keep their stored local fields")
+        print('   ' + ', '.join(f"{outcome} {report['outcomes'][outcome]:,}" for outcome in OUTCOMES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute local day/hour/day-of-month for history events')
+    parser.add_argument('--backup', type=str, help='Read a Backup_MongoDB .json.gz file instead of MongoDB')
+    parser.add_argument('--synthetic', type=str, metavar='EVENTS',
+                        help='Use synthetic visitor history (synthetic_data.py), e.g. 2M')
+    parser.add_argument('--range', default='All', help='History range, e.g. 7D, 3M, 1Yr, All (default: All)')
+    parser.add_argument('--since', type=parse_timestamp, help='ISO start (inclusive); overrides --range')
+    parser.add_argument('--until', type=parse_timestamp, help='ISO end (exclusive)')
+    parser.add_argument('--include-logins', action='store_true', help='Also recompute UserLoginHistory')
+    parser.add_argument('--zones', type=int, default=10, help='Timezone groups listed per collection (default: 10)')
+    args = parser.parse_args()
+
+    since = args.since if args.since is not None else parse_range(args.range)
+    if args.synthetic:
+        from synthetic_data import parse_count, synthetic_visitor_history
+
+        events = {HISTORY_COLLECTIONS['visitors']: synthetic_visitor_history(parse_count(args.synthetic))}
+        result = recompute_history_heatmaps(events, since, args.until)
+    elif args.backup:
+        result = fetch_recomputed_heatmaps(since=since, until=args.until, include_logins=args.include_logins,
+                                           backup_path=args.backup)
+    else:
+        mongodb_uri = os.getenv('MONGODB_URI_PROD')
+        if not mongodb_uri:
+            print("ERROR: MONGODB_URI_PROD environment variable not set (or use --backup / --synthetic)")
+            return 1
+        from pymongo import MongoClient
+
+        client = MongoClient(mongodb_uri)
+        try:
+            result = fetch_recomputed_heatmaps(client[DATABASE_NAME], since, args.until,
+                                               include_logins=args.include_logins)
+        finally:
+            client.close()
+
+    print_recompute_report(result['recompute'], top=args.zones)
+    dow = result['dow']
+    day, hour = divmod(int(dow.argmax()), 24)
+    print(f"\n   Local 7x24: {dow.sum():,} events, peak {DAYS_ORDER[day]} {hour:02d}:00; "
+          f"31x24: {result['dom'].sum():,} events")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Map Aggregation
+Bounded-size map markers for large visitor sets
+
+prepare_map_data() yields one row per visitor per geo source. Plotting every
+row as its own marker stalls the browser at tens of thousands of visitors, so
+the map goes through two stages first:
+
+1. Exact dedup - rows with identical (source, lat, long) collapse into one
+   weighted marker (visitor count, summed totalVisits).
+2. Binning - if more than `max_points` markers remain, rows are grouped into
+   hex (or square grid) cells per source. The cell size starts from the data
+   extent and doubles until the marker count fits, so the plotted point count
+   is bounded no matter how many visitors there are. Each cell is drawn at the
+   centroid of its members.
+
+Hover text is assembled with vectorized string operations instead of a
+row-wise DataFrame.apply; the dashboard sends only the per-marker parts as
+customdata and formats them in the browser with a hovertemplate.
+
+Requirements:
+    pip install numpy pandas
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_POINTS = 5000
+BIN_MODES = ('hex', 'grid')
+
+AGGREGATED_COLUMNS = [
+    'lat', 'long', 'source', 'count', 'total_visits',
+    'ip', 'visitor_id', 'city', 'region', 'country',
+]
+
+SQRT3 = np.sqrt(3.0)
+
+
+def _first_columns(df):
+    """Representative (first) values kept for single-visitor hover text"""
+    return {column: 'first' for column in ('ip', 'visitor_id', 'city', 'region', 'country') if column in df}
+
+
+def dedupe_points(df):
+    """Collapse rows with identical (source, lat, long) into weighted markers"""
+    if df.empty:
+        return pd.DataFrame(columns=AGGREGATED_COLUMNS)
+
+    grouped = df.groupby(['source', 'lat', 'long'], sort=False, dropna=False, observed=True)
+    out = grouped.agg(
+        count=('lat', 'size'),
+        total_visits=('total_visits', 'sum'),
+        **{column: (column, how) for column, how in _first_columns(df).items()}
+    ).reset_index()
+    return out.reindex(columns=AGGREGATED_COLUMNS)
+
+
+def hex_cells(lat, long, size):
+    """Axial (q, r) coordinates of pointy-top hexagons of `size` degrees"""
+    x = np.asarray(long, dtype=np.float64)
+    y = np.asarray(lat, dtype=np.float64)
+
+    q = (SQRT3 / 3.0 * x - y / 3.0) / size
+    r = (2.0 / 3.0 * y) / size
+
+    # Cube rounding: round all three, then fix the coordinate with the largest error
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def grid_cells(lat, long, size):
+    """Square grid cell indices of `size` degrees"""
+    return (
+        np.floor(np.asarray(lat, dtype=np.float64) / size).astype(np.int64),
+        np.floor(np.asarray(long, dtype=np.float64) / size).astype(np.int64),
+    )
+
+
+def bin_points(points, size, mode='hex'):
+    """
+    Group weighted markers into cells per source. Cell position is the
+    visitor-weighted centroid of its members.
+    """
+    cell_fn = hex_cells if mode == 'hex' else grid_cells
+    cell_a, cell_b = cell_fn(points['lat'].values, points['long'].values, size)
+
+    weights = points['count'].values
+    binned = pd.DataFrame({
+        'source': points['source'].values,
+        'cell_a': cell_a,
+        'cell_b': cell_b,
+        'lat_w': points['lat'].values * weights,
+        'long_w': points['long'].values * weights,
+        'count': weights,
+        'total_visits': points['total_visits'].values,
+    })
+    for column in ('ip', 'visitor_id', 'city', 'region', 'country'):
+        binned[column] = points[column].values
+
+    grouped = binned.groupby(['source', 'cell_a', 'cell_b'], sort=False, observed=True).agg(
+        lat_w=('lat_w', 'sum'),
+        long_w=('long_w', 'sum'),
+        count=('count', 'sum'),
+        total_visits=('total_visits', 'sum'),
+        ip=('ip', 'first'),
+        visitor_id=('visitor_id', 'first'),
+        city=('city', 'first'),
+        region=('region', 'first'),
+        country=('country', 'first'),
+    ).reset_index()
+
+    grouped['lat'] = grouped['lat_w'] / grouped['count']
+    grouped['long'] = grouped['long_w'] / grouped['count']
+    return grouped.reindex(columns=AGGREGATED_COLUMNS)
+
+
+def _initial_cell_size(points, max_points):
+    """Cell size (degrees) that would give ~max_points cells over the data extent"""
+    lat_span = max(points['lat'].max() - points['lat'].min(), 1e-6)
+    long_span = max(points['long'].max() - points['long'].min(), 1e-6)
+    return max(np.sqrt(lat_span * long_span / max_points), 1e-4)
+
+
+def aggregate_map_points(df, max_points=DEFAULT_MAX_POINTS, mode='hex'):
+    """
+    Dedup, then bin until at most `max_points` markers remain.
+
+    Returns (aggregated DataFrame, cell size in degrees or None if no binning
+    was needed). `max_points` <= 0 disables binning (dedup only).
+    """
+    points = dedupe_points(df)
+    if max_points <= 0 or len(points) <= max_points:
+        return points, None
+
+    # At least one cell per source is always needed
+    max_points = max(max_points, points['source'].nunique())
+    size = _initial_cell_size(points, max_points)
+    while True:
+        binned = bin_points(points, size, mode)
+        if len(binned) <= max_points:
+            return binned, size
+        size *= 2
+
+
+def _text(values, missing='Unknown'):
+    """Column as strings, with missing values (None/NaN) shown as `missing`"""
+    return values.astype(object).where(values.notna(), missing).astype(str)
+
+
+def _hover_lines(df, include_visitor=True):
+    """(detail, location) hover lines per marker: IP / visitor for one visitor, the count for a cell"""
+    location = _text(df['city']) + ', ' + _text(df['region']) + ', ' + _text(df['country'])
+
+    single = 'IP: ' + _text(df['ip'], 'unknown')
+    if include_visitor:
+        visitor = _text(df['visitor_id'], 'N/A')
+        visitor_short = visitor.where(visitor == 'N/A', visitor.str[:8])
+        single = single + '<br>Visitor: ' + visitor_short + '...'
+    multi = 'Visitors: ' + df['count'].astype(str)
+
+    is_single = df['count'].values == 1
+    detail = np.where(is_single, single.values, multi.values)
+    location_line = np.where(is_single, ('Location: ' + location).values, ('e.g. ' + location).values)
+    return detail, location_line
+
+
+def map_hover_text(df, include_visitor=True):
+    """Hover strings for aggregated markers, built column-wise"""
+    if df.empty:
+        return pd.Series([], dtype=object)
+
+    detail, location_line = _hover_lines(df, include_visitor)
+    text = ('<b>' + df['source'].astype(str) + '</b><br>' + detail + '<br>' + location_line
+            + '<br>Total Visits: ' + df['total_visits'].astype(str))
+    return pd.Series(text.values, index=df.index)
+
+
+def map_hover_template(source):
+    """hovertemplate for one source's trace; the per-marker parts come from map_hover_customdata()"""
+    return (f'<b>{source}</b><br>%{{customdata[0]}}<br>%{{customdata[1]}}'
+            '<br>Total Visits: %{customdata[2]}<extra></extra>')
+
+
+def map_hover_customdata(df, include_visitor=True):
+    """
+    [detail, location, total visits] per marker. The browser renders the hover
+    from map_hover_template(), so the source name and labels are sent once per
+    trace instead of once per marker.
+    """
+    customdata = np.empty((len(df), 3), dtype=object)
+    if df.empty:
+        return customdata
+    customdata[:, 0], customdata[:, 1] = _hover_lines(df, include_visitor)
+    customdata[:, 2] = df['total_visits'].to_numpy().tolist()
+    return customdata
+
+
+def marker_sizes(counts):
+    """Marker diameter grows with log2(visitor count); 10px for a single visitor"""
+    return np.clip(10 + 4 * np.log2(np.maximum(np.asarray(counts, dtype=np.float64), 1)), 10, 40)
+
+
+def add_map_aggregation_arguments(parser):
+    """Register map aggregation options on an argparse parser"""
+    parser.add_argument('--max-map-points', type=int, default=DEFAULT_MAX_POINTS,
+                        help=f'Upper bound on plotted map markers; 0 = dedup only (default: {DEFAULT_MAX_POINTS})')
+    parser.add_argument('--map-bin', choices=BIN_MODES, default='hex',
+                        help='Cell shape used when the map has to be binned (default: hex)')
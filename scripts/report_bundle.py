@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Report Bundle
+One static, self-contained visitor analytics report: a single index.html, one
+copy of plotly.js and a compressed data sidecar per figure
+
+    visitor-report-2026-10-16T06-00-00/
+        index.html          tabs + a ~2 KB loader, no figure data
+        plotly.min.js       written once (or referenced with --report-plotlyjs)
+        figures/map.js      gzip'd figure JSON (typed arrays), base64 in a script
+        figures/heatmap.js
+        ...
+
+write_html() embeds the whole plotly.js bundle (~4.5 MB) and the figure JSON
+in every file. Here plotly.js is stored once per bundle (or not at all when
+--report-plotlyjs points at a shared copy, e.g. '../plotly.min.js' in the
+archive folder), and each figure's data is a sidecar that loads when its tab
+is first opened. Sidecars are <script> files rather than fetch()ed JSON so
+the report also opens from file:// (an email attachment, an archive share);
+the browser inflates them with DecompressionStream.
+
+--report-zip also packs the bundle into DIR.zip for mailing.
+
+Usage:
+    python test_visualization.py --report                          # reports/visitor-report-<utc time>/
+    python test_visualization.py --backup backup.json.gz --engine=pipeline --report reports/daily --report-zip
+    python test_visualization.py --cache-only --report --report-plotlyjs ../plotly.min.js
+
+Requirements:
+    pip install plotly numpy
+"""
+
+from datetime import datetime, timezone
+import base64
+import gzip
+import html
+import json
+import os
+import shutil
+import zipfile
+
+from figure_payload import compact_figure, figure_json
+
+DEFAULT_REPORT_DIR = 'reports'
+PLOTLYJS_NAME = 'plotly.min.js'
+FIGURES_DIR = 'figures'
+GZIP_LEVEL = 9
+BUNDLE_ENTRIES = {'index.html', PLOTLYJS_NAME, FIGURES_DIR}
+KB = 1024
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+  body {{ font-family: -apple-system, "Segoe UI", Roboto, sans-serif; margin: 0 24px 24px; color: #212529; }}
+  h1 {{ text-align: center; font-weight: 500; margin: 24px 0 4px; }}
+  .meta {{ text-align: center; color: #6c757d; font-size: 0.9em; margin-bottom: 16px; }}
+  nav {{ border-bottom: 1px solid #dee2e6; display: flex; flex-wrap: wrap; gap: 2px; }}
+  nav button {{ border: 1px solid transparent; border-radius: 6px 6px 0 0; background: none; padding: 8px 16px;
+               cursor: pointer; color: #0d6efd; font-size: 1em; margin-bottom: -1px; }}
+  nav button.active {{ border-color: #dee2e6 #dee2e6 #fff; background: #fff; color: #495057; }}
+  .figure {{ display: none; min-height: 400px; }}
+  .figure.active {{ display: block; }}
+  .status {{ text-align: center; color: #6c757d; padding: 48px; }}
+</style>
+<script src="{plotlyjs}"></script>
+</head>
+<body>
+<h1>{title}</h1>
+<div class="meta">{meta}</div>
+<nav>{buttons}</nav>
+{panels}
+<script>
+const figureSizes = {sizes};
+const requested = {{}};
+
+// Called by each figures/<name>.js sidecar with its gzip'd, base64 figure JSON
+window.reportFigure = async function (name, data) {{
+  const panel = document.getElementById('figure-' + name);
+  try {{
+    const bytes = Uint8Array.from(atob(data), (c) => c.charCodeAt(0));
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+    const figure = JSON.parse(await new Response(stream).text());
+    panel.innerHTML = '';
+    Plotly.newPlot(panel, figure.data, figure.layout, {{responsive: true}});
+  }} catch (error) {{
+    panel.innerHTML = '<div class="status">Could not load this figure: ' + error + '</div>';
+  }}
+}};
+
+function showTab(name) {{
+  document.querySelectorAll('nav button').forEach((b) => b.classList.toggle('active', b.dataset.name === name));
+  document.querySelectorAll('.figure').forEach((p) => p.classList.toggle('active', p.id === 'figure-' + name));
+  const panel = document.getElementById('figure-' + name);
+  if (!requested[name]) {{
+    requested[name] = true;
+    panel.innerHTML = '<div class="status">Loading (' + figureSizes[name] + ')...</div>';
+    const script = document.createElement('script');
+    script.src = '{figures_dir}/' + name + '.js';
+    script.onerror = () => {{ panel.innerHTML = '<div class="status">Missing {figures_dir}/' + name + '.js</div>'; }};
+    document.body.appendChild(script);
+  }} else if (panel.classList.contains('js-plotly-plot')) {{
+    Plotly.Plots.resize(panel);
+  }}
+}}
+
+document.querySelectorAll('nav button').forEach((b) => b.addEventListener('click', () => showTab(b.dataset.name)));
+showTab({first});
+</script>
+</body>
+</html>
+"""
+
+
+def add_report_arguments(parser):
+    """Register --report, --report-zip and --report-plotlyjs on an argparse parser"""
+    parser.add_argument('--report', nargs='?', const='', metavar='DIR',
+                        help='Write one report bundle (index.html + plotly.js + lazy figure sidecars) instead of '
+                             f'separate HTML files (default DIR: {DEFAULT_REPORT_DIR}/visitor-report-<utc time>)')
+    parser.add_argument('--report-zip', action='store_true',
+                        help='Also pack the report bundle into DIR.zip')
+    parser.add_argument('--report-plotlyjs', metavar='SRC',
+                        help="Reference plotly.js at SRC (relative path or URL) instead of writing a copy "
+                             "into the bundle, e.g. '../plotly.min.js' shared by archived reports")
+
+
+def default_report_dir(now=None):
+    now = now or datetime.now(timezone.utc)
+    return os.path.join(DEFAULT_REPORT_DIR, f"visitor-report-{now.strftime('%Y-%m-%dT%H-%M-%S')}")
+
+
+def figure_sidecar(name, fig):
+    """Sidecar script body for one figure: typed-array JSON, gzip'd, base64'd"""
+    payload = gzip.compress(figure_json(compact_figure(fig)).encode('utf-8'), compresslevel=GZIP_LEVEL, mtime=0)
+    return f'reportFigure({json.dumps(name)}, "{base64.b64encode(payload).decode("ascii")}");\n'
+
+
+def _format_size(nbytes):
+    return f'{nbytes / KB / KB:.1f} MB' if nbytes >= KB * KB else f'{nbytes / KB:.0f} KB'
+
+
+def write_report_bundle(path, figures, title='Visitor Analytics Report', meta=None, plotlyjs=None,
+                        archive=False):
+    """
+    Write the bundle for `figures`, a list of (name, tab label, plotly figure)
+    in tab order (None figures are skipped). Returns {'path', 'files': {relative
+    path: bytes}, 'zip'}.
+    """
+    figures = [(name, label, fig) for name, label, fig in figures if fig is not None]
+    if not figures:
+        raise ValueError('A report needs at least one figure')
+    if os.path.exists(path) and not (os.path.isdir(path) and set(os.listdir(path)) <= BUNDLE_ENTRIES):
+        # Only ever replace an earlier report bundle
+        raise FileExistsError(f'{path} exists and is not a report bundle')
+
+    tmp_path = path.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_path, FIGURES_DIR))
+    files = {}
+
+    if plotlyjs is None:
+        from plotly.offline import get_plotlyjs
+
+        with open(os.path.join(tmp_path, PLOTLYJS_NAME), 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+        plotlyjs = PLOTLYJS_NAME
+
+    for name, _, fig in figures:
+        relative = f'{FIGURES_DIR}/{name}.js'
+        with open(os.path.join(tmp_path, relative), 'w', encoding='ascii') as f:
+            f.write(figure_sidecar(name, fig))
+
+    sizes = {name: _format_size(os.path.getsize(os.path.join(tmp_path, FIGURES_DIR, f'{name}.js')))
+             for name, _, _ in figures}
+    page = PAGE_TEMPLATE.format(
+        title=html.escape(title),
+        meta=' · '.join(html.escape(str(item)) for item in (meta or [])),
+        plotlyjs=html.escape(plotlyjs, quote=True),
+        buttons=''.join(f'<button data-name="{html.escape(name)}">{html.escape(label)}</button>'
+                        for name, label, _ in figures),
+        panels='\n'.join(f'<div class="figure" id="figure-{html.escape(name)}"></div>' for name, _, _ in figures),
+        sizes=json.dumps(sizes),
+        first=json.dumps(figures[0][0]),
+        figures_dir=FIGURES_DIR,
+    )
+    with open(os.path.join(tmp_path, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(page)
+
+    # Swap the finished bundle in, so a failed run never leaves half a report
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+    for root, _, names in os.walk(path):
+        for file_name in names:
+            full = os.path.join(root, file_name)
+            files[os.path.relpath(full, path).replace(os.sep, '/')] = os.path.getsize(full)
+
+    zip_path = None
+    if archive:
+        zip_path = path.rstrip(os.sep) + '.zip'
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+            for relative in sorted(files):
+                bundle.write(os.path.join(path, relative), os.path.join(os.path.basename(path), relative))
+
+    return {'path': path, 'files': files, 'zip': zip_path}
+
+
+def print_bundle_summary(result):
+    """Per-file sizes and the bundle total"""
+    files = result['files']
+    print(f"\n✅ Report bundle: {result['path']}/index.html")
+    for relative, nbytes in sorted(files.items(), key=lambda item: (not item[0].startswith('index'), item[0])):
+        print(f"   - {relative:<28} {_format_size(nbytes):>9}")
+    print(f"   {len(files)} files, {_format_size(sum(files.values()))} total")
+    if result['zip']:
+        print(f"   📦 {result['zip']} ({_format_size(os.path.getsize(result['zip']))})")
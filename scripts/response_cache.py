@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Response Cache
+On-disk TTL cache for GET /api/analytics/visitor-heatmap responses
+
+One JSON file per (URL, query parameters) under DEFAULT_RESPONSE_CACHE_DIR
+(scripts/response_cache/, or env HEATMAP_RESPONSE_CACHE_DIR):
+
+    {"url", "params", "storedAt", "etag", "lastModified", "body"}
+
+- Fresh entries (younger than the TTL) are served without a request.
+- Expired entries are revalidated with If-None-Match / If-Modified-Since when
+  the server sent validators; a 304 just restamps the entry. (The Azure
+  function currently sends only Cache-Control, so this mostly applies to
+  proxies and the stub server's --etag mode.)
+- If the request fails transiently (timeout, connection error, 5xx) an
+  expired entry younger than max_stale is served instead, with its age,
+  rather than failing the run. Client errors (4xx, `success: false`) and
+  older entries raise: a bad URL or a removed endpoint must not keep
+  answering from the cache.
+- Total size is bounded; the least recently used files (mtime is bumped on
+  every hit) are deleted first.
+
+Only the standard library is used, so the --summary-only path stays light.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_RESPONSE_CACHE_DIR = os.getenv('HEATMAP_RESPONSE_CACHE_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'response_cache'
+)
+DEFAULT_TTL_SECONDS = 3600          # the endpoint's Cache-Control max-age
+DEFAULT_MAX_STALE_SECONDS = 86400   # oldest entry served when the endpoint is down
+DEFAULT_MAX_MB = 50
+
+
+def cache_key(url, params):
+    """Stable key for a URL plus its query parameters (order-insensitive)"""
+    canonical = json.dumps([url, sorted((str(k), str(v)) for k, v in (params or {}).items())])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class CachedResponse:
+    """One stored response body plus its validators"""
+
+    def __init__(self, path, record):
+        self.path = path
+        self.record = record
+
+    @property
+    def body(self):
+        return self.record['body']
+
+    @property
+    def age(self):
+        return time.time() - self.record['storedAt']
+
+    def is_fresh(self, ttl):
+        return self.age < ttl
+
+    def usable_stale(self, max_stale):
+        """Young enough to stand in for a failed request"""
+        return self.age < max_stale
+
+    def conditional_headers(self):
+        headers = {}
+        if self.record.get('etag'):
+            headers['If-None-Match'] = self.record['etag']
+        if self.record.get('lastModified'):
+            headers['If-Modified-Since'] = self.record['lastModified']
+        return headers
+
+
+class ResponseCache:
+    """Directory of cached endpoint responses with TTL and a size bound"""
+
+    def __init__(self, path=DEFAULT_RESPONSE_CACHE_DIR, ttl=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_MB * 1024 * 1024,
+                 max_stale=DEFAULT_MAX_STALE_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stale': 0, 'stored': 0, 'evicted': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _file(self, url, params):
+        return os.path.join(self.path, f'{cache_key(url, params)}.json')
+
+    def get(self, url, params):
+        """Stored entry (fresh or not) or None; bumps its LRU position"""
+        path = self._file(url, params)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return CachedResponse(path, record)
+
+    def store(self, url, params, body, headers=None):
+        """Write a successful response atomically, then enforce the size bound"""
+        headers = headers or {}
+        record = {
+            'url': url,
+            'params': params,
+            'storedAt': time.time(),
+            'etag': headers.get('ETag'),
+            'lastModified': headers.get('Last-Modified'),
+            'body': body,
+        }
+        os.makedirs(self.path, exist_ok=True)
+        path = self._file(url, params)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+        self.count('stored')
+        self.evict()
+
+    def restamp(self, entry):
+        """Mark an entry fresh again after a 304 Not Modified"""
+        entry.record['storedAt'] = time.time()
+        tmp_path = f'{entry.path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry.record, f)
+        os.replace(tmp_path, entry.path)
+
+    def evict(self):
+        """Delete least recently used files until the directory fits max_bytes"""
+        files = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.count('evicted')
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def describe(self):
+        s = self.stats
+        return (f"Response cache: {s['hits']} fresh hits, {s['revalidated']} revalidated, "
+                f"{s['stale']} stale-on-error, {s['misses']} fetched, {s['evicted']} evicted")
+
+
+def add_response_cache_arguments(parser):
+    """Register response cache options on an argparse parser"""
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the response cache')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Ignore fresh cache entries and re-fetch (the result is still cached)')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_TTL_SECONDS,
+                        help=f'Seconds a cached response stays fresh (default: {DEFAULT_TTL_SECONDS})')
+    parser.add_argument('--cache-max-stale', type=int, default=DEFAULT_MAX_STALE_SECONDS,
+                        help='Oldest cached response (seconds) served when the request times out, cannot '
+                             f'connect or gets a 5xx; older ones raise the error (default: {DEFAULT_MAX_STALE_SECONDS})')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_MB,
+                        help=f'Size bound of the response cache directory (default: {DEFAULT_MAX_MB} MB)')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_RESPONSE_CACHE_DIR,
+                        help='Response cache directory (default: scripts/response_cache)')
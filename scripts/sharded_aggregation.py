@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Sharded Aggregation
+Exact history heatmaps plus geo and per-source counts, built by a process
+pool over shards of VisitorTrackingHistory / UserLoginHistory and merged like
+the endpoint's mergeMatrices()
+
+One Python process reading history events is bound to one core and one
+cursor. Here the events are split into shards and each worker process builds
+a partial aggregate of its shards:
+
+    MongoDB   _id ranges (ObjectIds start with their creation second), cut at
+              quantiles of a $sample of _ids so shards hold about the same
+              number of events (equal time slices when the window is too
+              narrow to sample). Every worker opens its own MongoClient and
+              reads each shard with its own projected cursor.
+    backup    the main process decompresses the file and cuts the history
+              arrays into ~4 MB raw blocks without decoding them
+              (backup_source.iter_backup_blocks); workers json-decode and
+              aggregate the blocks.
+
+A partial aggregate holds, per source (visitors, logins): the 7x24 and 31x24
+cell counts, events per geoSource and per ipinfo_country, and the event
+count. Merging partials is a cell-wise sum, associative and commutative like
+mergeMatrices(), so shards may finish in any order and the result equals one
+sequential pass of aggregate_history_events(). Workers vectorize each chunk:
+every distinct day / hour / day-of-month value is parsed once, timestamps in
+one pd.to_datetime call, cells counted with np.bincount.
+
+Workers are started with 'spawn': the visualizers hold a MongoClient and run
+loader threads, neither of which is safe across fork(). --workers 1 runs
+everything in-process.
+
+Usage:
+    python sharded_aggregation.py --backup 2026-02-09T03-00-00_TangoTiempoProd.json.gz --workers 4 --compare
+    python sharded_aggregation.py --range 1Yr --include-logins --workers 8       # MONGODB_URI_PROD
+    python visitor_analytics_visualizer.py --engine=pipeline --shard-workers 4
+    python benchmark.py --stages history_backup,sharded_backup_1w,sharded_backup_4w --shard-workers 1,4
+
+Requirements:
+    pip install numpy pandas (pymongo for MongoDB)
+"""
+
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from heatmap_builder import DAY_INDEX, merge_matrices
+from history_cube import GEO_SOURCES, SOURCES, _geo_index
+from history_pipeline import (
+    HISTORY_COLLECTIONS,
+    _hour_index,
+    build_time_match,
+    parse_range,
+    parse_timestamp,
+    time_fields,
+)
+
+DATABASE_NAME = 'TangoTiempoProd'
+DEFAULT_SHARD_WORKERS = os.cpu_count() or 1
+SHARDS_PER_WORKER = 4         # more shards than workers, so a slow shard does not hold up the pool
+IN_FLIGHT_PER_WORKER = 2      # backup blocks queued per worker (bounds the raw bytes held)
+SAMPLE_SIZE = 2000
+MIN_SAMPLES_PER_SHARD = 10
+CURSOR_BATCH_SIZE = 5000
+CHUNK_EVENTS = 50000
+
+# MongoDB client of a worker process (opened by _init_worker)
+_worker_db = None
+
+
+def history_projection(time_type='local'):
+    """Fields a partial aggregate reads"""
+    return {field: 1 for field in ('timestamp', 'geoSource', 'ipinfo_country', *time_fields(time_type))}
+
+
+def _mapped(values, convert, missing):
+    """convert() applied once per distinct value of a column; `missing` for None"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    table = np.array([convert(value) for value in uniques] + [missing], dtype=np.int64)
+    return table[codes]
+
+
+def _hour_code(value):
+    hour = _hour_index(value)
+    return -1 if hour is None else hour
+
+
+def _dom_code(value):
+    """Day of month 1-31; 0 when the stored value is unusable (the event is skipped)"""
+    try:
+        day = int(value)
+    except (TypeError, ValueError):
+        return 0
+    return day if 1 <= day <= 31 else 0
+
+
+class PartialAggregate:
+    """Per-source heatmap, geoSource, country and event counts of some shards; merge() sums them"""
+
+    def __init__(self):
+        self.dow = np.zeros((len(SOURCES), 7, 24), dtype=np.int64)
+        self.dom = np.zeros((len(SOURCES), 31, 24), dtype=np.int64)
+        self.geo = np.zeros((len(SOURCES), len(GEO_SOURCES)), dtype=np.int64)
+        self.events = np.zeros(len(SOURCES), dtype=np.int64)
+        self.countries = {source: Counter() for source in SOURCES}
+        self.shards = 0
+
+    def merge(self, other):
+        self.dow += other.dow
+        self.dom += other.dom
+        self.geo += other.geo
+        self.events += other.events
+        for source in SOURCES:
+            self.countries[source].update(other.countries[source])
+        self.shards += other.shards
+        return self
+
+    def add_events(self, source, events, time_type='local', since=None, until=None, chunk_size=CHUNK_EVENTS):
+        """Fold events in, chunk by chunk (same rules as history_pipeline.aggregate_history_events)"""
+        fields = ('timestamp', *time_fields(time_type), 'geoSource', 'ipinfo_country')
+        events = iter(events)
+        while True:
+            chunk = list(islice(events, chunk_size))
+            if not chunk:
+                return self
+            self._add_columns(SOURCES.index(source), *([event.get(field) for event in chunk] for field in fields),
+                              since=since, until=until)
+
+    def _add_columns(self, source_idx, stamps, days, hours, doms, geos, countries, since=None, until=None):
+        # BSON dates and ISO strings (backups) alike; unparsable ones become NaT
+        moments = pd.to_datetime(pd.Series(stamps, dtype=object), utc=True, errors='coerce', format='ISO8601')
+        keep = np.ones(len(stamps), dtype=bool)
+        if since is not None:
+            keep &= (moments >= pd.Timestamp(since, tz='UTC')).to_numpy()
+        if until is not None:
+            keep &= (moments < pd.Timestamp(until, tz='UTC')).to_numpy()
+        self.events[source_idx] += int(keep.sum())
+
+        day = _mapped(days, lambda value: DAY_INDEX.get(value, -1), -1)
+        hour = _mapped(hours, _hour_code, -1)
+        dom = _mapped(doms, _dom_code, -1)
+        # Missing day of month: the UTC date of the timestamp, like $dayOfMonth in the pipeline
+        fallback = moments.dt.day.fillna(0).to_numpy(np.int64)
+        dom = np.where(dom == -1, fallback, dom)
+
+        timed = keep & (hour >= 0)
+        cells = timed & (day >= 0)
+        self.dow[source_idx] += np.bincount(day[cells] * 24 + hour[cells], minlength=168).reshape(7, 24)
+        cells = timed & (dom >= 1)
+        self.dom[source_idx] += np.bincount((dom[cells] - 1) * 24 + hour[cells], minlength=744).reshape(31, 24)
+
+        geo = _mapped(geos, _geo_index, _geo_index(None))
+        self.geo[source_idx] += np.bincount(geo[keep], minlength=len(GEO_SOURCES))
+        shown = pd.Series(countries, dtype=object)[keep].dropna().value_counts()
+        self.countries[SOURCES[source_idx]].update(shown.to_dict())
+
+    def result(self, sources=SOURCES):
+        """fetch_history_heatmaps()-shaped result plus 'geoSources', 'countries' and 'perSource'"""
+        picked = [SOURCES.index(source) for source in sources]
+        countries = Counter()
+        for source in sources:
+            countries.update(self.countries[source])
+        return {
+            'dow': merge_matrices(*self.dow[picked]).astype(np.int64),
+            'dom': merge_matrices(*self.dom[picked]).astype(np.int64),
+            'sources': {HISTORY_COLLECTIONS[SOURCES[idx]]: int(self.events[idx]) for idx in picked},
+            'geoSources': dict(zip(GEO_SOURCES, self.geo[picked].sum(axis=0).tolist())),
+            'countries': dict(countries.most_common()),
+            'perSource': {SOURCES[idx]: {'dow': self.dow[idx], 'dom': self.dom[idx]} for idx in picked},
+            'shards': self.shards,
+        }
+
+
+# --------------------------------------------------------------------- shards
+
+def plan_id_shards(collection, shards, since=None, until=None, sample_size=SAMPLE_SIZE):
+    """
+    [(lower _id, upper _id)] covering the collection (None = open end). Cuts
+    are quantiles of sampled _ids inside the window, or equal time slices of
+    the window when too few samples fall in it.
+    """
+    from bson import ObjectId
+
+    if shards <= 1:
+        return [(None, None)]
+    # $sample as the first stage reads random documents instead of scanning
+    sampled = sorted(doc['_id'] for doc in collection.aggregate([
+        {'$sample': {'size': sample_size}},
+        {'$project': {'_id': 1}},
+    ]) if isinstance(doc['_id'], ObjectId))
+    inside = [oid for oid in sampled
+              if (since is None or oid.generation_time.replace(tzinfo=None) >= since)
+              and (until is None or oid.generation_time.replace(tzinfo=None) < until)]
+
+    if len(inside) >= shards * MIN_SAMPLES_PER_SHARD:
+        cuts = [inside[len(inside) * i // shards] for i in range(1, shards)]
+    elif sampled or since is not None:
+        start = since or sampled[0].generation_time.replace(tzinfo=None)
+        end = until or (sampled[-1].generation_time.replace(tzinfo=None) if sampled else start)
+        if end <= start:
+            return [(None, None)]
+        cuts = [ObjectId.from_datetime(start + (end - start) * i / shards) for i in range(1, shards)]
+    else:
+        return [(None, None)]
+
+    edges = [None] + sorted(set(cuts)) + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def shard_match(lower, upper, since=None, until=None):
+    """Find filter of one _id shard inside the time window"""
+    match = build_time_match(since, until)
+    window = {}
+    if lower is not None:
+        window['$gte'] = lower
+    if upper is not None:
+        window['$lt'] = upper
+    return {**match, '_id': window} if window else match
+
+
+def _init_worker(mongodb_uri=None):
+    """Each worker process opens its own client (connection pools do not cross processes)"""
+    global _worker_db
+    if mongodb_uri:
+        from pymongo import MongoClient
+
+        _worker_db = MongoClient(mongodb_uri)[DATABASE_NAME]
+
+
+def aggregate_id_shard(task, db=None):
+    """Partial aggregate of one (source, lower, upper) shard read with its own cursor"""
+    db = db if db is not None else _worker_db
+    source, lower, upper, time_type, since, until = task
+    cursor = db[HISTORY_COLLECTIONS[source]].find(shard_match(lower, upper, since, until),
+                                                  history_projection(time_type), batch_size=CURSOR_BATCH_SIZE)
+    try:
+        partial = PartialAggregate().add_events(source, cursor, time_type, since, until)
+    finally:
+        cursor.close()
+    partial.shards = 1
+    return partial
+
+
+def aggregate_block(task):
+    """Partial aggregate of one raw backup block"""
+    from backup_source import decode_block
+
+    source, block, time_type, since, until = task
+    partial = PartialAggregate().add_events(source, decode_block(block), time_type, since, until)
+    partial.shards = 1
+    return partial
+
+
+def run_sharded(fn, tasks, workers=DEFAULT_SHARD_WORKERS, initargs=()):
+    """
+    Merge fn(task) over tasks on `workers` spawned processes (in-process for
+    1); at most IN_FLIGHT_PER_WORKER tasks per worker are queued at a time
+    """
+    total = PartialAggregate()
+    if workers <= 1:
+        for task in tasks:
+            total.merge(fn(task))
+        return total
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=initargs) as executor:
+        pending = set()
+        for task in tasks:
+            pending.add(executor.submit(fn, task))
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    total.merge(future.result())
+        for future in wait(pending).done:
+            total.merge(future.result())
+    return total
+
+
+def fetch_sharded_heatmaps(db=None, since=None, until=None, time_type='local', include_visitors=True,
+                           include_logins=False, backup_path=None, workers=DEFAULT_SHARD_WORKERS,
+                           mongodb_uri=None):
+    """
+    fetch_history_heatmaps() / fetch_backup_history_heatmaps() on a process
+    pool; same keys plus 'geoSources', 'countries', 'perSource', 'shards',
+    'workers' and 'seconds'
+    """
+    sources = [source for source, wanted in (('visitors', include_visitors), ('logins', include_logins)) if wanted]
+    started = time.perf_counter()
+
+    if backup_path:
+        from backup_source import iter_backup_blocks
+
+        by_name = {HISTORY_COLLECTIONS[source]: source for source in sources}
+        tasks = ((by_name[name], block, time_type, since, until)
+                 for name, block in iter_backup_blocks(backup_path, list(by_name)))
+        total = run_sharded(aggregate_block, tasks, workers)
+    else:
+        tasks = [(source, lower, upper, time_type, since, until)
+                 for source in sources
+                 for lower, upper in plan_id_shards(db[HISTORY_COLLECTIONS[source]],
+                                                    max(1, workers) * SHARDS_PER_WORKER if workers > 1 else 1,
+                                                    since, until)]
+        if workers <= 1:
+            total = run_sharded(lambda task: aggregate_id_shard(task, db), tasks, 1)
+        else:
+            total = run_sharded(aggregate_id_shard, tasks, workers,
+                                initargs=(mongodb_uri or os.getenv('MONGODB_URI_PROD'),))
+
+    return {**total.result(sources), 'workers': max(1, workers), 'seconds': time.perf_counter() - started}
+
+
+def add_sharding_arguments(parser):
+    """Register --shard-workers on an argparse parser"""
+    parser.add_argument('--shard-workers', type=int, default=0, metavar='N',
+                        help='With --engine=pipeline: aggregate history in N worker processes over _id ranges '
+                             '(or backup blocks) instead of a server-side $group / one reader '
+                             '(sharded_aggregation.py; default: off)')
+
+
+def print_sharded_summary(result, top=10):
+    """Shards, throughput and the geoSource / country breakdown"""
+    events = sum(result['sources'].values())
+    rate = events / result['seconds'] if result['seconds'] > 0 else 0
+    print(f"✅ Aggregated {events:,} events from {result['shards']} shards on {result['workers']} "
+          f"worker{'s' if result['workers'] > 1 else ''} in {result['seconds']:.2f}s ({rate:,.0f} events/s)")
+    for name, count in result['sources'].items():
+        print(f"   - {name}: {count:,} events")
+    print("   geoSource: " + ', '.join(f"{name} {count:,}" for name, count in result['geoSources'].items() if count))
+    countries = list(result['countries'].items())
+    if countries:
+        print(f"   Top countries: " + ', '.join(f"{name} {count:,}" for name, count in countries[:top])
+              + (f" (+{len(countries) - top} more)" if len(countries) > top else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate history heatmaps on a process pool over shards')
+    parser.add_argument('--backup', type=str, help='Read a Backup_MongoDB .json.gz file instead of MongoDB')
+    parser.add_argument('--workers', type=int, default=DEFAULT_SHARD_WORKERS,
+                        help=f'Worker processes (default: {DEFAULT_SHARD_WORKERS}, the CPU count)')
+    parser.add_argument('--time-type', choices=['local', 'zulu'], default='local', help='Heatmap time type')
+    parser.add_argument('--range', default='All', help='History range, e.g. 7D, 3M, 1Yr, All (default: All)')
+    parser.add_argument('--since', type=parse_timestamp, help='ISO start (inclusive); overrides --range')
+    parser.add_argument('--until', type=parse_timestamp, help='ISO end (exclusive)')
+    parser.add_argument('--include-logins', action='store_true', help='Also aggregate UserLoginHistory')
+    parser.add_argument('--compare', action='store_true',
+                        help='Also run the single-process aggregation and check both agree (backup only)')
+    args = parser.parse_args()
+    if args.compare and not args.backup:
+        parser.error('--compare needs --backup')
+
+    since = args.since if args.since is not None else parse_range(args.range)
+    client = None
+    db = None
+    if not args.backup:
+        mongodb_uri = os.getenv('MONGODB_URI_PROD')
+        if not mongodb_uri:
+            print("ERROR: MONGODB_URI_PROD environment variable not set (or use --backup)")
+            return 1
+        from pymongo import MongoClient
+
+        client = MongoClient(mongodb_uri)
+        db = client[DATABASE_NAME]
+
+    try:
+        result = fetch_sharded_heatmaps(db, since, args.until, args.time_type, include_logins=args.include_logins,
+                                        backup_path=args.backup, workers=args.workers)
+    finally:
+        if client is not None:
+            client.close()
+    print_sharded_summary(result)
+
+    if args.compare:
+        from backup_source import fetch_backup_history_heatmaps
+
+        started = time.perf_counter()
+        single = fetch_backup_history_heatmaps(args.backup, args.time_type, since, args.until,
+                                               include_logins=args.include_logins)
+        seconds = time.perf_counter() - started
+        same = (np.array_equal(single['dow'], result['dow']) and np.array_equal(single['dom'], result['dom'])
+                and single['sources'] == result['sources'])
+        print(f"\n{'✅' if same else '❌'} Single process: {seconds:.2f}s; sharded {result['seconds']:.2f}s "
+              f"({seconds / result['seconds']:.1f}x) — heatmaps {'identical' if same else 'DIFFER'}")
+        return 0 if same else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Spatial Index
+Quadkey (Morton-ordered) index over map points for viewport queries
+
+Every point gets a 40-bit Morton code of its Web Mercator tile at zoom 20.
+Points are stored sorted by that code, which means:
+
+- all points inside any quadkey tile, at any zoom, are one contiguous run, so
+  a viewport query looks up zoom-8 bucket runs with searchsorted and then
+  filters the candidates exactly by bounding box;
+- aggregating visible points into map cells for the current zoom is just
+  grouping on `code >> 2 * (20 - level)`, with the level lowered until the
+  marker count fits the budget.
+
+The index is built once; each query costs O(visible points), not O(all points).
+
+Requirements:
+    pip install numpy pandas
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from map_aggregation import AGGREGATED_COLUMNS
+
+MAX_ZOOM = 20
+BUCKET_ZOOM = 8
+CELL_ZOOM_OFFSET = 3          # cells ~1/8 of a 512px map tile, i.e. ~64px apart
+MAX_BUCKET_LOOKUPS = 4096     # wider views just scan every candidate
+MAX_LATITUDE = 85.05112878
+TILE_SIZE_PX = 512            # Mapbox GL tile size used for zoom <-> degrees
+DEFAULT_VIEWPORT_POINTS = 1500
+
+STRING_COLUMNS = ('ip', 'visitor_id', 'city', 'region', 'country')
+
+
+def _spread_bits(values):
+    """Interleave zeros between the low 32 bits of each value"""
+    n = values.astype(np.uint64) & np.uint64(0x00000000FFFFFFFF)
+    n = (n | (n << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    n = (n | (n << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    n = (n | (n << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    n = (n | (n << np.uint64(2))) & np.uint64(0x3333333333333333)
+    n = (n | (n << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return n
+
+
+def tile_xy(lat, long, zoom):
+    """Web Mercator tile coordinates (integer arrays) at `zoom`"""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    long = np.asarray(long, dtype=np.float64)
+    scale = 2 ** zoom
+
+    x = (long + 180.0) / 360.0 * scale
+    lat_rad = np.radians(lat)
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0 * scale
+
+    return (
+        np.clip(np.floor(x), 0, scale - 1).astype(np.int64),
+        np.clip(np.floor(y), 0, scale - 1).astype(np.int64),
+    )
+
+
+def morton_codes(lat, long, zoom=MAX_ZOOM):
+    """Quadkey order codes: interleaved tile x/y bits at `zoom`"""
+    x, y = tile_xy(lat, long, zoom)
+    return _spread_bits(x) | (_spread_bits(y) << np.uint64(1))
+
+
+def _lat_from_mercator(y):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+
+
+def bbox_from_view(center_lat, center_lon, zoom, width_px=1200, height_px=700):
+    """Approximate (west, south, east, north) visible for a centre/zoom"""
+    world_px = TILE_SIZE_PX * 2 ** zoom
+    half_lon = width_px / 2 / world_px * 360.0
+
+    lat = max(min(center_lat, MAX_LATITUDE), -MAX_LATITUDE)
+    center_y = (1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2
+    half_y = height_px / 2 / world_px
+
+    north = _lat_from_mercator(max(center_y - half_y, 0.0))
+    south = _lat_from_mercator(min(center_y + half_y, 1.0))
+    return center_lon - half_lon, south, center_lon + half_lon, north
+
+
+def viewport_from_relayout(relayout, width_px=1200, height_px=700):
+    """
+    Parse a Scattermapbox `relayoutData` event into
+    {'center_lat', 'center_lon', 'zoom', 'bbox'}; None if it is not a map move.
+    """
+    if not relayout or 'mapbox.center' not in relayout or 'mapbox.zoom' not in relayout:
+        return None
+
+    center = relayout['mapbox.center']
+    zoom = float(relayout['mapbox.zoom'])
+    derived = (relayout.get('mapbox._derived') or {}).get('coordinates')
+
+    if derived:
+        longs = [corner[0] for corner in derived]
+        lats = [corner[1] for corner in derived]
+        bbox = (min(longs), min(lats), max(longs), max(lats))
+    else:
+        bbox = bbox_from_view(center['lat'], center['lon'], zoom, width_px, height_px)
+
+    return {'center_lat': center['lat'], 'center_lon': center['lon'], 'zoom': zoom, 'bbox': bbox}
+
+
+def _longitude_ranges(west, east):
+    """Split a west->east span into ranges inside [-180, 180]"""
+    if east - west >= 360:
+        return [(-180.0, 180.0)]
+    west = ((west + 180.0) % 360.0) - 180.0
+    east = west + (east - west if east >= west else east - west + 360.0)
+    if east <= 180.0:
+        return [(west, east)]
+    return [(west, 180.0), (-180.0, east - 360.0)]
+
+
+class MapPointIndex:
+    """Points from prepare_map_data(), sorted by Morton code"""
+
+    def __init__(self, df):
+        codes = morton_codes(df['lat'].values, df['long'].values)
+        order = np.argsort(codes, kind='stable')
+
+        self.codes = codes[order]
+        self.lat = df['lat'].values.astype(np.float64)[order]
+        self.long = df['long'].values.astype(np.float64)[order]
+        self.total_visits = pd.to_numeric(df['total_visits'], errors='coerce').fillna(0).values.astype(np.int64)[order]
+
+        self.sources, source_codes = np.unique(df['source'].values.astype(str), return_inverse=True)
+        self.source_codes = source_codes.astype(np.int8)[order]
+
+        self.strings = df[list(STRING_COLUMNS)].iloc[order].reset_index(drop=True)
+
+        # Zoom-8 bucket b covers codes [b << shift, (b + 1) << shift)
+        self.bucket_shift = np.uint64(2 * (MAX_ZOOM - BUCKET_ZOOM))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def nbytes(self):
+        """Approximate memory held by the index (strings measured deeply)"""
+        numeric = sum(a.nbytes for a in (self.codes, self.lat, self.long, self.total_visits, self.source_codes))
+        return numeric + int(self.strings.memory_usage(deep=True).sum())
+
+    def _bucket_candidates(self, west, south, east, north):
+        """Sorted indices of points in the zoom-8 buckets overlapping the box"""
+        x0, y0 = tile_xy([north], [west], BUCKET_ZOOM)
+        x1, y1 = tile_xy([south], [east], BUCKET_ZOOM)
+        xs = np.arange(x0[0], x1[0] + 1)
+        ys = np.arange(y0[0], y1[0] + 1)
+        if len(xs) * len(ys) > MAX_BUCKET_LOOKUPS:
+            return None
+
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        buckets = np.sort((_spread_bits(grid_x.ravel()) | (_spread_bits(grid_y.ravel()) << np.uint64(1))))
+        starts = np.searchsorted(self.codes, buckets << self.bucket_shift, side='left')
+        ends = np.searchsorted(self.codes, (buckets + np.uint64(1)) << self.bucket_shift, side='left')
+
+        runs = [np.arange(start, end) for start, end in zip(starts, ends) if end > start]
+        return np.concatenate(runs) if runs else np.array([], dtype=np.int64)
+
+    def visible(self, bbox):
+        """Sorted indices of points inside (west, south, east, north)"""
+        west, south, east, north = bbox
+        south, north = max(south, -90.0), min(north, 90.0)
+        found = []
+
+        for range_west, range_east in _longitude_ranges(west, east):
+            candidates = self._bucket_candidates(range_west, south, range_east, north)
+            if candidates is None:
+                candidates = np.arange(len(self))
+            lat = self.lat[candidates]
+            long = self.long[candidates]
+            inside = (lat >= south) & (lat <= north) & (long >= range_west) & (long <= range_east)
+            found.append(candidates[inside])
+
+        # Bucket runs come back in code order, so a single range is already sorted
+        return found[0] if len(found) == 1 else np.unique(np.concatenate(found))
+
+    def query(self, bbox, zoom, max_points=DEFAULT_VIEWPORT_POINTS):
+        """
+        Markers for a viewport: visible points grouped into quadkey cells per
+        source at roughly `zoom + 3`, coarsened until at most `max_points`
+        remain. Returns (DataFrame with AGGREGATED_COLUMNS, cell level).
+        """
+        rows = self.visible(bbox)
+        if len(rows) == 0:
+            return pd.DataFrame(columns=AGGREGATED_COLUMNS), None
+
+        codes = self.codes[rows]
+        sources = self.source_codes[rows].astype(np.uint64)
+        level = int(min(MAX_ZOOM, max(0, round(zoom) + CELL_ZOOM_OFFSET)))
+        n_sources = np.uint64(max(len(self.sources), 1))
+
+        while True:
+            cells = codes >> np.uint64(2 * (MAX_ZOOM - level))
+            keys = cells * n_sources + sources
+            unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            if len(unique_keys) <= max_points or level == 0:
+                break
+            level -= 1
+
+        counts = np.bincount(inverse)
+        lat = np.bincount(inverse, weights=self.lat[rows]) / counts
+        long = np.bincount(inverse, weights=self.long[rows]) / counts
+        total_visits = np.bincount(inverse, weights=self.total_visits[rows]).astype(np.int64)
+
+        first_rows = rows[first]
+        markers = pd.DataFrame({
+            'lat': lat,
+            'long': long,
+            'source': self.sources[self.source_codes[first_rows]],
+            'count': counts,
+            'total_visits': total_visits,
+        })
+        for column in STRING_COLUMNS:
+            markers[column] = self.strings[column].values[first_rows]
+
+        return markers[AGGREGATED_COLUMNS], level
+
+
+def add_viewport_arguments(parser):
+    """Register viewport map options on an argparse parser"""
+    parser.add_argument('--viewport-points', type=int, default=DEFAULT_VIEWPORT_POINTS,
+                        help=f'Marker budget per map viewport (default: {DEFAULT_VIEWPORT_POINTS})')
+    parser.add_argument('--static-map', action='store_true',
+                        help='Render one pre-binned map (--max-map-points) instead of reloading per viewport')
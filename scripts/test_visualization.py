@@ -2,32 +2,68 @@
 """
 Test script to verify data and generate sample visualizations
 Outputs: test_map.html and test_heatmap.html
+         (+ test_dom_heatmap.html with --engine=pipeline/snapshot/cube,
+            test_unique_visitors.html and test_top_ips.html with --unique-visitors)
+         or, with --report [DIR], one report bundle with every figure and the
+         geo rollups (see report_bundle.py)
+
+--metrics PATH / --profile [DIR] time each stage (see stage_metrics.py)
 """
 
+from datetime import datetime, timezone
 import os
 import sys
-from pymongo import MongoClient
-import pandas as pd
-import plotly.graph_objects as go
+import argparse
+from heatmap_builder import build_heatmap_matrix, heatmap_to_frame, merge_matrices
+from visitor_ingest import (
+    DEFAULT_BATCH_SIZE,
+    MapAccumulator,
+    accumulate_visitor_batches,
+    iter_batches,
+    iter_visitor_batches,
+    stream_visitor_data,
+)
+from visitor_cache import ColumnAccumulator, VisitorCache, add_cache_arguments, load_visitor_columns, update_cache
+from map_aggregation import add_map_aggregation_arguments
+from backup_source import fetch_backup_history_heatmaps, iter_backup_documents
+from history_pipeline import (
+    add_pipeline_arguments,
+    dom_to_frame,
+    dow_to_frame,
+    fetch_history_heatmaps,
+    pipeline_window,
+)
+from heatmap_snapshot import add_snapshot_arguments, snapshot_matrices, update_snapshot
+from local_time import add_local_time_arguments, fetch_recomputed_heatmaps, print_recompute_report
+from sharded_aggregation import add_sharding_arguments, fetch_sharded_heatmaps, print_sharded_summary
+from history_cube import add_cube_arguments, update_cube
+from collection_loader import ANALYTICS_COLLECTIONS, ParallelLoader, add_loader_arguments, load_login_heatmap
+from geo_rollup import GEO_LEVELS, GeoRollup
+from report_bundle import add_report_arguments, default_report_dir, print_bundle_summary, write_report_bundle
+from stage_metrics import StageMetrics, add_metrics_arguments
+from visitor_sketches import add_sketch_arguments, build_sketches, print_sketch_report
+from visitor_figures import (
+    create_dom_heatmap_figure,
+    create_geo_rollup_figure,
+    create_heatmap_figure,
+    create_map_figure,
+    create_top_ips_figure,
+    create_unique_visitors_figure,
+)
 
 # Configuration
 MONGODB_URI = os.getenv('MONGODB_URI_PROD')
 DATABASE_NAME = 'TangoTiempoProd'
 COLLECTION_NAME = 'VisitorTrackingAnalytics'
 
-# Color scheme
-COLORS = {
-    'GoogleGeolocation': '#4285F4',  # Google Blue
-    'IPInfoIO': '#EA4335',           # Google Red
-    'GoogleBrowser': '#34A853',      # Google Green
-}
-
 def connect_to_mongodb():
     """Connect to MongoDB and return database instance"""
     if not MONGODB_URI:
         print("ERROR: MONGODB_URI_PROD environment variable not set")
         sys.exit(1)
 
+    from pymongo import MongoClient
+
     try:
         client = MongoClient(MONGODB_URI)
         client.server_info()
@@ -37,184 +73,356 @@ def connect_to_mongodb():
         print(f"❌ MongoDB connection failed: {e}")
         sys.exit(1)
 
-def fetch_visitor_data(db):
-    """Fetch all visitor analytics from MongoDB"""
-    collection = db[COLLECTION_NAME]
-    cursor = collection.find({})
-    data = list(cursor)
-    print(f"✅ Fetched {len(data)} visitor records")
-    return data
+def fetch_visitor_columns(db, batch_size=DEFAULT_BATCH_SIZE):
+    """Fetch all visitor analytics from MongoDB straight into compact columns (no list of documents)"""
+    store = load_visitor_columns(iter_visitor_batches(db[COLLECTION_NAME], batch_size))
+    print(f"✅ Fetched {len(store)} visitor records")
+    if len(store):
+        print(f"   Compact columns: {store.nbytes() / 1e6:.1f} MB, {store.nbytes() / len(store):.0f} bytes per visitor")
+    return store
+
+def stream_visitor_frames(db, batch_size=DEFAULT_BATCH_SIZE, backup_path=None, extra=()):
+    """Stream projected batches (from MongoDB or a backup file) into the map and heatmap accumulators"""
+    if backup_path:
+        batches = iter_batches(iter_backup_documents(backup_path, COLLECTION_NAME), batch_size)
+        map_acc, heatmap_acc, record_count = accumulate_visitor_batches(batches, extra=extra)
+    else:
+        collection = db[COLLECTION_NAME]
+        map_acc, heatmap_acc, record_count = stream_visitor_data(collection, batch_size=batch_size, extra=extra)
+    print(f"✅ Streamed {record_count} visitor records (batch size {batch_size})")
+
+    map_df = map_acc.to_frame()
+    report_map_points(map_df)
+
+    heatmap_df = heatmap_acc.to_frame()
+    print(f"✅ Prepared heatmap data")
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
 
-def prepare_map_data(data):
-    """Prepare data for map visualization"""
-    map_points = []
-
-    for record in data:
-        # Extract Google API geolocation
-        if record.get('google_api_lat') and record.get('google_api_long'):
-            map_points.append({
-                'lat': record['google_api_lat'],
-                'long': record['google_api_long'],
-                'source': 'GoogleGeolocation',
-                'ip': record.get('ip', 'unknown'),
-                'city': record.get('ipinfo_city', 'Unknown'),
-                'region': record.get('ipinfo_region', 'Unknown'),
-                'country': record.get('ipinfo_country', 'Unknown'),
-                'total_visits': record.get('totalVisits', 0)
-            })
-
-        # Extract IPInfo geolocation
-        if record.get('ipinfo_lat') and record.get('ipinfo_long'):
-            map_points.append({
-                'lat': record['ipinfo_lat'],
-                'long': record['ipinfo_long'],
-                'source': 'IPInfoIO',
-                'ip': record.get('ip', 'unknown'),
-                'city': record.get('ipinfo_city', 'Unknown'),
-                'region': record.get('ipinfo_region', 'Unknown'),
-                'country': record.get('ipinfo_country', 'Unknown'),
-                'total_visits': record.get('totalVisits', 0)
-            })
-
-    df = pd.DataFrame(map_points)
+    return record_count, map_df, heatmap_df
+
+def load_cached_frames(db, args):
+    """Map and heatmap frames read from the local columnar visitor cache"""
+    collection = None if args.cache_only else db[COLLECTION_NAME]
+    try:
+        cache = update_cache(collection, args)
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    map_df = cache.map_frame()
+    report_map_points(map_df)
+
+    heatmap_df = cache.heatmap_frame()
+    print(f"✅ Prepared heatmap data")
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
+
+    return len(cache), map_df, heatmap_df, cache
+
+def report_map_points(df):
+    """Print map point counts per geolocation source"""
     print(f"✅ Prepared {len(df)} map points")
     print(f"   - Google API points: {len(df[df['source'] == 'GoogleGeolocation'])}")
     print(f"   - IPInfo points: {len(df[df['source'] == 'IPInfoIO'])}")
 
+def prepare_map_data(data):
+    """Prepare data for map visualization (from a VisitorCache or a list of documents)"""
+    if isinstance(data, VisitorCache):
+        df = data.map_frame()
+    else:
+        map_acc = MapAccumulator()
+        map_acc.add_batch(data)
+        df = map_acc.to_frame()
+    report_map_points(df)
+
     return df
 
 def prepare_heatmap_data(data):
-    """Prepare data for time-of-day vs day-of-week heatmap"""
-    days_order = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    hours = list(range(24))
-
-    heatmap_matrix = pd.DataFrame(0, index=hours, columns=days_order)
-
-    for record in data:
-        visits_by_day = record.get('visitsByDayOfWeekLocal') or record.get('visitsByDayOfWeekZulu', {})
-        visits_by_hour = record.get('visitsByHourLocal') or record.get('visitsByHourZulu', {})
-
-        total_visits = record.get('totalVisits', 0)
-        if total_visits > 0:
-            for day_name, count in visits_by_day.items():
-                if day_name in days_order:
-                    for hour, hour_count in visits_by_hour.items():
-                        try:
-                            hour_int = int(hour)
-                            if 0 <= hour_int < 24:
-                                proportion = hour_count / total_visits
-                                heatmap_matrix.loc[hour_int, day_name] += count * proportion
-                        except (ValueError, KeyError):
-                            continue
+    """Prepare data for time-of-day vs day-of-week heatmap (from a VisitorCache or a list of documents)"""
+    # Each record's day and hour counters are spread proportionally
+    # (day_count * hour_count / totalVisits) - see heatmap_builder
+    if isinstance(data, VisitorCache):
+        heatmap_matrix = data.heatmap_frame()
+    else:
+        heatmap_matrix = build_heatmap_matrix(data)
 
     print(f"✅ Prepared heatmap data")
     print(f"   Total visits in heatmap: {heatmap_matrix.sum().sum():.0f}")
 
     return heatmap_matrix
 
-def create_map_figure(df):
-    """Create interactive map with geolocation points"""
-    fig = go.Figure()
-
-    for source, color in COLORS.items():
-        source_df = df[df['source'] == source]
-        if not source_df.empty:
-            fig.add_trace(go.Scattermapbox(
-                lat=source_df['lat'],
-                lon=source_df['long'],
-                mode='markers',
-                marker=dict(size=10, color=color, opacity=0.7),
-                name=source,
-                text=source_df.apply(lambda row:
-                    f"<b>{row['source']}</b><br>" +
-                    f"IP: {row['ip']}<br>" +
-                    f"Location: {row['city']}, {row['region']}, {row['country']}<br>" +
-                    f"Total Visits: {row['total_visits']}",
-                    axis=1
-                ),
-                hoverinfo='text'
-            ))
-
-    center_lat = df['lat'].mean()
-    center_lon = df['long'].mean()
-
-    fig.update_layout(
-        mapbox=dict(
-            style='open-street-map',
-            center=dict(lat=center_lat, lon=center_lon),
-            zoom=3
-        ),
-        title='Visitor Geolocation Map<br><sub>🔵 Google API | 🔴 IPInfo.io</sub>',
-        showlegend=True,
-        height=700
-    )
-
-    return fig
-
-def create_heatmap_figure(heatmap_df):
-    """Create time-of-day vs day-of-week heatmap"""
-    heatmap_values = heatmap_df.round(0).astype(int)
-
-    fig = go.Figure(data=go.Heatmap(
-        z=heatmap_values.values,
-        x=heatmap_df.columns,
-        y=heatmap_df.index,
-        colorscale='YlOrRd',
-        text=heatmap_values.values,
-        texttemplate='%{text}',
-        textfont={"size": 10},
-        hovertemplate='<b>%{x}</b><br>Hour: %{y}:00<br>Visits: %{z}<extra></extra>',
-        colorbar=dict(title="Visits")
-    ))
-
-    fig.update_layout(
-        title='Visitor Traffic Heatmap<br><sub>Time of Day vs Day of Week</sub>',
-        xaxis=dict(title='Day of Week', side='bottom'),
-        yaxis=dict(
-            title='Hour of Day',
-            autorange='reversed',
-            tickmode='linear',
-            tick0=0,
-            dtick=1
-        ),
-        height=700
-    )
-
-    return fig
+def merge_login_heatmap(heatmap_df, loader):
+    """Add the UserLoginAnalytics counters to the visitor heatmap like the endpoint's mergeMatrices()"""
+    login_matrix, login_records = loader.result(ANALYTICS_COLLECTIONS['logins'])
+    merged_df = heatmap_to_frame(merge_matrices(heatmap_df.values, login_matrix))
+    print(f"✅ Merged {login_records} login analytics records into the heatmap")
+    print(f"   Total visits + logins in heatmap: {merged_df.sum().sum():.0f}")
+    return merged_df, login_records
+
+def load_pipeline_heatmaps(db, args):
+    """Exact DOW/DOM heatmaps from history events (server-side, or streamed from a backup file)"""
+    since, until = pipeline_window(args)
+    if args.recompute_local:
+        # Local fields rebuilt from timestamp + timezone on this side instead of $group-ed in MongoDB
+        result = fetch_recomputed_heatmaps(db, since, until, include_logins=args.include_logins,
+                                           backup_path=args.backup)
+        print_recompute_report(result['recompute'])
+    elif args.shard_workers:
+        # Partial aggregates built on a process pool over _id ranges / backup blocks, then summed
+        result = fetch_sharded_heatmaps(db, since, until, args.time_type, include_logins=args.include_logins,
+                                        backup_path=args.backup, workers=args.shard_workers)
+        print_sharded_summary(result)
+    elif args.backup:
+        result = fetch_backup_history_heatmaps(
+            args.backup,
+            time_type=args.time_type,
+            since=since,
+            until=until,
+            include_logins=args.include_logins
+        )
+    else:
+        result = fetch_history_heatmaps(
+            db,
+            time_type=args.time_type,
+            since=since,
+            until=until,
+            include_logins=args.include_logins
+        )
+
+    heatmap_df = dow_to_frame(result['dow'])
+    dom_df = dom_to_frame(result['dom'])
+
+    print(f"✅ Aggregated history heatmaps ({args.time_type} time{', recomputed' if args.recompute_local else ''})")
+    for name, events in result['sources'].items():
+        print(f"   - {name}: {events} events")
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
+
+    return heatmap_df, dom_df
+
+def load_unique_visitors(db, args):
+    """HyperLogLog / top-K sketches of the history events in the --range/--since/--until window"""
+    since, until = pipeline_window(args)
+    sketches = build_sketches(db, since, until, args.time_type, include_logins=args.include_logins,
+                              backup_path=args.backup, precision=args.sketch_precision)
+    print_sketch_report(sketches, top=10)
+    return sketches
+
+def load_snapshot_heatmaps(db, args):
+    """All-time DOW/DOM heatmaps from the incremental snapshot (new events folded in)"""
+    snapshot = update_snapshot(db, args)
+    dow, dom, _ = snapshot_matrices(snapshot, args.time_type, include_logins=args.include_logins)
+
+    heatmap_df = dow_to_frame(dow)
+    dom_df = dom_to_frame(dom)
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
+
+    return heatmap_df, dom_df
+
+def load_cube_heatmaps(db, args):
+    """DOW/DOM heatmaps for the --range/--since/--until window from the hourly history cube"""
+    cube = update_cube(db, args, backup_path=args.backup)
+    since, until = pipeline_window(args)
+    sources = ['visitors', 'logins'] if args.include_logins else ['visitors']
+    result = cube.heatmaps(since, until, args.time_type, sources=sources)
+
+    heatmap_df = dow_to_frame(result['dow'])
+    dom_df = dom_to_frame(result['dom'])
+    print(f"   {result['events']} events in window ({args.time_type} time)")
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
+
+    return heatmap_df, dom_df
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Generate static visitor analytics HTML files')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream projected batches instead of loading every document first')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Cursor batch size when fetching or streaming (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--backup', type=str,
+                        help='Read a Backup_MongoDB .json.gz file instead of MONGODB_URI_PROD (implies --stream)')
+    add_cache_arguments(parser)
+    add_map_aggregation_arguments(parser)
+    add_pipeline_arguments(parser)
+    add_local_time_arguments(parser)
+    add_sharding_arguments(parser)
+    add_snapshot_arguments(parser)
+    add_cube_arguments(parser)
+    add_loader_arguments(parser)
+    add_report_arguments(parser)
+    add_sketch_arguments(parser)
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    args.use_cache = args.cache or args.cache_only or args.rebuild_cache
+    if args.backup and args.engine == 'snapshot':
+        parser.error('--engine=snapshot needs a live database; use --engine=pipeline with --backup')
+    if args.backup and args.use_cache:
+        parser.error('--backup cannot be combined with the visitor cache options')
+    if args.cache_only and args.engine != 'analytics':
+        parser.error('--cache-only only supports --engine=analytics')
+    if args.recompute_local and (args.engine != 'pipeline' or args.time_type != 'local'):
+        parser.error('--recompute-local only applies to --engine=pipeline with --time-type local')
+    if args.shard_workers and (args.engine != 'pipeline' or args.recompute_local):
+        parser.error('--shard-workers only applies to --engine=pipeline (without --recompute-local)')
+    if args.cache_only and args.include_logins:
+        parser.error('--include-logins reads UserLoginAnalytics; it cannot be combined with --cache-only')
+    if args.unique_visitors and args.cache_only:
+        parser.error('--unique-visitors reads history events; it cannot be combined with --cache-only')
+    return args
 
 def main():
+    args = parse_args()
+    metrics = StageMetrics.from_args('test_visualization', args)
+
     print("=" * 60)
     print("Visitor Analytics Test")
     print("=" * 60)
 
-    # Connect to MongoDB
-    db = connect_to_mongodb()
-
-    # Fetch data
-    visitor_data = fetch_visitor_data(db)
-
-    if not visitor_data:
-        print("⚠️  No visitor data found")
-        sys.exit(1)
-
-    # Prepare visualizations
-    print("\n📊 Preparing visualizations...")
-    map_df = prepare_map_data(visitor_data)
-    heatmap_df = prepare_heatmap_data(visitor_data)
+    if args.backup:
+        # Offline: everything is streamed out of the backup file
+        db = None
+        print(f"📦 Reading backup: {args.backup}")
+    elif args.cache_only:
+        db = None
+    else:
+        # Connect to MongoDB
+        with metrics.stage('connect'):
+            db = connect_to_mongodb()
+
+    # History aggregations and login counters load on worker threads (sharing
+    # the client's connection pool) while the visitor analytics are read
+    loader = ParallelLoader(args.load_workers)
+    if args.engine == 'pipeline':
+        loader.submit('history', load_pipeline_heatmaps, db, args)
+    if args.engine == 'analytics' and args.include_logins:
+        loader.submit(ANALYTICS_COLLECTIONS['logins'], load_login_heatmap, db, args.batch_size, args.backup)
+    if args.unique_visitors:
+        loader.submit('sketches', load_unique_visitors, db, args)
+
+    if args.use_cache:
+        print("\n📊 Loading visitor cache...")
+        with metrics.stage('cache') as stage:
+            record_count, map_df, heatmap_df, store = load_cached_frames(db, args)
+            stage['records'] = record_count
+
+        if not record_count:
+            print("⚠️  No visitor data found in cache")
+            sys.exit(1)
+    elif args.stream or args.backup:
+        print("\n📊 Streaming visitor data...")
+        # The report's geo rollups need the filter columns as well
+        columns = ColumnAccumulator() if args.report is not None else None
+        with metrics.stage('stream') as stage:
+            record_count, map_df, heatmap_df = stream_visitor_frames(
+                db, batch_size=args.batch_size, backup_path=args.backup, extra=(columns,) if columns else ()
+            )
+            stage['records'] = record_count
+        store = columns.to_cache() if columns else None
+
+        if not record_count:
+            print("⚠️  No visitor data found")
+            sys.exit(1)
+    else:
+        # Fetch data
+        with metrics.stage('fetch') as stage:
+            store = fetch_visitor_columns(db, args.batch_size)
+            stage['records'] = len(store)
+            stage['bytesPerVisitor'] = round(store.nbytes() / len(store), 1) if len(store) else None
+
+        if not len(store):
+            print("⚠️  No visitor data found")
+            sys.exit(1)
+
+        # Prepare visualizations
+        print("\n📊 Preparing visualizations...")
+        with metrics.stage('prepare_map', records=len(store)):
+            map_df = prepare_map_data(store)
+        if args.engine == 'analytics':
+            with metrics.stage('prepare_heatmap', records=len(store)):
+                heatmap_df = prepare_heatmap_data(store)
+
+    if ANALYTICS_COLLECTIONS['logins'] in loader:
+        with metrics.stage('login_analytics') as stage:
+            heatmap_df, stage['records'] = merge_login_heatmap(heatmap_df, loader)
+
+    dom_df = None
+    if args.engine == 'pipeline':
+        print("\n📊 Aggregating history heatmaps...")
+        with metrics.stage('history_pipeline'):
+            heatmap_df, dom_df = loader.result('history')
+    elif args.engine == 'snapshot':
+        print("\n📊 Updating heatmap snapshot...")
+        with metrics.stage('history_snapshot'):
+            heatmap_df, dom_df = load_snapshot_heatmaps(db, args)
+    elif args.engine == 'cube':
+        print("\n📊 Querying history cube...")
+        with metrics.stage('history_cube'):
+            heatmap_df, dom_df = load_cube_heatmaps(db, args)
+
+    sketches = None
+    if 'sketches' in loader:
+        print("\n📊 Sketching unique visitors...")
+        with metrics.stage('unique_visitors') as stage:
+            sketches = loader.result('sketches')
+            stage['records'] = sketches.events
+            stage['sketchBytes'] = sketches.nbytes()
+    loader.close()
 
     # Create figures
-    map_fig = create_map_figure(map_df)
-    heatmap_fig = create_heatmap_figure(heatmap_df)
-
-    # Save to HTML
-    map_fig.write_html('test_map.html')
-    heatmap_fig.write_html('test_heatmap.html')
+    with metrics.stage('map_figure', records=len(map_df)):
+        map_fig = create_map_figure(map_df, max_points=args.max_map_points, bin_mode=args.map_bin)
+    with metrics.stage('heatmap_figure'):
+        heatmap_fig = create_heatmap_figure(heatmap_df)
+        dom_fig = create_dom_heatmap_figure(dom_df) if dom_df is not None else None
+    unique_fig = create_unique_visitors_figure(sketches) if sketches is not None else None
+    top_ips_fig = create_top_ips_figure(sketches) if sketches is not None else None
+
+    if args.report is not None:
+        with metrics.stage('geo_rollup', records=len(store)):
+            rollup = GeoRollup.from_store(store)
+            geo_figs = {level: create_geo_rollup_figure(rollup.rollup(level), level) for level in GEO_LEVELS}
+        with metrics.stage('report_bundle') as stage:
+            result = write_report_bundle(
+                args.report or default_report_dir(),
+                [('map', '📍 Geolocation Map', map_fig),
+                 ('heatmap', '🔥 Time Heatmap', heatmap_fig),
+                 ('dom-heatmap', '📅 Day of Month Heatmap', dom_fig),
+                 ('unique-visitors', '👥 Unique Visitors', unique_fig),
+                 ('top-ips', '👥 Top IPs', top_ips_fig)]
+                + [(f'geo-{level}', f'🌍 {level.title()}', fig) for level, fig in geo_figs.items()],
+                meta=[f"Generated {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')}",
+                      f"{record_count:,} visitors", f"{len(map_df):,} map points", f"heatmap: {args.engine}"],
+                plotlyjs=args.report_plotlyjs,
+                archive=args.report_zip,
+            )
+            stage['bytes'] = sum(result['files'].values())
+        print_bundle_summary(result)
+        print("\n🌐 Open index.html in your browser to view!")
+        print("=" * 60)
+        metrics.finish()
+        return
+
+    # Save to HTML (serializes the figures)
+    with metrics.stage('render_html'):
+        map_fig.write_html('test_map.html')
+        heatmap_fig.write_html('test_heatmap.html')
+        if dom_fig is not None:
+            dom_fig.write_html('test_dom_heatmap.html')
+        if sketches is not None:
+            unique_fig.write_html('test_unique_visitors.html')
+            top_ips_fig.write_html('test_top_ips.html')
 
     print("\n✅ HTML files generated:")
     print(f"   - test_map.html ({len(map_df)} points)")
     print(f"   - test_heatmap.html")
+    if dom_df is not None:
+        print(f"   - test_dom_heatmap.html")
+    if sketches is not None:
+        print(f"   - test_unique_visitors.html")
+        print(f"   - test_top_ips.html")
     print("\n🌐 Open these files in your browser to view!")
     print("=" * 60)
+    metrics.finish()
 
 if __name__ == '__main__':
     main()
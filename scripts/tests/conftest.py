@@ -0,0 +1,43 @@
+"""
+Shared fixtures: a few thousand synthetic history events (synthetic_data.py)
+and a Backup_MongoDB-format file holding them, so the tests run offline.
+
+Run from scripts/:
+    python -m pytest tests -q
+"""
+
+from datetime import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_pipeline import HISTORY_COLLECTIONS  # noqa: E402
+from synthetic_data import synthetic_visitor_history, write_synthetic_backup  # noqa: E402
+
+NOW = datetime(2026, 10, 16, 12, 30)
+VISITOR_EVENTS = 4000
+LOGIN_EVENTS = 1500
+
+
+@pytest.fixture(scope='session')
+def visitor_events():
+    return list(synthetic_visitor_history(VISITOR_EVENTS, seed=7, now=NOW))
+
+
+@pytest.fixture(scope='session')
+def login_events():
+    return list(synthetic_visitor_history(LOGIN_EVENTS, seed=11, now=NOW))
+
+
+@pytest.fixture(scope='session')
+def backup_path(tmp_path_factory, visitor_events, login_events):
+    path = str(tmp_path_factory.mktemp('backup') / '2026-10-16T12-30-00_TangoTiempoProd.json.gz')
+    write_synthetic_backup(path, {
+        'VisitorTrackingAnalytics': [],
+        HISTORY_COLLECTIONS['visitors']: visitor_events,
+        HISTORY_COLLECTIONS['logins']: login_events,
+    })
+    return path
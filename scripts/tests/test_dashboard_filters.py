@@ -0,0 +1,78 @@
+"""FigureCache accounting under concurrent Dash callbacks"""
+
+from concurrent.futures import ThreadPoolExecutor
+import random
+import threading
+import time
+
+import pytest
+
+from dashboard_filters import FigureCache
+
+
+def assert_consistent(cache):
+    stats = cache.stats()
+    assert stats['bytes'] == sum(size for _, size in cache.entries.values())
+    assert stats['bytes'] <= stats['max_bytes']
+    assert not cache.pending
+
+
+def test_concurrent_misses_compute_once():
+    cache = FigureCache(max_bytes=1000)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return 'figure'
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(lambda _: cache.get('map-index', compute, sizeof=lambda value: 400), range(3)))
+
+    assert results == ['figure'] * 3 and len(calls) == 1
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'evictions': 0, 'entries': 1, 'bytes': 400,
+                             'max_bytes': 1000}
+
+
+def test_budget_holds_under_concurrent_load():
+    cache = FigureCache(max_bytes=5000)
+    rng = random.Random(4)
+    requests = [(rng.randrange(40), rng.randrange(100, 1500)) for _ in range(2000)]
+
+    def request(item):
+        key, size = item
+        # Nested lookups, like a figure computed from a cached map frame
+        return cache.get(('figure', key), lambda: cache.get(('frame', key), lambda: key, lambda value: size // 2),
+                         lambda value: size)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert list(pool.map(request, requests)) == [key for key, _ in requests]
+    assert_consistent(cache)
+
+
+def test_failed_compute_is_not_cached():
+    cache = FigureCache(max_bytes=1000)
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        # Fail only once the second thread waits on this computation
+        deadline = time.monotonic() + 5
+        while cache.stats()['hits'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        raise ValueError('no data')
+
+    def waiter():
+        started.wait()
+        return cache.get('key', lambda: 'unused')
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(cache.get, 'key', fail)
+        second = pool.submit(waiter)
+        with pytest.raises(ValueError):
+            first.result()
+        with pytest.raises(ValueError):
+            second.result()
+
+    assert cache.get('key', lambda: 'figure', lambda value: 10) == 'figure'
+    assert_consistent(cache)
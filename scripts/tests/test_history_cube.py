@@ -0,0 +1,76 @@
+"""HistoryCube window queries against a direct aggregate_history_events() pass"""
+
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from history_cube import HistoryCube, build_cube_from_events
+from history_pipeline import aggregate_history_events
+
+
+def with_local_dom(events):
+    """Copies of the events with dayOfMonthLocal filled in from timezoneOffset (exercises dom shifts)"""
+    for event in events:
+        if event.get('timezoneOffset') is None:
+            yield event
+        else:
+            local = event['timestamp'] + timedelta(minutes=event['timezoneOffset'])
+            yield {**event, 'dayOfMonthLocal': local.day}
+
+
+def random_windows(events, count, seed=3):
+    """Whole-hour [since, until) windows inside the events' range, plus the open-ended ones"""
+    first = min(event['timestamp'] for event in events).replace(minute=0, second=0, microsecond=0)
+    last = max(event['timestamp'] for event in events)
+    hours = int((last - first).total_seconds() // 3600) + 2
+    rng = np.random.default_rng(seed)
+    windows = [(None, None), (first + timedelta(hours=hours // 2), None), (None, first + timedelta(hours=100))]
+    for _ in range(count):
+        start, length = int(rng.integers(0, hours)), int(rng.choice([1, 23, 24 * 7 + 5, 24 * 45, 24 * 400]))
+        windows.append((first + timedelta(hours=start), first + timedelta(hours=start + length)))
+    return windows
+
+
+@pytest.fixture(scope='module')
+def events(visitor_events):
+    return list(with_local_dom(visitor_events))
+
+
+@pytest.fixture(scope='module')
+def cube(events, login_events):
+    return build_cube_from_events({'visitors': events, 'logins': login_events})
+
+
+@pytest.mark.parametrize('time_type', ['local', 'zulu'])
+def test_windows_match_direct_aggregation(cube, events, time_type):
+    for since, until in random_windows(events, 25):
+        dow, dom, count = aggregate_history_events(events, time_type, since, until)
+        result = cube.heatmaps(since, until, time_type, sources=['visitors'])
+        assert result['events'] == count, (since, until)
+        np.testing.assert_array_equal(result['dow'], dow, err_msg=f'{since} - {until}')
+        np.testing.assert_array_equal(result['dom'], dom, err_msg=f'{since} - {until}')
+
+
+def test_sources_add_up(cube, events, login_events):
+    dow, dom, count = aggregate_history_events(events + login_events)
+    result = cube.heatmaps()
+    assert result['events'] == count == len(cube)
+    np.testing.assert_array_equal(result['dow'], dow)
+    np.testing.assert_array_equal(result['dom'], dom)
+
+
+def test_merged_cubes_match_one_build(cube, events, login_events):
+    boundary = events[len(events) // 2]['timestamp'].replace(minute=0, second=0, microsecond=0)
+    by_source = {'visitors': events, 'logins': login_events}
+    older = build_cube_from_events(by_source, until=boundary)
+    newer = build_cube_from_events(by_source, since=boundary)
+    merged = older.merged(newer)
+    assert isinstance(merged, HistoryCube)
+    for since, until in random_windows(events, 10, seed=5):
+        for time_type in ('local', 'zulu'):
+            expected = cube.heatmaps(since, until, time_type)
+            result = merged.heatmaps(since, until, time_type)
+            assert result['events'] == expected['events']
+            np.testing.assert_array_equal(result['dow'], expected['dow'])
+            np.testing.assert_array_equal(result['dom'], expected['dom'])
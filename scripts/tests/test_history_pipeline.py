@@ -0,0 +1,69 @@
+"""The $match/$facet heatmap pipeline on mongomock against aggregate_history_events()"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from history_pipeline import (
+    HISTORY_COLLECTIONS,
+    aggregate_history_events,
+    fetch_history_heatmaps,
+    run_heatmap_pipeline,
+)
+
+mongomock = pytest.importorskip('mongomock')
+
+WINDOWS = [(None, None), (datetime(2025, 6, 1), datetime(2026, 2, 1, 13)), (datetime(2026, 9, 30), None)]
+
+
+def with_day_of_month(events):
+    """
+    Every other timezone-aware event gets stored dayOfMonth* fields, so both
+    sides of the $ifNull fallback (stored value, UTC date of timestamp) are counted
+    """
+    for position, event in enumerate(events):
+        if position % 2 or event.get('timezoneOffset') is None:
+            yield dict(event)
+        else:
+            local = event['timestamp'] + timedelta(minutes=event['timezoneOffset'])
+            yield {**event, 'dayOfMonthLocal': local.day, 'dayOfMonthZulu': event['timestamp'].day}
+
+
+@pytest.fixture(scope='module')
+def events(visitor_events, login_events):
+    return {'visitors': list(with_day_of_month(visitor_events)), 'logins': list(with_day_of_month(login_events))}
+
+
+@pytest.fixture(scope='module')
+def db(events):
+    database = mongomock.MongoClient().TangoTiempoProd
+    for source, documents in events.items():
+        # insert_many adds _id to the dicts it is given
+        database[HISTORY_COLLECTIONS[source]].insert_many([dict(document) for document in documents])
+    return database
+
+
+@pytest.mark.parametrize('time_type', ['local', 'zulu'])
+@pytest.mark.parametrize('since, until', WINDOWS)
+def test_pipeline_matches_python_twin(db, events, time_type, since, until):
+    dow, dom, count = run_heatmap_pipeline(db[HISTORY_COLLECTIONS['visitors']], time_type, since, until)
+    expected_dow, expected_dom, expected_count = aggregate_history_events(events['visitors'], time_type, since, until)
+    assert count == expected_count
+    np.testing.assert_array_equal(dow, expected_dow)
+    np.testing.assert_array_equal(dom, expected_dom)
+
+
+def test_day_of_month_fallback_is_exercised(events):
+    stored = sum(1 for event in events['visitors'] if 'dayOfMonthLocal' in event)
+    assert 0 < stored < len(events['visitors'])
+
+
+def test_collections_merge_cell_wise(db, events):
+    since, until = WINDOWS[1]
+    result = fetch_history_heatmaps(db, 'local', since, until, include_visitors=True, include_logins=True)
+    parts = [aggregate_history_events(events[source], 'local', since, until) for source in ('visitors', 'logins')]
+    np.testing.assert_array_equal(result['dow'], parts[0][0] + parts[1][0])
+    np.testing.assert_array_equal(result['dom'], parts[0][1] + parts[1][1])
+    assert result['sources'] == {HISTORY_COLLECTIONS['visitors']: parts[0][2],
+                                 HISTORY_COLLECTIONS['logins']: parts[1][2]}
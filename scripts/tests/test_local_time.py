@@ -0,0 +1,77 @@
+"""Vectorized local-time recompute against per-event zoneinfo conversion"""
+
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from local_time import EventTimes, corrected_fields, recompute_local_times
+
+# UTC instants on both sides of DST changes (and one zone without DST)
+TRANSITIONS = [
+    ('America/New_York', datetime(2026, 3, 8, 7)),
+    ('America/New_York', datetime(2026, 11, 1, 6)),
+    ('Europe/London', datetime(2026, 3, 29, 1)),
+    ('Europe/London', datetime(2026, 10, 25, 1)),
+    ('Australia/Sydney', datetime(2026, 4, 4, 16)),
+    ('America/Argentina/Buenos_Aires', datetime(2026, 12, 31, 23)),
+]
+
+
+def expected_fields(event):
+    """(day with Sunday = 0, hour, day of month) of one event, converted with zoneinfo"""
+    zone = event.get('ipinfo_timezone') or event.get('timezone')
+    local = event['timestamp'].replace(tzinfo=timezone.utc).astimezone(ZoneInfo(zone))
+    return (local.weekday() + 1) % 7, local.hour, local.day
+
+
+def transition_events():
+    events = []
+    for zone, moment in TRANSITIONS:
+        for minutes in range(-150, 151, 15):
+            events.append({'timestamp': moment + timedelta(minutes=minutes), 'timezone': zone})
+    return events
+
+
+def test_matches_zoneinfo(visitor_events):
+    events = transition_events() + [event for event in visitor_events
+                                    if event.get('ipinfo_timezone') or event.get('timezone')]
+    times = EventTimes.from_events(events)
+    local = recompute_local_times(times)
+    expected = np.array([expected_fields(event) for event in events])
+
+    np.testing.assert_array_equal(local.day, expected[:, 0])
+    np.testing.assert_array_equal(local.hour, expected[:, 1])
+    np.testing.assert_array_equal(local.dom, expected[:, 2])
+    assert sum(local.zone_rows.values()) == len(events)
+    assert local.invalid_zones == {} and local.missing_zone == 0
+
+
+def test_ipinfo_timezone_wins():
+    moment = datetime(2026, 7, 1, 3)
+    times = EventTimes.from_events([{'timestamp': moment, 'ipinfo_timezone': 'Asia/Tokyo', 'timezone': 'UTC'}])
+    local = recompute_local_times(times)
+    assert (local.day[0], local.hour[0], local.dom[0]) == (3, 12, 1)
+
+
+def test_unresolved_events_keep_stored_fields():
+    moment = datetime(2026, 7, 1, 3)
+    events = [
+        {'timestamp': moment, 'timezone': 'Mars/Olympus_Mons', 'dayOfWeekLocal': 'Tuesday', 'hourOfDayLocal': 23},
+        {'timestamp': moment, 'dayOfWeekLocal': 'Tuesday', 'hourOfDayLocal': 22, 'dayOfMonthLocal': 30},
+        {'timestamp': moment, 'timezone': 'America/Chicago', 'dayOfWeekLocal': 'Tuesday', 'hourOfDayLocal': 22},
+        {'timestamp': moment, 'timezone': 'America/Chicago'},
+        {'timestamp': 'not a date', 'timezone': 'America/Chicago'},
+    ]
+    times = EventTimes.from_events(events)
+    assert len(times) == 4
+
+    local = recompute_local_times(times)
+    assert local.invalid_zones == {'Mars/Olympus_Mons': 1}
+    assert local.missing_zone == 1
+
+    day, hour, dom, outcomes = corrected_fields(times, local)
+    assert outcomes == {'matched': 1, 'corrected': 0, 'filled': 1, 'unresolved': 2}
+    np.testing.assert_array_equal(day, [2, 2, 2, 2])
+    np.testing.assert_array_equal(hour, [23, 22, 22, 22])
+    np.testing.assert_array_equal(dom, [0, 30, 30, 30])
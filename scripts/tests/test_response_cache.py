@@ -0,0 +1,86 @@
+"""Stale-on-error policy of visualize_heatmap.fetch_heatmap_data() with a ResponseCache"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+from response_cache import ResponseCache
+
+pytest.importorskip('requests')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from visualize_heatmap import fetch_heatmap_data  # noqa: E402
+
+GOOD = {'success': True, 'data': {'heatmap': [], 'metadata': {'totalEvents': 7}}}
+
+
+class Endpoint(BaseHTTPRequestHandler):
+    """Answers with the server's current (status, body)"""
+
+    def do_GET(self):
+        status, body = self.server.reply
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Endpoint)
+    server.reply = (200, GOOD)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    # ttl 0: every call goes to the endpoint, the stored copy is only a fallback
+    return ResponseCache(str(tmp_path), ttl=0)
+
+
+def fetch(server, cache):
+    return fetch_heatmap_data(f'http://127.0.0.1:{server.server_port}/api/analytics/visitor-heatmap',
+                              verbose=False, cache=cache)
+
+
+def test_server_errors_use_the_stale_copy(endpoint, cache):
+    assert fetch(endpoint, cache) == GOOD['data']
+    endpoint.reply = (503, {'success': False, 'error': 'unavailable'})
+    assert fetch(endpoint, cache) == GOOD['data']
+    assert cache.stats['stale'] == 1
+
+
+@pytest.mark.parametrize('reply', [(404, {'error': 'not found'}), (200, {'success': False, 'error': 'bad range'})])
+def test_client_and_api_errors_raise(endpoint, cache, reply):
+    import requests
+
+    fetch(endpoint, cache)
+    endpoint.reply = reply
+    with pytest.raises(requests.exceptions.RequestException):
+        fetch(endpoint, cache)
+    assert cache.stats['stale'] == 0
+
+
+def test_connection_errors_respect_max_stale(endpoint, cache):
+    import requests
+
+    fetch(endpoint, cache)
+    endpoint.shutdown()
+    endpoint.server_close()
+    assert fetch(endpoint, cache) == GOOD['data']
+
+    cache.max_stale = 0
+    with pytest.raises(requests.exceptions.ConnectionError):
+        fetch(endpoint, cache)
@@ -0,0 +1,55 @@
+"""Sharded / process-pool history aggregation against the single-process backup pass"""
+
+from datetime import datetime
+import random
+
+import numpy as np
+import pytest
+
+from backup_source import fetch_backup_history_heatmaps, iter_backup_blocks
+from history_pipeline import HISTORY_COLLECTIONS, aggregate_history_events
+from sharded_aggregation import PartialAggregate, aggregate_block, fetch_sharded_heatmaps, run_sharded
+
+WINDOWS = [(None, None), (datetime(2025, 6, 1), datetime(2026, 2, 1, 13)), (datetime(2026, 9, 30), None)]
+
+
+def assert_same_heatmaps(result, expected):
+    np.testing.assert_array_equal(result['dow'], expected['dow'])
+    np.testing.assert_array_equal(result['dom'], expected['dom'])
+    assert result['sources'] == expected['sources']
+
+
+@pytest.mark.parametrize('time_type', ['local', 'zulu'])
+@pytest.mark.parametrize('since, until', WINDOWS)
+def test_in_process_matches_backup_pass(backup_path, time_type, since, until):
+    options = dict(time_type=time_type, since=since, until=until, include_visitors=True, include_logins=True)
+    expected = fetch_backup_history_heatmaps(backup_path, **options)
+    result = fetch_sharded_heatmaps(backup_path=backup_path, workers=1, **options)
+    assert_same_heatmaps(result, expected)
+    assert sum(result['geoSources'].values()) == sum(expected['sources'].values())
+
+
+def test_process_pool_matches_backup_pass(backup_path):
+    names = {HISTORY_COLLECTIONS[source]: source for source in ('visitors', 'logins')}
+    tasks = [(names[name], block, 'local', None, None)
+             for name, block in iter_backup_blocks(backup_path, list(names), block_bytes=64 << 10)]
+    assert len(tasks) > 4
+
+    total = run_sharded(aggregate_block, tasks, workers=2)
+    assert total.shards == len(tasks)
+    expected = fetch_backup_history_heatmaps(backup_path, include_logins=True)
+    assert_same_heatmaps(total.result(), expected)
+
+
+def test_merge_order_does_not_matter(visitor_events):
+    chunks = [visitor_events[start:start + 350] for start in range(0, len(visitor_events), 350)]
+    random.Random(1).shuffle(chunks)
+    total = PartialAggregate()
+    for chunk in chunks:
+        total.merge(PartialAggregate().add_events('visitors', chunk, chunk_size=100))
+
+    dow, dom, count = aggregate_history_events(visitor_events)
+    result = total.result(['visitors'])
+    np.testing.assert_array_equal(result['dow'], dow)
+    np.testing.assert_array_equal(result['dom'], dom)
+    assert result['sources'] == {HISTORY_COLLECTIONS['visitors']: count}
@@ -0,0 +1,76 @@
+"""Merged visitor sketches against one pass over all events"""
+
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from visitor_sketches import KINDS, FIELDS, VisitorSketches
+
+PRECISION = 10
+
+
+def sketch(events, capacity, chunk_size=500):
+    return VisitorSketches(PRECISION, capacity).add_events(events, chunk_size=chunk_size)
+
+
+def merged(parts, capacity):
+    total = VisitorSketches(PRECISION, capacity)
+    for part in parts:
+        total.merge(sketch(part, capacity, chunk_size=300))
+    return total
+
+
+def parts_of(events):
+    """Disjoint parts: a time split and an interleaved split"""
+    half = len(events) // 2
+    return [events[:half], events[half:]], [events[offset::3] for offset in range(3)]
+
+
+@pytest.mark.parametrize('split', [0, 1])
+def test_merge_equals_single_pass(visitor_events, split):
+    capacity = len(visitor_events)           # room for every key: top counts are exact
+    single = sketch(visitor_events, capacity)
+    total = merged(parts_of(visitor_events)[split], capacity)
+
+    assert (total.events, total.since, total.until) == (single.events, single.since, single.until)
+    for kind in KINDS:
+        np.testing.assert_array_equal(total.unique[kind].registers, single.unique[kind].registers)
+        assert dict(zip(total.top[kind].keys, total.top[kind].counts)) == \
+            dict(zip(single.top[kind].keys, single.top[kind].counts))
+        assert not total.top[kind].errors.any()
+
+
+def test_estimates_within_error(visitor_events):
+    total = merged(parts_of(visitor_events)[1], capacity=50)
+    for kind in KINDS:
+        exact = len({event[FIELDS[kind]] for event in visitor_events})
+        _, estimate = total.uniques(kind)
+        assert abs(estimate - exact) <= 4 * total.relative_error * exact
+
+
+def test_small_capacity_bounds_hold(visitor_events):
+    capacity = 40
+    total = merged(parts_of(visitor_events)[1], capacity)
+    for kind in KINDS:
+        exact = Counter(event[FIELDS[kind]] for event in visitor_events)
+        top = total.top[kind].top(capacity)
+        assert len(top) == capacity
+        for key, count, guaranteed in zip(top['key'], top['count'], top['guaranteed']):
+            assert guaranteed <= exact[key] <= count
+        # Every key heavier than the reported counts' floor must be reported
+        reported = set(top['key'])
+        floor = int(top['count'].min())
+        assert all(key in reported for key, count in exact.items() if count > floor)
+
+
+def test_save_load_round_trip(visitor_events, tmp_path):
+    single = sketch(visitor_events, capacity=100)
+    path = str(tmp_path / 'sketch.npz')
+    single.save(path)
+    loaded = VisitorSketches.load(path)
+    loaded.merge(VisitorSketches(PRECISION, 100))
+    assert (loaded.events, loaded.since, loaded.until) == (single.events, single.since, single.until)
+    for kind in KINDS:
+        np.testing.assert_array_equal(loaded.unique[kind].registers, single.unique[kind].registers)
+        assert list(loaded.top[kind].keys) == list(single.top[kind].keys)
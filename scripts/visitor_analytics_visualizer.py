@@ -8,40 +8,100 @@ Requirements:
 
 Usage:
     python visitor_analytics_visualizer.py
+    python visitor_analytics_visualizer.py --stream --batch-size 2000
+    python visitor_analytics_visualizer.py --engine=pipeline --range 3M
+    python visitor_analytics_visualizer.py --engine=snapshot [--rebuild-snapshot] [--verify-snapshot]
+    python visitor_analytics_visualizer.py --engine=cube --since 2026-01-05 --until 2026-01-12   # history_cube.py
+    python visitor_analytics_visualizer.py --include-logins   # + UserLoginAnalytics, loaded concurrently
+    python visitor_analytics_visualizer.py --backup 2026-02-09T03-00-00_TangoTiempoProd.json.gz
+    python visitor_analytics_visualizer.py --cache        # incremental local cache (--cache-only: offline)
+    python visitor_analytics_visualizer.py --static-map   # one pre-binned map instead of per-viewport loading
+    python visitor_analytics_visualizer.py --metrics stages.jsonl --profile   # per-stage timings (stage_metrics.py)
+    python visitor_analytics_visualizer.py --plain-payload   # plain JSON figures, no compression (figure_payload.py)
+    python visitor_analytics_visualizer.py --unique-visitors --range 30D   # HyperLogLog tab (visitor_sketches.py)
+    python visitor_analytics_visualizer.py --engine=pipeline --shard-workers 4   # process pool (sharded_aggregation.py)
+    python visitor_analytics_visualizer.py --preload   # load before serving (default: serve at once, load in the background)
 
 Environment Variables:
-    MONGODB_URI_PROD - MongoDB connection string (TangoTiempoProd database)
+    MONGODB_URI_PROD - MongoDB connection string (TangoTiempoProd database; not needed with --backup)
 """
 
 import os
 import sys
-from pymongo import MongoClient
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from dash import Dash, dcc, html, Input, Output
-import dash_bootstrap_components as dbc
+import argparse
+import time
+from heatmap_builder import build_heatmap_matrix, heatmap_to_frame, merge_matrices
+from visitor_ingest import (
+    DEFAULT_BATCH_SIZE,
+    MapAccumulator,
+    accumulate_visitor_batches,
+    iter_batches,
+    iter_visitor_batches,
+)
+from visitor_cache import ColumnAccumulator, VisitorCache, add_cache_arguments, load_visitor_columns, update_cache
+from dashboard_filters import (
+    TIME_RANGES,
+    TIME_TYPES,
+    DashboardFilters,
+    MB,
+    FigureCache,
+    add_filter_arguments,
+    filter_key,
+)
+from map_aggregation import add_map_aggregation_arguments, aggregate_map_points
+from spatial_index import (
+    DEFAULT_VIEWPORT_POINTS,
+    MapPointIndex,
+    add_viewport_arguments,
+    bbox_from_view,
+    viewport_from_relayout,
+)
+from backup_source import fetch_backup_history_heatmaps, iter_backup_documents
+from history_pipeline import (
+    add_pipeline_arguments,
+    dom_to_frame,
+    dow_to_frame,
+    fetch_history_heatmaps,
+    pipeline_window,
+)
+from heatmap_snapshot import add_snapshot_arguments, snapshot_matrices, update_snapshot
+from local_time import add_local_time_arguments, fetch_recomputed_heatmaps, print_recompute_report
+from sharded_aggregation import add_sharding_arguments, fetch_sharded_heatmaps, print_sharded_summary
+from history_cube import add_cube_arguments, update_cube
+from collection_loader import ANALYTICS_COLLECTIONS, ParallelLoader, add_loader_arguments, load_login_heatmap
+from geo_rollup import GEO_LEVELS
+from figure_payload import add_payload_arguments, enable_compression, figure_encoder, report_payloads
+from stage_metrics import StageMetrics, add_metrics_arguments
+from visitor_sketches import add_sketch_arguments, build_sketches, print_sketch_report
+from background_load import BackgroundLoader, LoadError, add_background_arguments, reloader_parent
+from visitor_figures import (
+    create_dom_heatmap_figure,
+    create_geo_rollup_figure,
+    create_heatmap_figure,
+    create_map_figure,
+    create_top_ips_figure,
+    create_unique_visitors_figure,
+    empty_map_figure,
+    loading_figure,
+    map_markers_figure,
+    message_figure,
+)
 
 # Configuration
 MONGODB_URI = os.getenv('MONGODB_URI_PROD')
 DATABASE_NAME = 'TangoTiempoProd'
 COLLECTION_NAME = 'VisitorTrackingAnalytics'
-
-# Color scheme
-COLORS = {
-    'GoogleGeolocation': '#4285F4',  # Google Blue
-    'IPInfoIO': '#EA4335',           # Google Red
-    'GoogleBrowser': '#34A853',      # Google Green
-    'Unknown': '#FBBC04'             # Google Yellow
-}
+LOAD_STATUS_COLORS = {'loading': 'info', 'ready': 'success', 'failed': 'danger'}
 
 def connect_to_mongodb():
-    """Connect to MongoDB and return database instance"""
+    """Connect to MongoDB and return database instance (LoadError if it cannot)"""
     if not MONGODB_URI:
         print("ERROR: MONGODB_URI_PROD environment variable not set")
         print("\nPlease set it with:")
         print('  export MONGODB_URI_PROD="mongodb+srv://..."')
-        sys.exit(1)
+        raise LoadError("MONGODB_URI_PROD environment variable not set")
+
+    from pymongo import MongoClient
 
     try:
         client = MongoClient(MONGODB_URI)
@@ -51,266 +111,733 @@ def connect_to_mongodb():
         return client[DATABASE_NAME]
     except Exception as e:
         print(f"❌ MongoDB connection failed: {e}")
-        sys.exit(1)
+        raise LoadError(f"MongoDB connection failed: {e}") from e
+
+def fetch_visitor_columns(db, batch_size=DEFAULT_BATCH_SIZE, progress=None, args=None):
+    """Fetch all visitor analytics from MongoDB straight into compact columns (no list of documents)"""
+    columns = ColumnAccumulator()
+    batches = iter_visitor_batches(db[COLLECTION_NAME], batch_size)
+    if progress is not None:
+        batches = progress.track(batches, lambda: partial_visitor_figures(columns, args))
+    store = load_visitor_columns(batches, columns)
+    print(f"✅ Fetched {len(store)} visitor records")
+    if len(store):
+        print(f"   Compact columns: {store.nbytes() / 1e6:.1f} MB, {store.nbytes() / len(store):.0f} bytes per visitor")
+    return store
+
+def stream_visitor_frames(db, batch_size=DEFAULT_BATCH_SIZE, backup_path=None, progress=None, args=None,
+                          keep_columns=True):
+    """
+    Stream projected batches (from MongoDB or a backup file) into the map and heatmap accumulators.
+    With keep_columns the filter columns (O(records)) are collected too; without them the store is None
+    and no partial figures are published.
+    """
+    columns = ColumnAccumulator() if keep_columns else None
+    if backup_path:
+        batches = iter_batches(iter_backup_documents(backup_path, COLLECTION_NAME), batch_size)
+    else:
+        batches = iter_visitor_batches(db[COLLECTION_NAME], batch_size)
+    if progress is not None:
+        batches = progress.track(batches, (lambda: partial_visitor_figures(columns, args)) if columns else None)
+    map_acc, heatmap_acc, record_count = accumulate_visitor_batches(batches, extra=(columns,) if columns else ())
+    print(f"✅ Streamed {record_count} visitor records (batch size {batch_size})")
+
+    map_df = map_acc.to_frame()
+    report_map_points(map_df)
+
+    heatmap_df = heatmap_acc.to_frame()
+    print(f"✅ Prepared heatmap data")
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
 
-def fetch_visitor_data(db):
-    """Fetch all visitor analytics from MongoDB"""
-    collection = db[COLLECTION_NAME]
+    return record_count, map_df, heatmap_df, columns.to_cache() if columns else None
 
-    # Get all documents
-    cursor = collection.find({})
-    data = list(cursor)
+def load_cached_frames(db, args):
+    """Map and heatmap frames read from the local columnar visitor cache"""
+    collection = None if args.cache_only else db[COLLECTION_NAME]
+    try:
+        cache = update_cache(collection, args)
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        raise LoadError(str(e)) from e
 
-    print(f"✅ Fetched {len(data)} visitor records")
-    return data
+    map_df = cache.map_frame()
+    report_map_points(map_df)
 
-def prepare_map_data(data):
-    """Prepare data for map visualization"""
-    map_points = []
-
-    for record in data:
-        # Extract Google API geolocation
-        if record.get('google_api_lat') and record.get('google_api_long'):
-            map_points.append({
-                'lat': record['google_api_lat'],
-                'long': record['google_api_long'],
-                'source': 'GoogleGeolocation',
-                'ip': record.get('ip', 'unknown'),
-                'visitor_id': record.get('visitor_id', 'N/A'),
-                'city': record.get('ipinfo_city', 'Unknown'),
-                'region': record.get('ipinfo_region', 'Unknown'),
-                'country': record.get('ipinfo_country', 'Unknown'),
-                'total_visits': record.get('totalVisits', 0)
-            })
+    heatmap_df = cache.heatmap_frame()
+    print(f"✅ Prepared heatmap data")
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
 
-        # Extract IPInfo geolocation
-        if record.get('ipinfo_lat') and record.get('ipinfo_long'):
-            map_points.append({
-                'lat': record['ipinfo_lat'],
-                'long': record['ipinfo_long'],
-                'source': 'IPInfoIO',
-                'ip': record.get('ip', 'unknown'),
-                'visitor_id': record.get('visitor_id', 'N/A'),
-                'city': record.get('ipinfo_city', 'Unknown'),
-                'region': record.get('ipinfo_region', 'Unknown'),
-                'country': record.get('ipinfo_country', 'Unknown'),
-                'total_visits': record.get('totalVisits', 0)
-            })
+    return len(cache), map_df, heatmap_df, cache
 
-    df = pd.DataFrame(map_points)
+def report_map_points(df):
+    """Print map point counts per geolocation source"""
     print(f"✅ Prepared {len(df)} map points")
     print(f"   - Google API points: {len(df[df['source'] == 'GoogleGeolocation'])}")
     print(f"   - IPInfo points: {len(df[df['source'] == 'IPInfoIO'])}")
 
+def prepare_map_data(data):
+    """Prepare data for map visualization (from a VisitorCache or a list of documents)"""
+    if isinstance(data, VisitorCache):
+        df = data.map_frame()
+    else:
+        map_acc = MapAccumulator()
+        map_acc.add_batch(data)
+        df = map_acc.to_frame()
+    report_map_points(df)
+
     return df
 
 def prepare_heatmap_data(data):
-    """Prepare data for time-of-day vs day-of-week heatmap"""
-    # Days of week in correct order
-    days_order = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    hours = list(range(24))
-
-    # Initialize heatmap matrix (24 hours x 7 days)
-    heatmap_matrix = pd.DataFrame(0, index=hours, columns=days_order)
-
-    # Aggregate visit counts from all records
-    for record in data:
-        # Use Local time if available, otherwise fall back to Zulu time
-        visits_by_day = record.get('visitsByDayOfWeekLocal') or record.get('visitsByDayOfWeekZulu', {})
-        visits_by_hour = record.get('visitsByHourLocal') or record.get('visitsByHourZulu', {})
-
-        # For simplicity, we'll use the aggregated hour/day counts
-        # Note: This is a simplified approach - each record represents a unique visitor's aggregated stats
-        for day_name, count in visits_by_day.items():
-            if day_name in days_order:
-                # Distribute visits evenly across hours (simplified for now)
-                # In a real scenario, you'd need to correlate hour and day from raw history
-                total_visits = record.get('totalVisits', 0)
-                if total_visits > 0:
-                    for hour, hour_count in visits_by_hour.items():
-                        try:
-                            hour_int = int(hour)
-                            if 0 <= hour_int < 24:
-                                # Proportional distribution
-                                proportion = hour_count / total_visits
-                                heatmap_matrix.loc[hour_int, day_name] += count * proportion
-                        except (ValueError, KeyError):
-                            continue
+    """Prepare data for time-of-day vs day-of-week heatmap (from a VisitorCache or a list of documents)"""
+    # Each record's day and hour counters are spread proportionally
+    # (day_count * hour_count / totalVisits) - see heatmap_builder
+    if isinstance(data, VisitorCache):
+        heatmap_matrix = data.heatmap_frame()
+    else:
+        heatmap_matrix = build_heatmap_matrix(data)
 
     print(f"✅ Prepared heatmap data")
     print(f"   Total visits in heatmap: {heatmap_matrix.sum().sum():.0f}")
 
     return heatmap_matrix
 
-def create_map_figure(df):
-    """Create interactive map with geolocation points"""
+def partial_visitor_figures(columns, args):
+    """Map (and visitor-counter heatmap) of the records read so far, published while the load runs"""
+    cache = columns.to_cache()
+    map_df = cache.map_frame()
+    if map_df.empty:
+        figures = {'map': message_figure("⏳ Waiting for geolocated visitors...")}
+    else:
+        markers, _ = aggregate_map_points(map_df, max_points=args.max_map_points, mode=args.map_bin)
+        figures = {'map': map_markers_figure(markers, map_df['lat'].mean(), map_df['long'].mean(),
+                                             subtitle=f'Loading: {len(map_df):,} points so far')}
+    if args.engine == 'analytics':
+        figures['heatmap'] = create_heatmap_figure(cache.heatmap_frame())
+    return figures
+
+def build_map_index(df):
+    """Build the spatial index once and report its size"""
+    started = time.perf_counter()
+    map_index = MapPointIndex(df)
+    print(f"✅ Spatial index: {len(map_index)} points, {map_index.nbytes() / 1e6:.1f} MB, "
+          f"built in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return map_index
+
+def viewport_map_figure(map_index, view, max_points=DEFAULT_VIEWPORT_POINTS):
+    """Figure with only the markers visible in `view` (see viewport_from_relayout)"""
+    markers, level = map_index.query(view['bbox'], view['zoom'], max_points=max_points)
+    subtitle = f"{int(markers['count'].sum()) if len(markers) else 0} visitors in view"
+    if level is not None and (markers['count'] > 1).any():
+        subtitle += f" · {len(markers)} cells (tile zoom {level})"
+    return map_markers_figure(markers, view['center_lat'], view['center_lon'], view['zoom'], subtitle)
+
+def create_viewport_map_figure(df, map_index, max_points=DEFAULT_VIEWPORT_POINTS, zoom=3):
+    """Initial page-load map: only the default viewport, capped at max_points markers"""
     if df.empty:
-        # Return empty figure
-        return go.Figure().add_annotation(
-            text="No geolocation data available",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5, showarrow=False,
-            font=dict(size=20)
-        )
-
-    fig = go.Figure()
-
-    # Add points for each geolocation source
-    for source, color in COLORS.items():
-        source_df = df[df['source'] == source]
-        if not source_df.empty:
-            fig.add_trace(go.Scattermapbox(
-                lat=source_df['lat'],
-                lon=source_df['long'],
-                mode='markers',
-                marker=dict(
-                    size=10,
-                    color=color,
-                    opacity=0.7
-                ),
-                name=source,
-                text=source_df.apply(lambda row:
-                    f"<b>{row['source']}</b><br>" +
-                    f"IP: {row['ip']}<br>" +
-                    f"Visitor: {row['visitor_id'][:8] if row['visitor_id'] != 'N/A' else 'N/A'}...<br>" +
-                    f"Location: {row['city']}, {row['region']}, {row['country']}<br>" +
-                    f"Total Visits: {row['total_visits']}",
-                    axis=1
-                ),
-                hoverinfo='text'
-            ))
-
-    # Calculate map center (average of all points)
-    center_lat = df['lat'].mean()
-    center_lon = df['long'].mean()
-
-    fig.update_layout(
-        mapbox=dict(
-            style='open-street-map',
-            center=dict(lat=center_lat, lon=center_lon),
-            zoom=3
-        ),
-        title=dict(
-            text='Visitor Geolocation Map<br><sub>Color by Data Source</sub>',
-            x=0.5,
-            xanchor='center'
-        ),
-        showlegend=True,
-        height=700,
-        margin=dict(l=0, r=0, t=60, b=0)
-    )
-
+        return empty_map_figure()
+
+    center_lat, center_lon = df['lat'].mean(), df['long'].mean()
+    view = {
+        'center_lat': center_lat,
+        'center_lon': center_lon,
+        'zoom': zoom,
+        'bbox': bbox_from_view(center_lat, center_lon, zoom),
+    }
+    fig = viewport_map_figure(map_index, view, max_points)
+    print(f"✅ Initial map: {sum(len(trace.lat) for trace in fig.data)} markers in the default viewport")
     return fig
 
-def create_heatmap_figure(heatmap_df):
-    """Create time-of-day vs day-of-week heatmap"""
-    if heatmap_df.empty or heatmap_df.sum().sum() == 0:
-        # Return empty figure
-        return go.Figure().add_annotation(
-            text="No temporal data available",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5, showarrow=False,
-            font=dict(size=20)
+def filtered_map_figure(filters, key, view, args):
+    """Map for one filter combination: per-viewport from a memoized index, or one pre-binned figure"""
+    if args.static_map:
+        return filters.memoize('map-figure', key[:1] + key[2:], lambda: create_map_figure(
+            filters.map_frame(key), max_points=args.max_map_points, bin_mode=args.map_bin
+        ))
+
+    map_df = filters.map_frame(key)
+    if map_df.empty:
+        return empty_map_figure()
+
+    map_index = filters.memoize('map-index', key[:1] + key[2:], lambda: build_map_index(map_df))
+    if view is None:
+        return filters.memoize('map-initial', key[:1] + key[2:], lambda: create_viewport_map_figure(
+            map_df, map_index, max_points=args.viewport_points
+        ))
+    return viewport_map_figure(map_index, view, args.viewport_points)
+
+def filtered_heatmap_figure(filters, key):
+    """Memoized 24x7 heatmap figure for one filter combination"""
+    return filters.memoize('heatmap-figure', key, lambda: create_heatmap_figure(filters.heatmap_frame(key)))
+
+def create_filter_controls(filters, filter_heatmap=True):
+    """Time range / time type / geo source / country controls above the tabs (no options while loading)"""
+    import dash_bootstrap_components as dbc
+    from dash import dcc, html
+
+    return dbc.Row([
+        dbc.Col([
+            html.Label("Last visit within"),
+            dcc.Dropdown(id='filter-range', options=TIME_RANGES, value='All', clearable=False),
+        ], md=2),
+        dbc.Col([
+            html.Label("Heatmap time" + ("" if filter_heatmap else " (fixed)")),
+            dbc.RadioItems(id='filter-time-type', value='auto', inline=True,
+                           options=[{'label': time_type.title(), 'value': time_type} for time_type in TIME_TYPES]),
+        ], md=3),
+        dbc.Col([
+            html.Label("Geo source"),
+            dcc.Dropdown(id='filter-source', options=filters.source_options() if filters is not None else [],
+                         value=[], multi=True, placeholder="All sources"),
+        ], md=3),
+        dbc.Col([
+            html.Label("Country"),
+            dcc.Dropdown(id='filter-country', options=filters.country_options() if filters is not None else [],
+                         value=[], multi=True, placeholder="All countries"),
+        ], md=4),
+    ], className="mb-3")
+
+def merge_login_heatmap(heatmap_df, loader):
+    """Add the UserLoginAnalytics counters to the visitor heatmap like the endpoint's mergeMatrices()"""
+    login_matrix, login_records = loader.result(ANALYTICS_COLLECTIONS['logins'])
+    merged_df = heatmap_to_frame(merge_matrices(heatmap_df.values, login_matrix))
+    print(f"✅ Merged {login_records} login analytics records into the heatmap")
+    print(f"   Total visits + logins in heatmap: {merged_df.sum().sum():.0f}")
+    return merged_df, login_records
+
+def load_pipeline_heatmaps(db, args):
+    """Exact DOW/DOM heatmaps from history events (server-side, or streamed from a backup file)"""
+    since, until = pipeline_window(args)
+    if args.recompute_local:
+        # Local fields rebuilt from timestamp + timezone on this side instead of $group-ed in MongoDB
+        result = fetch_recomputed_heatmaps(db, since, until, include_logins=args.include_logins,
+                                           backup_path=args.backup)
+        print_recompute_report(result['recompute'])
+    elif args.shard_workers:
+        # Partial aggregates built on a process pool over _id ranges / backup blocks, then summed
+        result = fetch_sharded_heatmaps(db, since, until, args.time_type, include_logins=args.include_logins,
+                                        backup_path=args.backup, workers=args.shard_workers)
+        print_sharded_summary(result)
+    elif args.backup:
+        result = fetch_backup_history_heatmaps(
+            args.backup,
+            time_type=args.time_type,
+            since=since,
+            until=until,
+            include_logins=args.include_logins
+        )
+    else:
+        result = fetch_history_heatmaps(
+            db,
+            time_type=args.time_type,
+            since=since,
+            until=until,
+            include_logins=args.include_logins
         )
 
-    # Convert to integers for display
-    heatmap_values = heatmap_df.round(0).astype(int)
-
-    fig = go.Figure(data=go.Heatmap(
-        z=heatmap_values.values,
-        x=heatmap_df.columns,  # Days of week
-        y=heatmap_df.index,     # Hours of day (0-23)
-        colorscale='YlOrRd',
-        text=heatmap_values.values,
-        texttemplate='%{text}',
-        textfont={"size": 10},
-        hovertemplate='<b>%{x}</b><br>Hour: %{y}:00<br>Visits: %{z}<extra></extra>',
-        colorbar=dict(title="Visits")
-    ))
-
-    fig.update_layout(
-        title=dict(
-            text='Visitor Traffic Heatmap<br><sub>Time of Day vs Day of Week</sub>',
-            x=0.5,
-            xanchor='center'
-        ),
-        xaxis=dict(title='Day of Week', side='bottom'),
-        yaxis=dict(
-            title='Hour of Day',
-            autorange='reversed',  # 0 at top, 23 at bottom
-            tickmode='linear',
-            tick0=0,
-            dtick=1
-        ),
-        height=700,
-        margin=dict(l=100, r=50, t=100, b=50)
-    )
-
-    return fig
+    heatmap_df = dow_to_frame(result['dow'])
+    dom_df = dom_to_frame(result['dom'])
+
+    print(f"✅ Aggregated history heatmaps ({args.time_type} time{', recomputed' if args.recompute_local else ''})")
+    for name, events in result['sources'].items():
+        print(f"   - {name}: {events} events")
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
+
+    return heatmap_df, dom_df
+
+def load_snapshot_heatmaps(db, args):
+    """All-time DOW/DOM heatmaps from the incremental snapshot (new events folded in)"""
+    snapshot = update_snapshot(db, args)
+    dow, dom, _ = snapshot_matrices(snapshot, args.time_type, include_logins=args.include_logins)
+
+    heatmap_df = dow_to_frame(dow)
+    dom_df = dom_to_frame(dom)
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
+
+    return heatmap_df, dom_df
+
+def load_cube_heatmaps(db, args):
+    """DOW/DOM heatmaps for the --range/--since/--until window from the hourly history cube"""
+    cube = update_cube(db, args, backup_path=args.backup)
+    since, until = pipeline_window(args)
+    sources = ['visitors', 'logins'] if args.include_logins else ['visitors']
+    result = cube.heatmaps(since, until, args.time_type, sources=sources)
+
+    heatmap_df = dow_to_frame(result['dow'])
+    dom_df = dom_to_frame(result['dom'])
+    print(f"   {result['events']} events in window ({args.time_type} time)")
+    print(f"   Total visits in heatmap: {heatmap_df.sum().sum():.0f}")
+
+    return heatmap_df, dom_df
+
+def load_unique_visitors(db, args):
+    """HyperLogLog / top-K sketches of the history events in the --range/--since/--until window"""
+    since, until = pipeline_window(args)
+    sketches = build_sketches(db, since, until, args.time_type, include_logins=args.include_logins,
+                              backup_path=args.backup, precision=args.sketch_precision)
+    print_sketch_report(sketches, top=10)
+    return sketches
+
+def heatmap_follows_filters(args):
+    """Only the visitor-counter heatmap can be recomputed per filter (not history or merged logins)"""
+    return args.engine == 'analytics' and not args.include_logins
+
+def dashboard_figure_ids(args):
+    """Graph component ids the dashboard shows for these options, in tab order"""
+    return (['map', 'heatmap'] + (['dom-heatmap'] if args.engine != 'analytics' else [])
+            + (['geo-rollup'] if not args.no_filters else [])
+            + (['unique-heatmap', 'top-ips'] if args.unique_visitors else []))
+
+def create_load_status(background, poll_ms):
+    """Status line, retry button and poll timer for the background load"""
+    import dash_bootstrap_components as dbc
+    from dash import dcc, html
+
+    state = background.progress.snapshot()
+    return html.Div([
+        dbc.Alert(background.progress.describe(), id='load-status', color=LOAD_STATUS_COLORS[state['status']],
+                  className="py-2 mb-2"),
+        dbc.Button("Retry load", id='load-retry', color='danger', size='sm', className="mb-3",
+                   style={} if state['status'] == 'failed' else {'display': 'none'}),
+        dcc.Interval(id='load-poll', interval=poll_ms, disabled=state['status'] == 'ready'),
+        dcc.Store(id='load-version', data=state['version']),
+    ])
+
+def create_dash_app(map_fig, heatmap_fig, dom_fig=None, filters=None, args=None, geo_fig=None, unique_figs=None,
+                    background=None):
+    """
+    Create Dash application with tabs; with filters the map and heatmap follow the controls.
+    With a BackgroundLoader the figures start as placeholders: the page polls the load, shows its
+    progress, receives partial and final figures as they are published, and can retry a failed load.
+    """
+    import dash_bootstrap_components as dbc
+    from dash import Dash, Input, Output, State, callback_context, dcc, html, no_update
+    from dash.exceptions import PreventUpdate
 
-def create_dash_app(map_fig, heatmap_fig):
-    """Create Dash application with tabs"""
     app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+    filter_heatmap = args is None or heatmap_follows_filters(args)
+    # Typed arrays in every figure sent to the browser, gzip/brotli on every response
+    encode = figure_encoder(args)
+    if args is None or not args.plain_payload:
+        enable_compression(app.server)
 
+    def current_filters():
+        """The DashboardFilters once the data is there (None while a background load runs)"""
+        return filters if background is None else background.state
+
+    has_filters = filters is not None or (background is not None and not args.no_filters)
     app.layout = dbc.Container([
         html.H1("Visitor Analytics Dashboard", className="text-center my-4"),
         html.Hr(),
+    ] + ([create_load_status(background, args.poll_ms)] if background is not None else [])
+      + ([create_filter_controls(filters, filter_heatmap)] if has_filters else []) + [
 
         dbc.Tabs([
             dbc.Tab(
-                dcc.Graph(id='map', figure=map_fig),
+                dcc.Graph(id='map', figure=encode(map_fig)),
                 label='📍 Geolocation Map',
                 tab_id='map-tab'
             ),
             dbc.Tab(
-                dcc.Graph(id='heatmap', figure=heatmap_fig),
+                dcc.Graph(id='heatmap', figure=encode(heatmap_fig)),
                 label='🔥 Time Heatmap',
                 tab_id='heatmap-tab'
             ),
-        ], id='tabs', active_tab='map-tab'),
+        ] + ([
+            dbc.Tab(
+                dcc.Graph(id='dom-heatmap', figure=encode(dom_fig)),
+                label='📅 Day of Month Heatmap',
+                tab_id='dom-heatmap-tab'
+            ),
+        ] if dom_fig is not None else []) + ([
+            dbc.Tab([
+                dbc.RadioItems(id='geo-level', value='country', inline=True, className="mt-3",
+                               options=[{'label': level.title(), 'value': level} for level in GEO_LEVELS]),
+                dcc.Graph(id='geo-rollup', figure=encode(geo_fig)),
+            ], label='🌍 Geography', tab_id='geo-tab'),
+        ] if geo_fig is not None else []) + ([
+            dbc.Tab([
+                dcc.Graph(id='unique-heatmap', figure=encode(unique_figs[0])),
+                dcc.Graph(id='top-ips', figure=encode(unique_figs[1])),
+            ], label='👥 Unique Visitors', tab_id='unique-tab'),
+        ] if unique_figs is not None else []), id='tabs', active_tab='map-tab'),
 
         html.Hr(),
         html.Div([
             html.P("Data Source: TangoTiempoProd.VisitorTrackingAnalytics", className="text-muted text-center"),
-            html.P("🔵 Google API  🔴 IPInfo.io", className="text-center")
+            html.P("🔵 Google API  🔴 IPInfo.io", className="text-center"),
+            html.P(filters.cache.describe() if filters is not None else "", id='filter-cache-stats',
+                   className="text-muted text-center small")
         ])
     ], fluid=True)
 
+    if background is not None:
+        figure_ids = ['map', 'heatmap'] + [figure_id for figure_id, fig in (
+            ('dom-heatmap', dom_fig), ('geo-rollup', geo_fig),
+            ('unique-heatmap', unique_figs), ('top-ips', unique_figs),
+        ) if fig is not None]
+        # Without filter controls (--no-filters) there are no options or cache stats to fill in
+        control_outputs = [
+            Output('filter-source', 'options'),
+            Output('filter-country', 'options'),
+            Output('filter-cache-stats', 'children', allow_duplicate=True),
+        ] if has_filters else []
+
+        @app.callback(
+            [
+                Output('load-status', 'children'),
+                Output('load-status', 'color'),
+                Output('load-retry', 'style'),
+                Output('load-poll', 'disabled'),
+                Output('load-version', 'data'),
+            ] + control_outputs + [Output(figure_id, 'figure', allow_duplicate=True) for figure_id in figure_ids],
+            Input('load-poll', 'n_intervals'),
+            Input('load-retry', 'n_clicks'),
+            State('load-version', 'data'),
+            prevent_initial_call=True
+        )
+        def poll_load(n_intervals, retry_clicks, version):
+            """Progress line every tick; figures only when the load has published since the last tick"""
+            figures = [no_update] * len(figure_ids)
+            if 'load-retry.n_clicks' in {trigger['prop_id'] for trigger in callback_context.triggered}:
+                if background.retry():
+                    figures = [encode(loading_figure())] * len(figure_ids)
+
+            state = background.progress.snapshot(since=version)
+            controls = [no_update] * len(control_outputs)
+            if state['version'] != version:
+                figures = [encode(state['figures'][figure_id]) if figure_id in state['figures'] else figure
+                           for figure_id, figure in zip(figure_ids, figures)]
+                if state['status'] == 'ready' and control_outputs:
+                    loaded = current_filters()
+                    controls = [loaded.source_options(), loaded.country_options(), loaded.cache.describe()]
+
+            return [
+                background.progress.describe(),
+                LOAD_STATUS_COLORS[state['status']],
+                {} if state['status'] == 'failed' else {'display': 'none'},
+                state['status'] != 'loading',
+                state['version'],
+            ] + controls + figures
+
+    if has_filters:
+        @app.callback(
+            Output('map', 'figure'),
+            Output('heatmap', 'figure'),
+            Output('filter-cache-stats', 'children'),
+            Input('map', 'relayoutData'),
+            Input('filter-range', 'value'),
+            Input('filter-time-type', 'value'),
+            Input('filter-source', 'value'),
+            Input('filter-country', 'value'),
+            prevent_initial_call=True
+        )
+        def update_dashboard(relayout, time_range, time_type, sources, countries):
+            """Re-query the map for pan/zoom; rebuild (or fetch memoized) figures for filter changes"""
+            loaded = current_filters()
+            if loaded is None:
+                raise PreventUpdate
+            key = filter_key(time_range, time_type, sources, countries)
+            view = viewport_from_relayout(relayout)
+            triggered = {trigger['prop_id'] for trigger in callback_context.triggered}
+
+            if triggered == {'map.relayoutData'}:
+                if view is None or args.static_map:
+                    raise PreventUpdate
+                return encode(filtered_map_figure(loaded, key, view, args)), no_update, loaded.cache.describe()
+
+            map_fig = encode(filtered_map_figure(loaded, key, view, args))
+            heatmap_fig = encode(filtered_heatmap_figure(loaded, key)) if filter_heatmap else no_update
+            return map_fig, heatmap_fig, loaded.cache.describe()
+
+        if geo_fig is not None:
+            @app.callback(
+                Output('geo-rollup', 'figure'),
+                Input('geo-level', 'value'),
+                Input('filter-range', 'value'),
+                Input('filter-source', 'value'),
+                Input('filter-country', 'value'),
+                prevent_initial_call=True
+            )
+            def update_geo_rollup(level, time_range, sources, countries):
+                """Rollups come from the dictionary-encoded columns; figures are memoized per filter"""
+                loaded = current_filters()
+                if loaded is None:
+                    raise PreventUpdate
+                key = filter_key(time_range, 'auto', sources, countries)
+                return encode(loaded.memoize(f'geo-figure-{level}', key, lambda: create_geo_rollup_figure(
+                    loaded.geo_rollup(key, level), level
+                )))
+
     return app
 
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Visitor analytics dashboard')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream projected batches instead of loading every document first')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Cursor batch size when fetching or streaming (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--backup', type=str,
+                        help='Read a Backup_MongoDB .json.gz file instead of MONGODB_URI_PROD (implies --stream)')
+    parser.add_argument('--no-filters', action='store_true',
+                        help='With --stream/--backup: keep only the map points and heatmap counts, not the '
+                             'per-visitor filter columns (no filter controls, no geography tab, binned map)')
+    add_cache_arguments(parser)
+    add_map_aggregation_arguments(parser)
+    add_viewport_arguments(parser)
+    add_filter_arguments(parser)
+    add_pipeline_arguments(parser)
+    add_local_time_arguments(parser)
+    add_sharding_arguments(parser)
+    add_snapshot_arguments(parser)
+    add_cube_arguments(parser)
+    add_loader_arguments(parser)
+    add_payload_arguments(parser)
+    add_sketch_arguments(parser)
+    add_background_arguments(parser)
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    args.use_cache = args.cache or args.cache_only or args.rebuild_cache
+    if args.backup and args.engine == 'snapshot':
+        parser.error('--engine=snapshot needs a live database; use --engine=pipeline with --backup')
+    if args.backup and args.use_cache:
+        parser.error('--backup cannot be combined with the visitor cache options')
+    if args.cache_only and args.engine != 'analytics':
+        parser.error('--cache-only only supports --engine=analytics')
+    if args.recompute_local and (args.engine != 'pipeline' or args.time_type != 'local'):
+        parser.error('--recompute-local only applies to --engine=pipeline with --time-type local')
+    if args.shard_workers and (args.engine != 'pipeline' or args.recompute_local):
+        parser.error('--shard-workers only applies to --engine=pipeline (without --recompute-local)')
+    if args.cache_only and args.include_logins:
+        parser.error('--include-logins reads UserLoginAnalytics; it cannot be combined with --cache-only')
+    if args.no_filters and not (args.stream or args.backup):
+        parser.error('--no-filters only applies to --stream/--backup (the other loads keep the columns anyway)')
+    if args.unique_visitors and args.cache_only:
+        parser.error('--unique-visitors reads history events; it cannot be combined with --cache-only')
+    return args
+
+def publish_when_done(future, progress, build):
+    """Publish build(result) as soon as a parallel load finishes; a failure surfaces later at result()"""
+    def done(future):
+        if not future.cancelled() and future.exception() is None:
+            progress.publish(build(future.result()))
+    future.add_done_callback(done)
+
+def load_dashboard(args, metrics, progress):
+    """
+    Connect, fetch, aggregate and build every figure; returns ({component id: figure}, DashboardFilters).
+    Runs on the background thread (or before the server with --preload); `progress` gets the
+    status line, the record count and partial figures as batches and parallel loads come in.
+    """
+    if args.backup:
+        # Offline: everything is streamed out of the backup file
+        db = None
+        print(f"📦 Reading backup: {args.backup}")
+    elif args.cache_only:
+        db = None
+    else:
+        # Connect to MongoDB
+        progress.stage("Connecting to MongoDB")
+        with metrics.stage('connect'):
+            db = connect_to_mongodb()
+
+    # History aggregations and login counters load on worker threads (sharing
+    # the client's connection pool) while the visitor analytics are read
+    with ParallelLoader(args.load_workers) as loader:
+        if args.engine == 'pipeline':
+            publish_when_done(loader.submit('history', load_pipeline_heatmaps, db, args), progress, lambda frames: {
+                'heatmap': create_heatmap_figure(frames[0]), 'dom-heatmap': create_dom_heatmap_figure(frames[1]),
+            })
+        if args.engine == 'analytics' and args.include_logins:
+            loader.submit(ANALYTICS_COLLECTIONS['logins'], load_login_heatmap, db, args.batch_size, args.backup)
+        if args.unique_visitors:
+            publish_when_done(loader.submit('sketches', load_unique_visitors, db, args), progress, lambda sketches: {
+                'unique-heatmap': create_unique_visitors_figure(sketches), 'top-ips': create_top_ips_figure(sketches),
+            })
+
+        if args.use_cache:
+            print("\n📊 Loading visitor cache...")
+            progress.stage("Loading visitor cache")
+            with metrics.stage('cache') as stage:
+                record_count, map_df, heatmap_df, store = load_cached_frames(db, args)
+                stage['records'] = record_count
+            progress.add_records(record_count)
+
+            if not record_count:
+                print("⚠️  No visitor data found in cache")
+                raise LoadError("No visitor data found in cache")
+        elif args.stream or args.backup:
+            # Single pass over projected batches
+            print("\n📊 Streaming visitor data...")
+            progress.stage("Streaming visitor data")
+            with metrics.stage('stream') as stage:
+                record_count, map_df, heatmap_df, store = stream_visitor_frames(
+                    db, batch_size=args.batch_size, backup_path=args.backup, progress=progress, args=args,
+                    keep_columns=not args.no_filters
+                )
+                stage['records'] = record_count
+
+            if not record_count:
+                print("⚠️  No visitor data found in collection")
+                raise LoadError("No visitor data found in collection")
+        else:
+            # Fetch data
+            progress.stage("Fetching visitor analytics")
+            with metrics.stage('fetch') as stage:
+                store = fetch_visitor_columns(db, args.batch_size, progress=progress, args=args)
+                stage['records'] = len(store)
+                stage['bytesPerVisitor'] = round(store.nbytes() / len(store), 1) if len(store) else None
+
+            if not len(store):
+                print("⚠️  No visitor data found in collection")
+                raise LoadError("No visitor data found in collection")
+
+            # Prepare visualizations
+            print("\n📊 Preparing visualizations...")
+            progress.stage("Preparing visualizations")
+            with metrics.stage('prepare_map', records=len(store)):
+                map_df = prepare_map_data(store)
+            if args.engine == 'analytics':
+                with metrics.stage('prepare_heatmap', records=len(store)):
+                    heatmap_df = prepare_heatmap_data(store)
+
+        if ANALYTICS_COLLECTIONS['logins'] in loader:
+            progress.stage("Merging login analytics")
+            with metrics.stage('login_analytics') as stage:
+                heatmap_df, stage['records'] = merge_login_heatmap(heatmap_df, loader)
+
+        dom_fig = None
+        if args.engine == 'pipeline':
+            print("\n📊 Aggregating history heatmaps...")
+            progress.stage("Aggregating history heatmaps")
+            with metrics.stage('history_pipeline'):
+                heatmap_df, dom_df = loader.result('history')
+                dom_fig = create_dom_heatmap_figure(dom_df)
+        elif args.engine == 'snapshot':
+            print("\n📊 Updating heatmap snapshot...")
+            progress.stage("Updating heatmap snapshot")
+            with metrics.stage('history_snapshot'):
+                heatmap_df, dom_df = load_snapshot_heatmaps(db, args)
+                dom_fig = create_dom_heatmap_figure(dom_df)
+        elif args.engine == 'cube':
+            print("\n📊 Querying history cube...")
+            progress.stage("Querying history cube")
+            with metrics.stage('history_cube'):
+                heatmap_df, dom_df = load_cube_heatmaps(db, args)
+                dom_fig = create_dom_heatmap_figure(dom_df)
+
+        unique_figs = None
+        if 'sketches' in loader:
+            print("\n📊 Sketching unique visitors...")
+            progress.stage("Sketching unique visitors")
+            with metrics.stage('unique_visitors') as stage:
+                sketches = loader.result('sketches')
+                unique_figs = (create_unique_visitors_figure(sketches), create_top_ips_figure(sketches))
+                stage['records'] = sketches.events
+                stage['sketchBytes'] = sketches.nbytes()
+
+    progress.stage("Building figures")
+    if store is None:
+        # --no-filters: no per-visitor columns, so one pre-binned map and no geography tab
+        filters = geo_fig = None
+        with metrics.stage('map_figure', records=len(map_df)):
+            map_fig = create_map_figure(map_df, max_points=args.max_map_points, bin_mode=args.map_bin)
+        with metrics.stage('heatmap_figure'):
+            heatmap_fig = create_heatmap_figure(heatmap_df)
+    else:
+        # Through the filter cache, so the unfiltered view is already memoized
+        filter_heatmap = heatmap_follows_filters(args)
+        with metrics.stage('map_figure', records=len(map_df)):
+            filters = DashboardFilters(store, FigureCache(args.figure_cache_mb * MB))
+            filters.prime(map_df, heatmap_df if filter_heatmap else None)
+            map_fig = filtered_map_figure(filters, filter_key(), None, args)
+        with metrics.stage('heatmap_figure'):
+            if filter_heatmap:
+                heatmap_fig = filtered_heatmap_figure(filters, filter_key())
+            else:
+                heatmap_fig = create_heatmap_figure(heatmap_df)
+
+        with metrics.stage('geo_rollup', records=len(store)):
+            geo_df = filters.geo_rollup(filter_key(), 'country')
+            geo_fig = filters.memoize('geo-figure-country', filter_key(), lambda: create_geo_rollup_figure(geo_df))
+        codes = filters.geo_codes()
+        print(f"✅ Geo rollup: {len(geo_df)} countries, {len(codes.categories['region'])} regions, "
+              f"{len(codes.categories['city'])} cities ({codes.nbytes() / MB:.1f} MB encoded; "
+              f"map frame {map_df.memory_usage(deep=True).sum() / MB:.1f} MB)")
+
+    # What the first page load pays to send the figures to the browser. Measuring serializes every
+    # figure twice and compresses it, so it only runs when the stages are being reported
+    if metrics.enabled:
+        with metrics.stage('serialize') as stage:
+            payloads = report_payloads({'map': map_fig, 'heatmap': heatmap_fig, 'dom-heatmap': dom_fig,
+                                        'geo': geo_fig,
+                                        **(dict(zip(('unique', 'top-ips'), unique_figs)) if unique_figs else {})})
+            sent = 'plain' if args.plain_payload else 'compressed'
+            stage['bytes'] = sum(size[sent] for size in payloads.values())
+            stage['payloadBytes'] = payloads
+
+    figures = {'map': map_fig, 'heatmap': heatmap_fig, 'dom-heatmap': dom_fig, 'geo-rollup': geo_fig,
+               **(dict(zip(('unique-heatmap', 'top-ips'), unique_figs)) if unique_figs else {})}
+    return {figure_id: fig for figure_id, fig in figures.items() if fig is not None}, filters
+
 def main():
     """Main execution"""
+    args = parse_args()
+    metrics = StageMetrics.from_args('visitor_analytics_visualizer', args)
+
     print("=" * 60)
     print("Visitor Analytics Visualizer")
     print("=" * 60)
 
-    # Connect to MongoDB
-    db = connect_to_mongodb()
-
-    # Fetch data
-    visitor_data = fetch_visitor_data(db)
-
-    if not visitor_data:
-        print("⚠️  No visitor data found in collection")
-        sys.exit(1)
-
-    # Prepare visualizations
-    print("\n📊 Preparing visualizations...")
-    map_df = prepare_map_data(visitor_data)
-    heatmap_df = prepare_heatmap_data(visitor_data)
-
-    # Create figures
-    map_fig = create_map_figure(map_df)
-    heatmap_fig = create_heatmap_figure(heatmap_df)
+    # Stages recorded before the first attempt (dash_app in the background mode)
+    startup_stages = []
+
+    def load(progress):
+        # Every attempt starts from the start-up stages; a failed attempt's stages are dropped
+        # so a retry's --metrics line only carries its own
+        metrics.stages = list(startup_stages)
+        try:
+            loaded = load_dashboard(args, metrics, progress)
+        except Exception:
+            metrics.stages = list(startup_stages)
+            raise
+        if not args.preload:
+            metrics.finish()
+            print("✅ Dashboard data loaded")
+        return loaded
+
+    background = BackgroundLoader(load)
+    if args.preload:
+        # Everything before the server, as before; a failed load ends the process
+        try:
+            background.run()
+        except LoadError:
+            sys.exit(1)
 
     # Create Dash app
     print("\n🚀 Starting Dash application...")
     print("📍 Open browser to: http://127.0.0.1:8050")
+    if not args.preload:
+        print("   Data loads in the background; the page shows progress and fills in as it arrives")
     print("   Press Ctrl+C to stop")
     print("=" * 60)
 
-    app = create_dash_app(map_fig, heatmap_fig)
-    app.run_server(debug=True, host='127.0.0.1', port=8050)
+    with metrics.stage('dash_app'):
+        published = background.progress.snapshot()['figures']
+        figures = {figure_id: published.get(figure_id) or loading_figure() for figure_id in dashboard_figure_ids(args)}
+        app = create_dash_app(figures['map'], figures['heatmap'], figures.get('dom-heatmap'),
+                              filters=background.state, args=args, geo_fig=figures.get('geo-rollup'),
+                              unique_figs=(figures['unique-heatmap'], figures['top-ips'])
+                              if args.unique_visitors else None,
+                              background=background)
+    if args.preload:
+        metrics.finish()
+    elif not reloader_parent():
+        startup_stages.extend(metrics.stages)
+        # Only the process that serves requests loads (the debug reloader's watcher never does)
+        background.start()
+    app.run(debug=True, host='127.0.0.1', port=8050)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Visitor Cache
+Columnar on-disk cache of the projected VisitorTrackingAnalytics fields
+
+Layout (one directory, default scripts/visitor_cache/):
+    meta.json              version, row count, high-water `updatedAt`
+    <column>.npy           one NumPy array per column, loaded memory-mapped
+
+Columns:
+    _id, ip, visitor_id, city, region, country    fixed-width unicode
+    google_lat/long, ipinfo_lat/long              float64 (NaN = missing)
+    total_visits                                  int64
+    last_visit                                    datetime64[s] (NaT = missing)
+    days_local/zulu (N x 7), hours_local/zulu (N x 24)   int32 counters
+    has_days_local, has_hours_local               bool (Local dict present)
+
+Analytics documents are upserted on every visit, so a refresh queries
+`updatedAt >= high-water mark`, overwrites rows whose `_id` is already cached
+and appends the rest. A warm start is just np.load(mmap_mode='r') per column.
+
+Requirements:
+    pip install pymongo numpy pandas
+"""
+
+from datetime import datetime, timezone
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from history_pipeline import event_timestamp
+from heatmap_builder import day_matrix, heatmap_from_vectors, heatmap_to_frame, hour_matrix
+from visitor_ingest import (
+    DEFAULT_BATCH_SIZE,
+    MAP_COLUMNS,
+    MAP_SOURCES,
+    VISITOR_PROJECTION,
+    categorize_map_frame,
+    iter_visitor_batches,
+)
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.getenv('VISITOR_CACHE_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'visitor_cache'
+)
+
+# column -> (record field, default when the field is absent)
+STRING_COLUMNS = {
+    'ip': ('ip', 'unknown'),
+    'visitor_id': ('visitor_id', 'N/A'),
+    'city': ('ipinfo_city', 'Unknown'),
+    'region': ('ipinfo_region', 'Unknown'),
+    'country': ('ipinfo_country', 'Unknown'),
+}
+COORDINATE_COLUMNS = {
+    'google_lat': 'google_api_lat',
+    'google_long': 'google_api_long',
+    'ipinfo_lat': 'ipinfo_lat',
+    'ipinfo_long': 'ipinfo_long',
+}
+SOURCE_COORDINATES = {
+    'GoogleGeolocation': ('google_lat', 'google_long'),
+    'IPInfoIO': ('ipinfo_lat', 'ipinfo_long'),
+}
+COUNTER_COLUMNS = {
+    'days_local': 7,
+    'days_zulu': 7,
+    'hours_local': 24,
+    'hours_zulu': 24,
+}
+ALL_COLUMNS = (
+    ['_id'] + list(STRING_COLUMNS) + list(COORDINATE_COLUMNS) + ['total_visits', 'last_visit']
+    + list(COUNTER_COLUMNS) + ['has_days_local', 'has_hours_local']
+)
+
+CACHE_PROJECTION = {**VISITOR_PROJECTION, 'updatedAt': 1}
+
+
+def _coordinate(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+def _string(value):
+    # None is stored as '' and restored on read
+    return '' if value is None else str(value)
+
+
+def _timestamp(value):
+    moment = event_timestamp(value)
+    return np.datetime64('NaT', 's') if moment is None else np.datetime64(moment, 's')
+
+
+def columns_from_records(records):
+    """Convert a batch of analytics documents into in-memory column arrays"""
+    totals = [record.get('totalVisits', 0) for record in records]
+    days_local = [record.get('visitsByDayOfWeekLocal') or {} for record in records]
+    hours_local = [record.get('visitsByHourLocal') or {} for record in records]
+    columns = {
+        '_id': np.array([str(record.get('_id', '')) for record in records], dtype=str),
+        'total_visits': np.array([total if isinstance(total, (int, float)) else 0 for total in totals],
+                                 dtype=np.int64),
+        'last_visit': np.array([_timestamp(record.get('lastVisitAt')) for record in records], dtype='datetime64[s]'),
+        'has_days_local': np.array([bool(days) for days in days_local], dtype=bool),
+        'has_hours_local': np.array([bool(hours) for hours in hours_local], dtype=bool),
+    }
+    for column, (field, default) in STRING_COLUMNS.items():
+        columns[column] = np.array([_string(record.get(field, default)) for record in records], dtype=str)
+    for column, field in COORDINATE_COLUMNS.items():
+        columns[column] = np.array([_coordinate(record.get(field)) for record in records], dtype=np.float64)
+
+    columns['days_local'] = day_matrix(days_local, np.int32)
+    columns['days_zulu'] = day_matrix([record.get('visitsByDayOfWeekZulu') or {} for record in records], np.int32)
+    columns['hours_local'] = hour_matrix(hours_local, np.int32)
+    columns['hours_zulu'] = hour_matrix([record.get('visitsByHourZulu') or {} for record in records], np.int32)
+
+    return columns
+
+
+def _concat(parts, column):
+    arrays = [part[column] for part in parts]
+    if column in STRING_COLUMNS or column == '_id':
+        # Fixed-width unicode arrays may differ in width; let NumPy widen them
+        return np.concatenate([a.astype(str) for a in arrays]) if arrays else np.array([], dtype=str)
+    return np.concatenate(arrays)
+
+
+def merge_columns(base, updates):
+    """Overwrite rows of `base` whose _id appears in `updates`; append new ones"""
+    if base is None or len(base['_id']) == 0:
+        return updates
+
+    index = {key: row for row, key in enumerate(base['_id'].tolist())}
+    update_ids = updates['_id'].tolist()
+    existing_rows = np.array([index.get(key, -1) for key in update_ids], dtype=np.int64)
+    is_existing = existing_rows >= 0
+
+    merged = {}
+    for column in ALL_COLUMNS:
+        values = np.array(base[column])  # copy out of the memory map
+        if column in STRING_COLUMNS or column == '_id':
+            width = max(values.dtype.itemsize, updates[column].dtype.itemsize) // 4
+            values = values.astype(f'<U{max(width, 1)}')
+        values[existing_rows[is_existing]] = updates[column][is_existing]
+        merged[column] = _concat([{column: values}, {column: updates[column][~is_existing]}], column)
+    return merged
+
+
+class VisitorCache:
+    """Memory-mapped columns plus metadata for one cache directory"""
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, columns=None, meta=None):
+        self.path = path
+        self.columns = columns
+        self.meta = meta or {'version': CACHE_VERSION, 'rows': 0, 'highWaterUpdatedAt': None}
+
+    def __len__(self):
+        return 0 if self.columns is None else len(self.columns['_id'])
+
+    @classmethod
+    def from_records(cls, records):
+        """In-memory (unsaved) cache built from already-fetched documents"""
+        return cls(None, columns_from_records(records))
+
+    @classmethod
+    def load(cls, path=DEFAULT_CACHE_DIR):
+        """Open an existing cache memory-mapped; returns an empty cache if absent"""
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return cls(path)
+
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != CACHE_VERSION:
+            print(f"⚠️  Visitor cache version {meta.get('version')} is outdated; rebuilding")
+            return cls(path)
+
+        columns = {
+            column: np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r')
+            for column in ALL_COLUMNS
+        }
+        return cls(path, columns, meta)
+
+    def save(self):
+        """Write every column to a temp directory, then swap it into place"""
+        tmp_path = f'{self.path}.tmp'
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        for column in ALL_COLUMNS:
+            np.save(os.path.join(tmp_path, f'{column}.npy'), np.asarray(self.columns[column]))
+        self.meta['rows'] = len(self)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=2)
+
+        old_path = f'{self.path}.old'
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+
+        # Re-open memory-mapped so the in-memory copies can be released
+        self.columns = VisitorCache.load(self.path).columns
+
+    def refresh(self, collection, batch_size=DEFAULT_BATCH_SIZE, rebuild=False):
+        """
+        Pull documents changed since the high-water mark (everything when
+        rebuilding or empty) and merge them in. Returns the number of documents read.
+        """
+        mark = None if rebuild or not len(self) else self.meta.get('highWaterUpdatedAt')
+        query = {'updatedAt': {'$gte': datetime.fromisoformat(mark)}} if mark else {}
+
+        parts = []
+        newest = datetime.fromisoformat(mark) if mark else None
+        fetched = 0
+        for batch in iter_visitor_batches(collection, batch_size=batch_size,
+                                          query=query, projection=CACHE_PROJECTION):
+            parts.append(columns_from_records(batch))
+            fetched += len(batch)
+            for record in batch:
+                updated_at = record.get('updatedAt')
+                if isinstance(updated_at, datetime) and (newest is None or updated_at > newest):
+                    newest = updated_at
+
+        if rebuild or not len(self):
+            self.columns = None
+
+        if parts:
+            updates = {column: _concat(parts, column) for column in ALL_COLUMNS}
+            self.columns = merge_columns(self.columns, updates)
+        elif self.columns is None:
+            self.columns = columns_from_records([])
+
+        if newest is not None:
+            self.meta['highWaterUpdatedAt'] = newest.replace(tzinfo=None).isoformat()
+        self.meta['refreshedAt'] = datetime.now(timezone.utc).isoformat()
+        return fetched
+
+    def map_frame(self):
+        """Same rows and columns as MapAccumulator.to_frame(), straight from the columns"""
+        frames = []
+        for order, (source, _, _) in enumerate(MAP_SOURCES):
+            lat_column, long_column = SOURCE_COORDINATES[source]
+            lat = np.asarray(self.columns[lat_column])
+            long = np.asarray(self.columns[long_column])
+            # Same truthiness rule as the dict path: missing or 0 coordinates are skipped
+            rows = np.flatnonzero(~np.isnan(lat) & ~np.isnan(long) & (lat != 0) & (long != 0))
+            frame = pd.DataFrame({
+                'lat': lat[rows],
+                'long': long[rows],
+                'source': source,
+                'total_visits': np.asarray(self.columns['total_visits'])[rows],
+            })
+            for column in STRING_COLUMNS:
+                values = pd.Series(np.asarray(self.columns[column])[rows], dtype=object)
+                frame[column] = values.where(values != '', None).values
+            frame['_row'] = rows
+            frame['_order'] = order
+            frames.append(frame)
+
+        df = pd.concat(frames, ignore_index=True).sort_values(['_row', '_order'], kind='stable')
+        return categorize_map_frame(df[MAP_COLUMNS].reset_index(drop=True))
+
+    def visit_vectors(self, time_type=None):
+        """
+        (days[N, 7], hours[N, 24], totals[N]) as floats. By default each row
+        uses Local counters when present and Zulu otherwise, like the dict path;
+        pass 'local' or 'zulu' to force one.
+        """
+        days_local = np.asarray(self.columns['days_local'], dtype=np.float64)
+        days_zulu = np.asarray(self.columns['days_zulu'], dtype=np.float64)
+        hours_local = np.asarray(self.columns['hours_local'], dtype=np.float64)
+        hours_zulu = np.asarray(self.columns['hours_zulu'], dtype=np.float64)
+
+        if time_type == 'local':
+            days, hours = days_local, hours_local
+        elif time_type == 'zulu':
+            days, hours = days_zulu, hours_zulu
+        else:
+            days = np.where(np.asarray(self.columns['has_days_local'])[:, None], days_local, days_zulu)
+            hours = np.where(np.asarray(self.columns['has_hours_local'])[:, None], hours_local, hours_zulu)
+
+        return days, hours, np.asarray(self.columns['total_visits'], dtype=np.float64)
+
+    def heatmap_frame(self, time_type=None):
+        """24x7 heatmap DataFrame computed from the cached counters"""
+        return heatmap_to_frame(heatmap_from_vectors(*self.visit_vectors(time_type)))
+
+    def subset(self, rows):
+        """In-memory copy holding only `rows` (indices or a boolean mask)"""
+        return VisitorCache(None, {column: np.asarray(values)[rows] for column, values in self.columns.items()},
+                            dict(self.meta))
+
+    def nbytes(self):
+        return sum(np.asarray(values).nbytes for values in (self.columns or {}).values())
+
+
+class ColumnAccumulator:
+    """Collects batches into cache columns; pass as an extra accumulator when streaming"""
+
+    def __init__(self):
+        self.parts = []
+
+    def add_batch(self, records):
+        self.parts.append(columns_from_records(records))
+
+    def to_cache(self):
+        if not self.parts:
+            return VisitorCache(None, columns_from_records([]))
+        return VisitorCache(None, {column: _concat(self.parts, column) for column in ALL_COLUMNS})
+
+
+def load_visitor_columns(batches, columns=None):
+    """
+    In-memory VisitorCache built batch by batch (e.g. from iter_visitor_batches);
+    only one batch of documents is alive at a time, never the whole list.
+    Pass `columns` to fill an accumulator the caller can read partially.
+    """
+    columns = ColumnAccumulator() if columns is None else columns
+    for batch in batches:
+        columns.add_batch(batch)
+    return columns.to_cache()
+
+
+def update_cache(collection, args):
+    """Open the cache, refresh it unless --cache-only, save and report; prints progress"""
+    cache = VisitorCache.load(args.cache_dir)
+
+    if collection is None:
+        if not len(cache):
+            raise FileNotFoundError(f"No visitor cache at {args.cache_dir}; run once with --cache")
+        print(f"✅ Opened visitor cache: {len(cache)} records (offline)")
+        return cache
+
+    fetched = cache.refresh(collection, rebuild=args.rebuild_cache)
+    cache.save()
+    print(f"✅ {'Rebuilt' if args.rebuild_cache else 'Refreshed'} visitor cache: "
+          f"{fetched} documents read, {len(cache)} records, {cache.nbytes() / 1e6:.1f} MB on disk")
+    return cache
+
+
+def add_cache_arguments(parser):
+    """Register visitor-cache options on an argparse parser"""
+    parser.add_argument('--cache', action='store_true',
+                        help='Use the local columnar visitor cache, refreshed incrementally by updatedAt')
+    parser.add_argument('--cache-only', action='store_true',
+                        help='Use the visitor cache as-is without contacting MongoDB')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='Rebuild the visitor cache from a full collection scan')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Visitor cache directory (default: {DEFAULT_CACHE_DIR})')
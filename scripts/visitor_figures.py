@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Visitor Figures
+Plotly figures shared by the dashboard (visitor_analytics_visualizer.py) and
+the static HTML / report-bundle script (test_visualization.py)
+
+    map           create_map_figure (deduped / binned markers), map_markers_figure
+    heatmaps      create_heatmap_figure (7x24), create_dom_heatmap_figure (31x24)
+    geography     create_geo_rollup_figure (top countries / regions / cities)
+    sketches      create_unique_visitors_figure, create_top_ips_figure
+    placeholders  message_figure, empty_map_figure, loading_figure
+
+Each builder returns a plotly Figure (create_map_figure also prints its
+marker count). Empty inputs give a figure with a centered message instead of
+an empty plot. Map hover text is built in the browser from customdata and a
+per-source hovertemplate (map_aggregation.map_hover_customdata).
+
+plotly is imported inside each builder, so importing this module does not
+load the plotting stack (see import_budget.py).
+
+Requirements:
+    pip install pandas plotly
+"""
+
+from heatmap_builder import DAYS_ORDER
+from map_aggregation import (
+    DEFAULT_MAX_POINTS,
+    aggregate_map_points,
+    map_hover_customdata,
+    map_hover_template,
+    marker_sizes,
+)
+
+GEO_TOP = 30
+SKETCH_TOP = 25
+
+# Color scheme
+COLORS = {
+    'GoogleGeolocation': '#4285F4',  # Google Blue
+    'IPInfoIO': '#EA4335',           # Google Red
+    'GoogleBrowser': '#34A853',      # Google Green
+    'Unknown': '#FBBC04'             # Google Yellow
+}
+
+
+def message_figure(text):
+    """Blank figure with one centered message"""
+    import plotly.graph_objects as go
+
+    return go.Figure().add_annotation(
+        text=text,
+        xref="paper", yref="paper",
+        x=0.5, y=0.5, showarrow=False,
+        font=dict(size=20)
+    )
+
+
+def empty_map_figure():
+    """Placeholder figure when there are no geolocated visitors"""
+    return message_figure("No geolocation data available")
+
+
+def loading_figure():
+    """Placeholder shown until the background load publishes a figure"""
+    return message_figure("⏳ Loading data...")
+
+
+def map_markers_figure(markers, center_lat, center_lon, zoom=3, subtitle='Color by Data Source'):
+    """Scattermapbox figure with one trace per geolocation source"""
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+
+    # Add points for each geolocation source
+    for source, color in COLORS.items():
+        source_df = markers[markers['source'] == source]
+        if not source_df.empty:
+            fig.add_trace(go.Scattermapbox(
+                lat=source_df['lat'],
+                lon=source_df['long'],
+                mode='markers',
+                marker=dict(
+                    size=marker_sizes(source_df['count']),
+                    color=color,
+                    opacity=0.7
+                ),
+                name=source,
+                customdata=map_hover_customdata(source_df),
+                hovertemplate=map_hover_template(source)
+            ))
+
+    fig.update_layout(
+        mapbox=dict(
+            style='open-street-map',
+            center=dict(lat=center_lat, lon=center_lon),
+            zoom=zoom
+        ),
+        title=dict(
+            text=f'Visitor Geolocation Map<br><sub>{subtitle}</sub>',
+            x=0.5,
+            xanchor='center'
+        ),
+        showlegend=True,
+        height=700,
+        margin=dict(l=0, r=0, t=60, b=0),
+        # Keep the user's pan/zoom and legend state when the viewport callback swaps traces
+        uirevision='map'
+    )
+
+    return fig
+
+
+def create_map_figure(df, max_points=DEFAULT_MAX_POINTS, bin_mode='hex'):
+    """Create interactive map with geolocation points (deduped/binned to at most max_points markers)"""
+    if df.empty:
+        return empty_map_figure()
+
+    markers, cell_size = aggregate_map_points(df, max_points=max_points, mode=bin_mode)
+    print(f"✅ Map markers: {len(markers)} from {len(df)} points"
+          + (f" ({bin_mode} cells of {cell_size:.3f}°)" if cell_size else " (exact duplicates merged)"))
+
+    # Calculate map center (average of all points)
+    return map_markers_figure(markers, df['lat'].mean(), df['long'].mean())
+
+
+def create_heatmap_figure(heatmap_df):
+    """Create time-of-day vs day-of-week heatmap"""
+    import plotly.graph_objects as go
+
+    if heatmap_df.empty or heatmap_df.sum().sum() == 0:
+        return message_figure("No temporal data available")
+
+    # Convert to integers for display
+    heatmap_values = heatmap_df.round(0).astype(int)
+
+    fig = go.Figure(data=go.Heatmap(
+        z=heatmap_values.values,
+        x=heatmap_df.columns,  # Days of week
+        y=heatmap_df.index,     # Hours of day (0-23)
+        colorscale='YlOrRd',
+        # Cell labels come from z in the browser; no duplicate text matrix in the payload
+        texttemplate='%{z}',
+        textfont={"size": 10},
+        hovertemplate='<b>%{x}</b><br>Hour: %{y}:00<br>Visits: %{z}<extra></extra>',
+        colorbar=dict(title="Visits")
+    ))
+
+    fig.update_layout(
+        title=dict(
+            text='Visitor Traffic Heatmap<br><sub>Time of Day vs Day of Week</sub>',
+            x=0.5,
+            xanchor='center'
+        ),
+        xaxis=dict(title='Day of Week', side='bottom'),
+        yaxis=dict(
+            title='Hour of Day',
+            autorange='reversed',  # 0 at top, 23 at bottom
+            tickmode='linear',
+            tick0=0,
+            dtick=1
+        ),
+        height=700,
+        margin=dict(l=100, r=50, t=100, b=50)
+    )
+
+    return fig
+
+
+def create_dom_heatmap_figure(dom_df):
+    """Create time-of-day vs day-of-month heatmap (31x24)"""
+    import plotly.graph_objects as go
+
+    if dom_df.empty or dom_df.sum().sum() == 0:
+        return message_figure("No temporal data available")
+
+    dom_values = dom_df.round(0).astype(int)
+
+    fig = go.Figure(data=go.Heatmap(
+        z=dom_values.values,
+        x=dom_df.columns,  # Day of month (1-31)
+        y=dom_df.index,    # Hours of day (0-23)
+        colorscale='YlOrRd',
+        hovertemplate='<b>Day %{x}</b><br>Hour: %{y}:00<br>Visits: %{z}<extra></extra>',
+        colorbar=dict(title="Visits")
+    ))
+
+    fig.update_layout(
+        title=dict(
+            text='Visitor Traffic Heatmap<br><sub>Time of Day vs Day of Month</sub>',
+            x=0.5,
+            xanchor='center'
+        ),
+        xaxis=dict(title='Day of Month', side='bottom', tickmode='linear', tick0=1, dtick=1),
+        yaxis=dict(
+            title='Hour of Day',
+            autorange='reversed',
+            tickmode='linear',
+            tick0=0,
+            dtick=1
+        ),
+        height=700,
+        margin=dict(l=100, r=50, t=100, b=50)
+    )
+
+    return fig
+
+
+def geo_labels(rollup_df):
+    """'City, Region, Country' labels for the rows of a GeoRollup.rollup() frame"""
+    levels = [column for column in ('city', 'region', 'country') if column in rollup_df]
+    labels = rollup_df[levels[0]].astype(str)
+    for column in levels[1:]:
+        labels = labels + ', ' + rollup_df[column].astype(str)
+    return labels
+
+
+def create_geo_rollup_figure(rollup_df, level='country', top=GEO_TOP):
+    """Horizontal bars of the top countries / regions / cities by visits"""
+    import plotly.graph_objects as go
+
+    if rollup_df.empty:
+        return message_figure("No geographic data available")
+
+    shown = rollup_df.head(top)
+    fig = go.Figure(data=go.Bar(
+        x=shown['visits'],
+        y=geo_labels(shown),
+        orientation='h',
+        customdata=shown['visitors'],
+        marker_color='#4285F4',
+        hovertemplate='<b>%{y}</b><br>Visits: %{x}<br>Visitors: %{customdata}<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title=dict(
+            text=f'Visits by {level.title()}<br><sub>Top {len(shown)} of {len(rollup_df)} '
+                 f'(ipinfo location, {rollup_df["visitors"].sum()} visitors)</sub>',
+            x=0.5,
+            xanchor='center'
+        ),
+        xaxis=dict(title='Total Visits'),
+        yaxis=dict(autorange='reversed', automargin=True),
+        height=max(400, 22 * len(shown) + 150),
+        margin=dict(l=100, r=50, t=100, b=50)
+    )
+
+    return fig
+
+
+def create_unique_visitors_figure(sketches):
+    """Distinct visitors per day x hour cell, with the estimate's error bound in the subtitle"""
+    import plotly.graph_objects as go
+
+    grid, total = sketches.uniques('visitors')
+    error = sketches.relative_error
+    values = grid.T.round(0).astype(int)  # hours down, days across like the visits heatmap
+
+    fig = go.Figure(data=go.Heatmap(
+        z=values,
+        x=DAYS_ORDER,
+        y=list(range(24)),
+        colorscale='PuBu',
+        texttemplate='%{z}',
+        textfont={"size": 10},
+        hovertemplate=f'<b>%{{x}}</b><br>Hour: %{{y}}:00<br>Unique visitors: ~%{{z}} ±{error:.1%}<extra></extra>',
+        colorbar=dict(title="Unique")
+    ))
+    fig.update_layout(
+        title=dict(
+            text=f'Unique Visitors Heatmap<br><sub>~{total:,.0f} distinct visitors in {sketches.events:,} events '
+                 f'({sketches.time_type} time) · HyperLogLog estimates ±{error:.1%} (1σ), '
+                 f'±{2 * error:.1%} at 95%</sub>',
+            x=0.5,
+            xanchor='center'
+        ),
+        xaxis=dict(title='Day of Week', side='bottom'),
+        yaxis=dict(title='Hour of Day', autorange='reversed', tickmode='linear', tick0=0, dtick=1),
+        height=700,
+        margin=dict(l=100, r=50, t=100, b=50)
+    )
+
+    return fig
+
+
+def create_top_ips_figure(sketches, top=SKETCH_TOP):
+    """Heaviest IPs by events; the error bar spans what Space-Saving can guarantee"""
+    import plotly.graph_objects as go
+
+    shown = sketches.top['ips'].top(top).iloc[::-1]
+    _, unique_ips = sketches.uniques('ips')
+    fig = go.Figure(go.Bar(
+        x=shown['count'],
+        y=shown['key'],
+        orientation='h',
+        marker_color='#6f42c1',
+        error_x=dict(type='data', symmetric=False, array=[0] * len(shown), arrayminus=shown['error']),
+        customdata=shown[['guaranteed', 'error']],
+        hovertemplate='<b>%{y}</b><br>Events: ≤ %{x:,}<br>At least: %{customdata[0]:,} '
+                      '(±%{customdata[1]:,})<extra></extra>'
+    ))
+    fig.update_layout(
+        title=dict(
+            text=f'Top {len(shown)} IPs by Events<br><sub>~{unique_ips:,.0f} distinct IPs · '
+                 f'Space-Saving counts, bars show the possible overcount</sub>',
+            x=0.5,
+            xanchor='center'
+        ),
+        xaxis=dict(title='Events'),
+        yaxis=dict(automargin=True),
+        height=max(400, 22 * len(shown) + 150),
+        margin=dict(l=100, r=50, t=100, b=50)
+    )
+
+    return fig
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Visitor Ingest
+Streaming, projected ingestion of VisitorTrackingAnalytics for the visualizers
+
+Instead of `list(collection.find({}))`, the cursor is read with a field
+projection in fixed-size batches and every batch is folded into the map and
+heatmap accumulators in a single pass. Only the accumulators outlive a batch,
+so peak memory tracks the batch size (plus the map columns we actually plot),
+not the number of full documents in the collection.
+
+Requirements:
+    pip install pymongo numpy pandas
+"""
+
+import numpy as np
+import pandas as pd
+
+from heatmap_builder import build_visit_vectors, heatmap_from_vectors, heatmap_to_frame
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Only the fields the map, heatmap and dashboard filters read
+VISITOR_PROJECTION = {
+    'google_api_lat': 1,
+    'google_api_long': 1,
+    'ipinfo_lat': 1,
+    'ipinfo_long': 1,
+    'ip': 1,
+    'visitor_id': 1,
+    'ipinfo_city': 1,
+    'ipinfo_region': 1,
+    'ipinfo_country': 1,
+    'totalVisits': 1,
+    'lastVisitAt': 1,
+    'visitsByDayOfWeekLocal': 1,
+    'visitsByDayOfWeekZulu': 1,
+    'visitsByHourLocal': 1,
+    'visitsByHourZulu': 1,
+}
+
+# (source label, latitude field, longitude field) - one map point per source
+MAP_SOURCES = [
+    ('GoogleGeolocation', 'google_api_lat', 'google_api_long'),
+    ('IPInfoIO', 'ipinfo_lat', 'ipinfo_long'),
+]
+
+MAP_COLUMNS = ['lat', 'long', 'source', 'ip', 'visitor_id', 'city', 'region', 'country', 'total_visits']
+
+# Repeated per geo source (and, for the geo names, across visitors): held as
+# categoricals - int codes plus one copy of each distinct string
+CATEGORY_COLUMNS = ['source', 'ip', 'visitor_id', 'city', 'region', 'country']
+
+
+def categorize_map_frame(df):
+    """Dictionary-encode the map frame's string columns in place"""
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype('category')
+    return df
+
+
+def iter_batches(iterable, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield lists of at most `batch_size` items from any iterable"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_visitor_batches(collection, batch_size=DEFAULT_BATCH_SIZE, query=None, projection=None):
+    """Yield projected VisitorTrackingAnalytics documents in batches from a cursor"""
+    cursor = collection.find(
+        query or {},
+        projection or VISITOR_PROJECTION,
+        batch_size=batch_size
+    )
+    try:
+        yield from iter_batches(cursor, batch_size)
+    finally:
+        cursor.close()
+
+
+class MapAccumulator:
+    """Collects map points column-wise, one point per visitor per geo source"""
+
+    def __init__(self):
+        self.columns = {name: [] for name in MAP_COLUMNS}
+
+    def add(self, record):
+        for source, lat_field, long_field in MAP_SOURCES:
+            lat = record.get(lat_field)
+            long = record.get(long_field)
+            if not (lat and long):
+                continue
+            self.columns['lat'].append(lat)
+            self.columns['long'].append(long)
+            self.columns['source'].append(source)
+            self.columns['ip'].append(record.get('ip', 'unknown'))
+            self.columns['visitor_id'].append(record.get('visitor_id', 'N/A'))
+            self.columns['city'].append(record.get('ipinfo_city', 'Unknown'))
+            self.columns['region'].append(record.get('ipinfo_region', 'Unknown'))
+            self.columns['country'].append(record.get('ipinfo_country', 'Unknown'))
+            self.columns['total_visits'].append(record.get('totalVisits', 0))
+
+    def add_batch(self, records):
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return len(self.columns['lat'])
+
+    def to_frame(self):
+        return categorize_map_frame(pd.DataFrame(self.columns, columns=MAP_COLUMNS))
+
+
+class HeatmapAccumulator:
+    """Running 24x7 heatmap; each batch is vectorized and summed in"""
+
+    def __init__(self):
+        self.matrix = np.zeros((24, 7), dtype=np.float64)
+        self.records = 0
+
+    def add_batch(self, records):
+        days, hours, totals = build_visit_vectors(records)
+        self.matrix += heatmap_from_vectors(days, hours, totals)
+        self.records += len(totals)
+
+    def to_frame(self):
+        return heatmap_to_frame(self.matrix.copy())
+
+
+def accumulate_visitor_batches(batches, extra=()):
+    """
+    Feed every batch into fresh map and heatmap accumulators (and any `extra`
+    objects with an add_batch(records) method).
+
+    Returns (map_accumulator, heatmap_accumulator, record_count).
+    """
+    map_acc = MapAccumulator()
+    heatmap_acc = HeatmapAccumulator()
+    record_count = 0
+
+    for batch in batches:
+        map_acc.add_batch(batch)
+        heatmap_acc.add_batch(batch)
+        for accumulator in extra:
+            accumulator.add_batch(batch)
+        record_count += len(batch)
+
+    return map_acc, heatmap_acc, record_count
+
+
+def stream_visitor_data(collection, batch_size=DEFAULT_BATCH_SIZE, query=None, extra=()):
+    """Read the collection once, in projected batches, feeding both accumulators"""
+    return accumulate_visitor_batches(
+        iter_visitor_batches(collection, batch_size=batch_size, query=query), extra
+    )
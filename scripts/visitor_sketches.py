@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Visitor Sketches
+Unique visitors / IPs per day x hour cell and the heaviest IPs and visitors,
+in fixed memory, from VisitorTrackingHistory events
+
+    HyperLogLog      one per 7x24 cell (plus one for the whole window) for
+                     distinct visitor_id and distinct ip. 2^p one-byte
+                     registers each; relative standard error 1.04 / sqrt(2^p)
+                     (p = 12: 4 KB, +/-1.6%). Merging is a register-wise max.
+    Space-Saving     the top IPs and visitor_ids by events, `capacity` counters
+                     each. Every count carries its maximum overestimate, and
+                     no key's error exceeds events / capacity.
+
+Events are read in chunks: each chunk is hashed and counted with NumPy (one
+hash per distinct value) and folded into the sketches, so memory is set by
+precision and capacity, never by event volume. Two sketches over disjoint
+windows or sources (chunks, days, backup files) merge into the sketch of
+their union; --save stores one as .npz and --merge combines saved ones, e.g.
+one file per day from a nightly job.
+
+Cells use the same dayOfWeek* / hourOfDay* fields as the exact history
+heatmaps (--time-type); events without them still count toward the totals.
+
+Usage:
+    python visitor_sketches.py --range 7D                          # MONGODB_URI_PROD
+    python visitor_sketches.py --since 2026-10-15 --until 2026-10-16 --save sketches/2026-10-15.npz
+    python visitor_sketches.py --merge sketches/2026-10-*.npz
+    python visitor_sketches.py --backup 2026-02-09T03-00-00_TangoTiempoProd.json.gz --include-logins
+    python visitor_sketches.py --synthetic 5M --precision 14
+    python visitor_analytics_visualizer.py --unique-visitors          # 👥 Unique Visitors tab
+
+Requirements:
+    pip install numpy pandas (pymongo for MongoDB)
+"""
+
+from datetime import datetime
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from heatmap_builder import DAY_INDEX, DAYS_ORDER
+from history_pipeline import (
+    HISTORY_COLLECTIONS,
+    build_time_match,
+    parse_range,
+    parse_timestamp,
+    time_fields,
+)
+
+DATABASE_NAME = 'TangoTiempoProd'
+SKETCH_VERSION = 1
+DEFAULT_PRECISION = 12
+DEFAULT_CAPACITY = 1000
+DEFAULT_CHUNK_SIZE = 100000
+DEFAULT_TOP = 20
+CELLS = 7 * 24
+TOTAL_CELL = CELLS            # extra register row for the whole window
+KINDS = ('visitors', 'ips')
+FIELDS = {'visitors': 'visitor_id', 'ips': 'ip'}
+MB = 1024 * 1024
+
+
+def _bit_length(values):
+    """Exact bit length of uint64 values (float log2 rounds near powers of two)"""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        length[high] += shift
+        values[high] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+def hash_values(values):
+    """64-bit hashes of a chunk's strings; each distinct value is hashed once"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).astype(str).where(pd.notna(values)))
+    present = codes >= 0
+    hashes = np.zeros(len(codes), dtype=np.uint64)
+    if len(uniques):
+        hashes[present] = pd.util.hash_array(np.asarray(uniques, dtype=object))[codes[present]]
+    return hashes, present
+
+
+class HyperLogLogGrid:
+    """`rows` HyperLogLog sketches sharing one uint8 register matrix"""
+
+    def __init__(self, rows, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 18:
+            raise ValueError('precision must be between 4 and 18')
+        self.precision = precision
+        self.registers = registers if registers is not None \
+            else np.zeros((rows, 1 << precision), dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        """Relative standard error (one sigma) of each estimate"""
+        return 1.04 / np.sqrt(self.registers.shape[1])
+
+    def add_hashes(self, rows, hashes):
+        """Fold hashes into the given register rows (vectorized max per register)"""
+        if not len(hashes):
+            return self
+        suffix_bits = 64 - self.precision
+        buckets = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        # Rank = position of the first 1 bit in the suffix (suffix_bits + 1 when it is all zeros)
+        ranks = (suffix_bits + 1 - _bit_length(suffix)).astype(np.uint8)
+        flat = self.registers.reshape(-1)
+        np.maximum.at(flat, np.asarray(rows, dtype=np.int64) * self.registers.shape[1] + buckets, ranks)
+        return self
+
+    def merge(self, other):
+        if self.registers.shape != other.registers.shape:
+            raise ValueError('HyperLogLog grids differ in shape or precision')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimates(self):
+        """Cardinality estimate per row (linear counting while registers are mostly empty)"""
+        m = self.registers.shape[1]
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.exp2(-self.registers.astype(np.float64)).sum(axis=1)
+        zeros = (self.registers == 0).sum(axis=1)
+        small = (raw <= 2.5 * m) & (zeros > 0)
+        with np.errstate(divide='ignore'):
+            linear = m * np.log(m / np.maximum(zeros, 1))
+        return np.where(small, linear, raw)
+
+    def nbytes(self):
+        return self.registers.nbytes
+
+
+class SpaceSaving:
+    """Top keys by count with per-key overestimate bounds; mergeable (Agarwal et al.)"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, keys=None, counts=None, errors=None):
+        self.capacity = capacity
+        self.keys = np.asarray(keys if keys is not None else [], dtype=object)
+        self.counts = np.asarray(counts if counts is not None else [], dtype=np.int64)
+        self.errors = np.asarray(errors if errors is not None else [], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _floor(self):
+        """Largest count a key missing from this summary can have had"""
+        return int(self.counts.min()) if len(self) >= self.capacity else 0
+
+    def merge(self, other):
+        """Summary of both streams: missing keys are charged the other side's floor"""
+        mine = pd.DataFrame({'count': self.counts, 'error': self.errors}, index=pd.Index(self.keys, dtype=object))
+        theirs = pd.DataFrame({'count': other.counts, 'error': other.errors},
+                              index=pd.Index(other.keys, dtype=object))
+        joined = mine.join(theirs, how='outer', lsuffix='_a', rsuffix='_b')
+        floor_a, floor_b = self._floor(), other._floor()
+        counts = joined['count_a'].fillna(floor_a) + joined['count_b'].fillna(floor_b)
+        errors = joined['error_a'].fillna(floor_a) + joined['error_b'].fillna(floor_b)
+
+        keep = np.argsort(-counts.to_numpy(), kind='stable')[:self.capacity]
+        self.keys = joined.index.to_numpy(dtype=object)[keep]
+        self.counts = counts.to_numpy()[keep].astype(np.int64)
+        self.errors = errors.to_numpy()[keep].astype(np.int64)
+        return self
+
+    def add_values(self, values):
+        """Exact counts of one chunk, merged in as an error-free summary"""
+        counts = pd.Series(values, dtype=object).dropna().value_counts(sort=False)
+        if len(counts):
+            # One spare counter keeps the chunk summary's floor at 0: its counts are exact
+            self.merge(SpaceSaving(len(counts) + 1, counts.index.to_numpy(dtype=object), counts.to_numpy(),
+                                   np.zeros(len(counts), dtype=np.int64)))
+        return self
+
+    def top(self, n=DEFAULT_TOP):
+        """DataFrame of the n heaviest keys: count (upper bound), error, guaranteed (count - error)"""
+        rows = slice(0, n)
+        return pd.DataFrame({
+            'key': self.keys[rows],
+            'count': self.counts[rows],
+            'error': self.errors[rows],
+            'guaranteed': self.counts[rows] - self.errors[rows],
+        })
+
+
+class VisitorSketches:
+    """Distinct visitors / IPs per cell and top IPs / visitors for one window of history events"""
+
+    def __init__(self, precision=DEFAULT_PRECISION, capacity=DEFAULT_CAPACITY, time_type='local'):
+        self.time_type = time_type
+        self.unique = {kind: HyperLogLogGrid(CELLS + 1, precision) for kind in KINDS}
+        self.top = {kind: SpaceSaving(capacity) for kind in KINDS}
+        self.events = 0
+        self.since = None
+        self.until = None
+
+    @property
+    def precision(self):
+        return self.unique['visitors'].precision
+
+    @property
+    def relative_error(self):
+        return self.unique['visitors'].relative_error
+
+    def add_chunk(self, visitor_ids, ips, cells, timestamps=()):
+        """One chunk of events: cells are day * 24 + hour, or -1 when unknown"""
+        cells = np.asarray(cells, dtype=np.int64)
+        for kind, values in (('visitors', visitor_ids), ('ips', ips)):
+            hashes, present = hash_values(values)
+            rows = np.where(cells >= 0, cells, TOTAL_CELL)
+            grid = self.unique[kind]
+            grid.add_hashes(rows[present & (cells >= 0)], hashes[present & (cells >= 0)])
+            grid.add_hashes(np.full(int(present.sum()), TOTAL_CELL), hashes[present])
+            self.top[kind].add_values(values)
+        self.events += len(cells)
+        for moment in (min(timestamps, default=None), max(timestamps, default=None)):
+            if moment is not None:
+                self.since = moment if self.since is None else min(self.since, moment)
+                self.until = moment if self.until is None else max(self.until, moment)
+        return self
+
+    def add_events(self, events, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Fold an event iterable in chunk by chunk (events need visitor_id, ip and the time fields)"""
+        day_field, hour_field, _ = time_fields(self.time_type)
+        columns = ([], [], [], [], [])
+        for event in events:
+            visitor_ids, ips, days, hours, stamps = columns
+            visitor_ids.append(event.get('visitor_id'))
+            ips.append(event.get('ip'))
+            days.append(event.get(day_field))
+            hours.append(event.get(hour_field))
+            stamps.append(event.get('timestamp'))
+            if len(visitor_ids) >= chunk_size:
+                self._add_columns(*columns)
+                columns = ([], [], [], [], [])
+        if columns[0]:
+            self._add_columns(*columns)
+        return self
+
+    def _add_columns(self, visitor_ids, ips, days, hours, stamps):
+        day = pd.Series(days, dtype=object).map(DAY_INDEX).fillna(-1).to_numpy(np.int64)
+        hour = pd.to_numeric(pd.Series(hours, dtype=object), errors='coerce').to_numpy(np.float64)
+        hour = np.where((hour >= 0) & (hour < 24), hour, -1).astype(np.int64)
+        cells = np.where((day >= 0) & (hour >= 0), day * 24 + hour, -1)
+        moments = pd.to_datetime(pd.Series(stamps, dtype=object), utc=True, errors='coerce', format='ISO8601')
+        moments = moments.dropna().dt.tz_localize(None)
+        self.add_chunk(visitor_ids, ips, cells,
+                       [moment.to_pydatetime() for moment in (moments.min(), moments.max())] if len(moments) else ())
+
+    def merge(self, other):
+        if (other.precision, other.time_type) != (self.precision, self.time_type):
+            raise ValueError(f'Cannot merge a p={other.precision} {other.time_type} sketch into '
+                             f'a p={self.precision} {self.time_type} one')
+        for kind in KINDS:
+            self.unique[kind].merge(other.unique[kind])
+            self.top[kind].merge(other.top[kind])
+        self.events += other.events
+        for moment in (other.since, other.until):
+            if moment is not None:
+                self.since = moment if self.since is None else min(self.since, moment)
+                self.until = moment if self.until is None else max(self.until, moment)
+        return self
+
+    def uniques(self, kind='visitors'):
+        """(7x24 distinct estimates, distinct estimate over the whole window)"""
+        estimates = self.unique[kind].estimates()
+        return estimates[:CELLS].reshape(7, 24), float(estimates[TOTAL_CELL])
+
+    def nbytes(self):
+        """Registers plus top-K counters (keys measured as Python strings)"""
+        top = sum(len(summary) * 16 + sum(sys.getsizeof(key) for key in summary.keys)
+                  for summary in self.top.values())
+        return sum(grid.nbytes() for grid in self.unique.values()) + top
+
+    def save(self, path):
+        """One .npz (written atomically); keys stored as fixed-width unicode"""
+        meta = {
+            'version': SKETCH_VERSION,
+            'timeType': self.time_type,
+            'precision': self.precision,
+            'capacity': self.top['visitors'].capacity,
+            'events': self.events,
+            'since': self.since.isoformat() if self.since else None,
+            'until': self.until.isoformat() if self.until else None,
+        }
+        arrays = {'meta': np.array(json.dumps(meta))}
+        for kind in KINDS:
+            arrays[f'{kind}_registers'] = self.unique[kind].registers
+            arrays[f'{kind}_keys'] = self.top[kind].keys.astype(str)
+            arrays[f'{kind}_counts'] = self.top[kind].counts
+            arrays[f'{kind}_errors'] = self.top[kind].errors
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != SKETCH_VERSION:
+                raise ValueError(f'{path}: sketch version {meta.get("version")}, expected {SKETCH_VERSION}')
+            sketches = cls(meta['precision'], meta['capacity'], meta['timeType'])
+            for kind in KINDS:
+                sketches.unique[kind].registers = data[f'{kind}_registers'].copy()
+                sketches.top[kind] = SpaceSaving(meta['capacity'], data[f'{kind}_keys'].astype(object),
+                                                 data[f'{kind}_counts'], data[f'{kind}_errors'])
+        sketches.events = meta['events']
+        sketches.since = datetime.fromisoformat(meta['since']) if meta['since'] else None
+        sketches.until = datetime.fromisoformat(meta['until']) if meta['until'] else None
+        return sketches
+
+
+def add_sketch_arguments(parser):
+    """Register the visualizer options for the unique-visitor tab"""
+    parser.add_argument('--unique-visitors', action='store_true',
+                        help='Add a unique visitors tab: HyperLogLog per heatmap cell and top IPs from history '
+                             'events in the --range/--since/--until window (visitor_sketches.py)')
+    parser.add_argument('--sketch-precision', type=int, default=DEFAULT_PRECISION,
+                        help=f'HyperLogLog precision p, 2^p registers per cell (default: {DEFAULT_PRECISION}, '
+                             f'+/-{104 / np.sqrt(1 << DEFAULT_PRECISION):.1f}%%)')
+
+
+def history_projection(time_type='local'):
+    day_field, hour_field, _ = time_fields(time_type)
+    return {'timestamp': 1, 'visitor_id': 1, 'ip': 1, day_field: 1, hour_field: 1}
+
+
+def build_sketches(db=None, since=None, until=None, time_type='local', include_visitors=True,
+                   include_logins=False, backup_path=None, precision=DEFAULT_PRECISION,
+                   capacity=DEFAULT_CAPACITY):
+    """Sketches over the selected history collections (MongoDB or a backup file) in [since, until)"""
+    from history_pipeline import event_timestamp
+
+    sketches = VisitorSketches(precision, capacity, time_type)
+    for source, wanted in (('visitors', include_visitors), ('logins', include_logins)):
+        if not wanted:
+            continue
+        name = HISTORY_COLLECTIONS[source]
+        if backup_path:
+            from backup_source import iter_backup_documents
+
+            events = (event for event in iter_backup_documents(backup_path, name)
+                      if _in_window(event_timestamp(event.get('timestamp')), since, until))
+            sketches.add_events(events)
+        else:
+            cursor = db[name].find(build_time_match(since, until), history_projection(time_type),
+                                   batch_size=DEFAULT_CHUNK_SIZE // 10)
+            try:
+                sketches.add_events(cursor)
+            finally:
+                cursor.close()
+    return sketches
+
+
+def _in_window(moment, since, until):
+    return moment is not None and (since is None or moment >= since) and (until is None or moment < until)
+
+
+def print_sketch_report(sketches, top=DEFAULT_TOP):
+    """Unique totals with their error bounds, the busiest cells and the top IPs / visitors"""
+    error = sketches.relative_error
+    print(f"✅ Sketched {sketches.events:,} events ({sketches.time_type} time, p={sketches.precision}, "
+          f"{sketches.nbytes() / MB:.1f} MB)")
+    for kind in KINDS:
+        grid, total = sketches.uniques(kind)
+        day, hour = divmod(int(grid.argmax()), 24)
+        print(f"   Unique {kind}: ~{total:,.0f} ±{error:.1%} (1σ, ±{2 * error:.1%} at 95%); "
+              f"busiest cell {DAYS_ORDER[day]} {hour:02d}:00 ~{grid.max():,.0f}")
+    bound = sketches.events / sketches.top['ips'].capacity
+    for kind in KINDS:
+        print(f"\n   Top {FIELDS[kind]}s (count ≤ true + error; error ≤ {bound:,.0f})")
+        for row in sketches.top[kind].top(top).itertuples():
+            print(f"   - {str(row.key):<34} {row.count:>10,}  ±{row.error:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Unique visitors per cell and top IPs with fixed-memory sketches')
+    parser.add_argument('--backup', type=str, help='Read a Backup_MongoDB .json.gz file instead of MongoDB')
+    parser.add_argument('--synthetic', type=str, metavar='EVENTS',
+                        help='Use synthetic visitor history (synthetic_data.py), e.g. 5M')
+    parser.add_argument('--merge', nargs='+', metavar='NPZ',
+                        help='Combine saved sketches (globs allowed) instead of reading events')
+    parser.add_argument('--save', metavar='NPZ', help='Store the resulting sketch')
+    parser.add_argument('--time-type', choices=['local', 'zulu'], default='local', help='Cell time type')
+    parser.add_argument('--range', default='All', help='History range, e.g. 24H, 7D, 3M, All (default: All)')
+    parser.add_argument('--since', type=parse_timestamp, help='ISO start (inclusive); overrides --range')
+    parser.add_argument('--until', type=parse_timestamp, help='ISO end (exclusive)')
+    parser.add_argument('--include-logins', action='store_true', help='Also sketch UserLoginHistory')
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION,
+                        help=f'HyperLogLog precision p (default: {DEFAULT_PRECISION})')
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY,
+                        help=f'Space-Saving counters per top-K list (default: {DEFAULT_CAPACITY})')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help=f'Keys listed (default: {DEFAULT_TOP})')
+    args = parser.parse_args()
+
+    since = args.since if args.since is not None else parse_range(args.range)
+    started = time.perf_counter()
+    if args.merge:
+        paths = sorted({path for pattern in args.merge for path in (glob.glob(pattern) or [pattern])})
+        sketches = VisitorSketches.load(paths[0])
+        for path in paths[1:]:
+            sketches.merge(VisitorSketches.load(path))
+        print(f"✅ Merged {len(paths)} sketches")
+    elif args.synthetic:
+        from synthetic_data import parse_count, synthetic_visitor_history
+
+        from history_pipeline import event_timestamp
+
+        events = synthetic_visitor_history(parse_count(args.synthetic))
+        sketches = VisitorSketches(args.precision, args.capacity, args.time_type)
+        sketches.add_events(event for event in events
+                            if _in_window(event_timestamp(event.get('timestamp')), since, args.until))
+    elif args.backup:
+        sketches = build_sketches(since=since, until=args.until, time_type=args.time_type,
+                                  include_logins=args.include_logins, backup_path=args.backup,
+                                  precision=args.precision, capacity=args.capacity)
+    else:
+        mongodb_uri = os.getenv('MONGODB_URI_PROD')
+        if not mongodb_uri:
+            print("ERROR: MONGODB_URI_PROD environment variable not set (or use --backup / --synthetic / --merge)")
+            return 1
+        from pymongo import MongoClient
+
+        client = MongoClient(mongodb_uri)
+        try:
+            sketches = build_sketches(client[DATABASE_NAME], since, args.until, args.time_type,
+                                      include_logins=args.include_logins,
+                                      precision=args.precision, capacity=args.capacity)
+        finally:
+            client.close()
+    print(f"   ({time.perf_counter() - started:.1f}s)")
+
+    print_sketch_report(sketches, args.top)
+    if args.save:
+        sketches.save(args.save)
+        print(f"\n💾 Sketch saved to {args.save} ({os.path.getsize(args.save) / 1024:.0f} KB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,13 +10,34 @@ Usage:
     python visualize_heatmap.py --local            # Use local dev server
     python visualize_heatmap.py --test             # Use TEST environment
     python visualize_heatmap.py --url <custom-url> # Custom endpoint
+    python visualize_heatmap.py --snapshot         # Incremental all-time snapshot from MongoDB
+                                                   # (needs MONGODB_URI_PROD, see scripts/heatmap_snapshot.py)
+    python visualize_heatmap.py --summary-only     # Print the summary only (no plotting libraries loaded)
+    python visualize_heatmap.py --range 7D         # Endpoint range (default: the endpoint's 3M)
+    python visualize_heatmap.py --batch            # local/zulu x visitors/logins x 24H..1Yr comparison grid
+    python visualize_heatmap.py --batch --batch-ranges 7D,3M --batch-sources all --concurrency 4
+    python visualize_heatmap.py --batch --batch-images frames/   # + one PNG per variant (process pool)
+    python visualize_heatmap.py --no-show --metrics stages.jsonl --profile   # per-stage timings/cProfile
+
+Batch mode fetches every parameter combination concurrently (thread pool with
+a concurrency limit, one pooled keep-alive session) and renders one grid.
+scripts/heatmap_stub_server.py is a local stand-in for the endpoint.
+
+Endpoint responses are cached on disk (scripts/response_cache.py): repeated
+runs within --cache-ttl (default 1h) do not hit the function app, --refresh
+forces a fetch, and a timeout, connection error or 5xx falls back to a cached
+copy younger than --cache-max-stale (default 1 day).
+
+Heavy libraries are imported inside the functions that use them: requests when
+fetching, numpy/matplotlib/seaborn only when rendering, pymongo only for
+--snapshot. `--help` and `--summary-only` never load the plotting stack; see
+scripts/import_budget.py for the measured start-up budget.
 """
 
-import requests
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
+import os
+import sys
 import argparse
+import time
 from datetime import datetime
 
 # Environment URLs
@@ -26,34 +47,208 @@ URLS = {
     'prod': 'https://calendarbeaf-prod.azurewebsites.net/api/analytics/visitor-heatmap'
 }
 
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts')
+DATABASE_NAME = 'TangoTiempoProd'
+
 DAYS_ORDER = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
 
-def fetch_heatmap_data(url, time_type='local', include_logins=True, include_visitors=True):
-    """Fetch heatmap data from API endpoint."""
+# Batch mode defaults: the weekly review matrix
+BATCH_TIME_TYPES = ['local', 'zulu']
+BATCH_SOURCES = ['visitors', 'logins']
+BATCH_RANGES = ['24H', '7D', '1M', '3M', '1Yr']
+DEFAULT_CONCURRENCY = 6
+
+# source -> (includeLogins, includeVisitors)
+SOURCE_FLAGS = {
+    'all': (True, True),
+    'visitors': (False, True),
+    'logins': (True, False),
+}
+
+def fetch_heatmap_data(url, time_type='local', include_logins=True, include_visitors=True,
+                       range_param=None, session=None, verbose=True, cache=None, refresh=False):
+    """
+    Fetch heatmap data from API endpoint (optionally over a shared session).
+
+    With a ResponseCache: fresh entries skip the request (unless refresh),
+    expired ones are revalidated when validators exist, and a transient
+    failure (see is_transient_error) falls back to the stored response while
+    it is younger than cache.max_stale.
+    """
+    import requests
+
     params = {
         'timeType': time_type,
         'includeLogins': str(include_logins).lower(),
         'includeVisitors': str(include_visitors).lower()
     }
+    if range_param:
+        params['range'] = range_param
 
-    print(f"Fetching data from: {url}")
-    print(f"Parameters: {params}")
+    entry = cache.get(url, params) if cache else None
+    if entry and not refresh and entry.is_fresh(cache.ttl):
+        cache.count('hits')
+        if verbose:
+            print(f"Using cached response for {params} (age {entry.age:.0f}s)")
+        return entry.body['data']
+
+    if verbose:
+        print(f"Fetching data from: {url}")
+        print(f"Parameters: {params}")
 
     try:
-        response = requests.get(url, params=params, timeout=10)
+        headers = entry.conditional_headers() if entry else {}
+        response = (session or requests).get(url, params=params, headers=headers, timeout=10)
+
+        if response.status_code == 304 and entry:
+            cache.restamp(entry)
+            cache.count('revalidated')
+            return entry.body['data']
+
         response.raise_for_status()
         data = response.json()
 
         if not data.get('success'):
-            raise Exception(f"API returned error: {data.get('error', 'Unknown error')}")
-
+            # Carries the 2xx response, so it is not transient: raised even with a cached copy
+            raise requests.exceptions.RequestException(
+                f"API returned error: {data.get('error', 'Unknown error')}", response=response
+            )
+
+        if cache:
+            cache.count('misses')
+            cache.store(url, params, data, response.headers)
         return data['data']
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching data: {e}")
+        if entry and is_transient_error(e):
+            if entry.usable_stale(cache.max_stale):
+                # Stale-while-error: an old answer beats a failed report run
+                cache.count('stale')
+                print(f"Warning: request failed ({e}); using cached response from {entry.age / 60:.0f} min ago")
+                return entry.body['data']
+            print(f"Warning: cached response is {entry.age / 3600:.1f} h old, past --cache-max-stale; not using it")
+        if verbose:
+            print(f"Error fetching data: {e}")
         raise
 
+def is_transient_error(error):
+    """Timeouts, connection errors and 5xx responses; 4xx and API errors are the caller's to fix"""
+    import requests
+
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code >= 500
+
+def create_response_cache(args):
+    """ResponseCache configured from the CLI options, or None with --no-cache."""
+    if args.no_cache:
+        return None
+    from response_cache import ResponseCache
+
+    return ResponseCache(args.cache_dir, ttl=args.cache_ttl, max_bytes=args.cache_max_mb * 1024 * 1024,
+                         max_stale=args.cache_max_stale)
+
+def create_session(pool_size=DEFAULT_CONCURRENCY):
+    """requests Session whose keep-alive pool can serve pool_size threads at once."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def build_variants(time_types=BATCH_TIME_TYPES, sources=BATCH_SOURCES, ranges=BATCH_RANGES):
+    """Every timeType x source x range combination, in grid order."""
+    variants = []
+    for time_type in time_types:
+        for source in sources:
+            include_logins, include_visitors = SOURCE_FLAGS[source]
+            for range_param in ranges:
+                variants.append({
+                    'time_type': time_type,
+                    'source': source,
+                    'range': range_param,
+                    'include_logins': include_logins,
+                    'include_visitors': include_visitors,
+                })
+    return variants
+
+def fetch_variants(url, variants, concurrency=DEFAULT_CONCURRENCY, cache=None, refresh=False):
+    """Fetch all variants with at most `concurrency` requests in flight over one pooled session."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def fetch(variant):
+        started = time.perf_counter()
+        try:
+            data = fetch_heatmap_data(
+                url,
+                time_type=variant['time_type'],
+                include_logins=variant['include_logins'],
+                include_visitors=variant['include_visitors'],
+                range_param=variant['range'],
+                session=session,
+                verbose=False,
+                cache=cache,
+                refresh=refresh
+            )
+            error = None
+        except Exception as e:
+            data, error = None, str(e)
+        return {**variant, 'data': data, 'error': error, 'seconds': time.perf_counter() - started}
+
+    with create_session(concurrency) as session, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(fetch, variants))
+
+def print_batch_summary(results, wall_seconds):
+    """One line per variant plus the concurrency win."""
+    print("\n" + "="*60)
+    print("BATCH SUMMARY")
+    print("="*60)
+    print(f"\n{'Time':6} {'Source':9} {'Range':6} {'Events':>9} {'Peak':>24} {'Secs':>6}")
+    for result in results:
+        if result['error']:
+            status = f"FAILED: {result['error']}"
+        else:
+            data = result['data']
+            status = f"{data['totals']['overall']:>9,} {data['peak']['timestamp'] or '-':>24}"
+        print(f"{result['time_type']:6} {result['source']:9} {result['range']:6} {status} {result['seconds']:>6.2f}")
+
+    sequential = sum(result['seconds'] for result in results)
+    print(f"\n{len(results)} requests in {wall_seconds:.2f}s wall "
+          f"({sequential:.2f}s of request time, {sequential / max(wall_seconds, 1e-9):.1f}x overlap)")
+    print("="*60 + "\n")
+
+def load_snapshot_data(args):
+    """Fold new history events into the local snapshot and shape it like the API data."""
+    from pymongo import MongoClient
+    from heatmap_snapshot import DEFAULT_SNAPSHOT_PATH, snapshot_to_heatmap_data, update_snapshot
+
+    mongodb_uri = os.getenv('MONGODB_URI_PROD')
+    if not mongodb_uri:
+        raise Exception("MONGODB_URI_PROD environment variable not set")
+
+    if not args.snapshot_path:
+        args.snapshot_path = DEFAULT_SNAPSHOT_PATH
+
+    client = MongoClient(mongodb_uri)
+    try:
+        snapshot = update_snapshot(client[DATABASE_NAME], args)
+    finally:
+        client.close()
+
+    return snapshot_to_heatmap_data(
+        snapshot,
+        time_type=args.time_type,
+        include_visitors=not args.no_visitors,
+        include_logins=not args.no_logins
+    )
+
 def create_heatmap_matrix(heatmap_data):
     """Convert heatmap data to numpy matrix for visualization."""
+    import numpy as np
+
     matrix = np.zeros((7, 24))
 
     for day_idx, day in enumerate(DAYS_ORDER):
@@ -64,6 +259,9 @@ def create_heatmap_matrix(heatmap_data):
 
 def visualize_heatmap(data, save_path='heatmap.png', show=True):
     """Create and display/save heatmap visualization."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     heatmap = data['heatmap']
     totals = data['totals']
     peak = data['peak']
@@ -160,6 +358,116 @@ def visualize_heatmap(data, save_path='heatmap.png', show=True):
 
     plt.close()
 
+def visualize_heatmap_grid(results, save_path='heatmap_grid.png', show=True):
+    """Render batch results as a grid: one row per time type/source, one column per range."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    rows = list(dict.fromkeys((result['time_type'], result['source']) for result in results))
+    columns = list(dict.fromkeys(result['range'] for result in results))
+    cells = {(result['time_type'], result['source'], result['range']): result for result in results}
+
+    fig, axes = plt.subplots(
+        len(rows), len(columns),
+        figsize=(3.6 * len(columns), 2.4 * len(rows)),
+        squeeze=False
+    )
+
+    for row_idx, (time_type, source) in enumerate(rows):
+        for col_idx, range_param in enumerate(columns):
+            ax = axes[row_idx][col_idx]
+            result = cells.get((time_type, source, range_param))
+
+            if result is None or result['error']:
+                ax.text(0.5, 0.5, 'no data' if result is None else 'fetch failed',
+                        ha='center', va='center', transform=ax.transAxes, color='gray')
+                ax.set_xticks([])
+                ax.set_yticks([])
+            else:
+                data = result['data']
+                sns.heatmap(
+                    create_heatmap_matrix(data['heatmap']),
+                    ax=ax,
+                    cmap='YlOrRd',
+                    cbar=False,
+                    xticklabels=[f'{h}' if h % 6 == 0 else '' for h in range(24)],
+                    yticklabels=[day[:3] for day in DAYS_ORDER] if col_idx == 0 else False
+                )
+                ax.tick_params(labelsize=7)
+                ax.set_title(f'{range_param} · {data["totals"]["overall"]:,} events', fontsize=9)
+
+            if col_idx == 0:
+                ax.set_ylabel(f'{source}\n{time_type.upper()}', fontsize=10, fontweight='bold')
+
+    fig.suptitle(
+        f'Traffic Heatmap Comparison (color scaled per panel)\n'
+        f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}',
+        fontsize=12,
+        fontweight='bold'
+    )
+    plt.tight_layout()
+
+    plt.savefig(save_path, dpi=150, bbox_inches='tight')
+    print(f"Comparison grid saved to: {save_path}")
+
+    if show:
+        plt.show()
+
+    plt.close()
+
+def render_batch_images(results, args):
+    """Render one PNG per fetched variant into --batch-images (scripts/heatmap_render.py)."""
+    from heatmap_render import frame_from_heatmap_data, print_render_summary, render_frames
+
+    frames = [
+        frame_from_heatmap_data(
+            result['data'],
+            os.path.join(args.batch_images,
+                         f"heatmap_{result['time_type']}_{result['source']}_{result['range']}.png"),
+            label=f"{result['source']} · {result['range']}"
+        )
+        for result in results if not result['error']
+    ]
+    print(f"\nRendering {len(frames)} images to {args.batch_images}/ ({args.render_workers} worker(s))")
+    timings, wall_seconds = render_frames(frames, args.render_workers, args.render_dpi)
+    print_render_summary(timings, wall_seconds, min(args.render_workers, len(frames)))
+
+def run_batch(url, args, metrics):
+    """Fetch the variant matrix concurrently, summarize, and render the grid."""
+    variants = build_variants(
+        time_types=args.batch_time_types.split(','),
+        sources=args.batch_sources.split(','),
+        ranges=args.batch_ranges.split(',')
+    )
+    print(f"Fetching {len(variants)} variants from: {url} (concurrency {args.concurrency})")
+
+    cache = create_response_cache(args)
+    started = time.perf_counter()
+    with metrics.stage('fetch', records=len(variants)):
+        results = fetch_variants(url, variants, concurrency=args.concurrency, cache=cache, refresh=args.refresh)
+    print_batch_summary(results, time.perf_counter() - started)
+    if cache:
+        print(cache.describe())
+
+    failed = sum(1 for result in results if result['error'])
+    if failed == len(results):
+        print("All requests failed")
+        return 1
+
+    if not args.summary_only:
+        try:
+            with metrics.stage('render_grid', records=len(results) - failed):
+                visualize_heatmap_grid(results, save_path=args.grid_output, show=not args.no_show)
+            if args.batch_images:
+                with metrics.stage('render_images', records=len(results) - failed):
+                    render_batch_images(results, args)
+        except Exception as e:
+            print(f"\nFailed to create visualization: {e}")
+            return 1
+
+    print("Done!" if not failed else f"Done ({failed} failed)")
+    return 0
+
 def print_summary(data):
     """Print summary statistics."""
     totals = data['totals']
@@ -209,7 +517,50 @@ def print_summary(data):
 
     print("="*60 + "\n")
 
+def run_single(url, args, metrics):
+    """Fetch one heatmap (or the snapshot), summarize, and render it."""
+    # Fetch data
+    try:
+        with metrics.stage('snapshot' if args.snapshot else 'fetch') as stage:
+            if args.snapshot:
+                data = load_snapshot_data(args)
+            else:
+                data = fetch_heatmap_data(
+                    url,
+                    time_type=args.time_type,
+                    include_logins=not args.no_logins,
+                    include_visitors=not args.no_visitors,
+                    range_param=args.range,
+                    cache=create_response_cache(args),
+                    refresh=args.refresh
+                )
+            stage['records'] = data['totals']['overall']
+    except Exception as e:
+        print(f"\nFailed to fetch data: {e}")
+        return 1
+
+    # Print summary
+    print_summary(data)
+
+    if args.summary_only:
+        return 0
+
+    # Create visualization (with --no-show, so the window's lifetime is not counted)
+    try:
+        with metrics.stage('render'):
+            visualize_heatmap(data, save_path=args.output, show=not args.no_show)
+    except Exception as e:
+        print(f"\nFailed to create visualization: {e}")
+        return 1
+
+    print("Done!")
+    return 0
+
 def main():
+    sys.path.insert(0, SCRIPTS_DIR)
+    from response_cache import add_response_cache_arguments
+    from stage_metrics import StageMetrics, add_metrics_arguments
+
     parser = argparse.ArgumentParser(description='Visualize visitor/login traffic heatmap')
     parser.add_argument('--local', action='store_true', help='Use local dev server')
     parser.add_argument('--test', action='store_true', help='Use TEST environment')
@@ -220,8 +571,40 @@ def main():
     parser.add_argument('--no-visitors', action='store_true', help='Exclude anonymous visitors')
     parser.add_argument('--output', type=str, default='heatmap.png', help='Output file path')
     parser.add_argument('--no-show', action='store_true', help='Do not display heatmap')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='Print the summary and exit without rendering (skips matplotlib/seaborn)')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Read MongoDB directly and refresh the incremental all-time heatmap snapshot')
+    parser.add_argument('--snapshot-path', type=str, help='Snapshot file (default: scripts/heatmap_snapshot.json)')
+    parser.add_argument('--rebuild-snapshot', action='store_true', help='Recompute the snapshot from scratch')
+    parser.add_argument('--verify-snapshot', action='store_true', help='Compare the snapshot with a full recompute')
+    parser.add_argument('--range', type=str, help="Endpoint range, e.g. 24H, 7D, 1M, 3M, 1Yr, All (default: endpoint's 3M)")
+    parser.add_argument('--batch', action='store_true', help='Fetch a matrix of variants concurrently and render a grid')
+    parser.add_argument('--batch-time-types', type=str, default=','.join(BATCH_TIME_TYPES),
+                        help=f"Comma-separated time types for --batch (default: {','.join(BATCH_TIME_TYPES)})")
+    parser.add_argument('--batch-sources', type=str, default=','.join(BATCH_SOURCES),
+                        help=f"Comma-separated sources (all, visitors, logins) for --batch (default: {','.join(BATCH_SOURCES)})")
+    parser.add_argument('--batch-ranges', type=str, default=','.join(BATCH_RANGES),
+                        help=f"Comma-separated ranges for --batch (default: {','.join(BATCH_RANGES)})")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Max requests in flight for --batch (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--grid-output', type=str, default='heatmap_grid.png', help='Output file for --batch')
+    parser.add_argument('--batch-images', type=str,
+                        help='With --batch, also render one PNG per variant into this directory')
+    parser.add_argument('--render-workers', type=int, default=os.cpu_count() or 1,
+                        help='Render processes for --batch-images (default: the CPU count)')
+    parser.add_argument('--render-dpi', type=int, default=100,
+                        help='Resolution of the --batch-images PNGs (default: 100)')
+    add_response_cache_arguments(parser)
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    if args.batch and args.snapshot:
+        parser.error('--batch fetches from the endpoint; it cannot be combined with --snapshot')
+    if args.batch and not set(args.batch_sources.split(',')) <= set(SOURCE_FLAGS):
+        parser.error(f"--batch-sources must be from: {', '.join(SOURCE_FLAGS)}")
+    if args.batch and not set(args.batch_time_types.split(',')) <= {'local', 'zulu'}:
+        parser.error('--batch-time-types must be from: local, zulu')
 
     # Determine URL
     if args.url:
@@ -233,30 +616,13 @@ def main():
     else:
         url = URLS['prod']  # Default to production
 
-    # Fetch data
+    metrics = StageMetrics.from_args('visualize_heatmap', args)
     try:
-        data = fetch_heatmap_data(
-            url,
-            time_type=args.time_type,
-            include_logins=not args.no_logins,
-            include_visitors=not args.no_visitors
-        )
-    except Exception as e:
-        print(f"\nFailed to fetch data: {e}")
-        return 1
-
-    # Print summary
-    print_summary(data)
-
-    # Create visualization
-    try:
-        visualize_heatmap(data, save_path=args.output, show=not args.no_show)
-    except Exception as e:
-        print(f"\nFailed to create visualization: {e}")
-        return 1
-
-    print("Done!")
-    return 0
+        if args.batch:
+            return run_batch(url, args, metrics)
+        return run_single(url, args, metrics)
+    finally:
+        metrics.finish()
 
 if __name__ == '__main__':
     exit(main())